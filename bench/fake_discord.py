@@ -0,0 +1,884 @@
+import asyncio
+import datetime
+import itertools
+import json
+import random
+import re
+import time
+import uuid
+from collections import Counter, defaultdict
+
+from aiohttp import web, WSMsgType
+
+# Local stand-in for the subset of the Discord API the bots use, for offline load tests
+# (bench/loadgen.py). The bots are pointed at it with DISCORD_API_BASE (see main.py).
+#  - REST: login, command sync, DM channels, messages (send/edit/fetch/history), channels
+#    (create/edit/delete), members, roles, interaction callbacks and webhook follow-ups.
+#  - Gateway: HELLO/IDENTIFY/READY, GUILD_CREATE, member chunking, heartbeats, the events the
+#    REST calls cause (CHANNEL_CREATE, MESSAGE_CREATE...) and the INTERACTION_CREATEs the load
+#    generator injects.
+#  - Rate limits: fixed-window buckets per route + major parameter like Discord's, a global
+#    per-token limit, 429s with retry_after and the X-RateLimit-* headers discord.py reads.
+# Every REST call is counted per route template for the load-test report.
+
+API_PREFIX = "/api/v10"
+DISCORD_EPOCH = 1420070400000
+HEARTBEAT_INTERVAL_MS = 41250
+CHUNK_SIZE = 1000
+LARGE_THRESHOLD = 250
+ATTACHMENT_LIMIT = 10 * 1024 * 1024
+MIN_RENDER_DELAY = 0.05   # Seconds before a simulated user can react to an answer
+
+ADMINISTRATOR = 1 << 3
+# View channel, send messages, embed links, attach files, read history, use application commands
+MEMBER_PERMISSIONS = (1 << 10) | (1 << 11) | (1 << 14) | (1 << 15) | (1 << 16) | (1 << 31)
+
+# (limit, seconds) per bucket, keyed by (method, route template). Roughly what Discord reports
+# for bots; channel renames are the notoriously strict one (2 per 10 minutes per channel).
+ROUTE_LIMITS = {
+    ('POST', '/channels/{channel_id}/messages'): (5, 5),
+    ('PATCH', '/channels/{channel_id}/messages/{message_id}'): (5, 5),
+    ('DELETE', '/channels/{channel_id}/messages/{message_id}'): (5, 1),
+    ('GET', '/channels/{channel_id}/messages'): (5, 1),
+    ('GET', '/channels/{channel_id}/messages/{message_id}'): (5, 1),
+    ('PATCH', '/channels/{channel_id}'): (2, 600),
+    ('DELETE', '/channels/{channel_id}'): (5, 5),
+    ('POST', '/guilds/{guild_id}/channels'): (5, 5),
+    ('POST', '/users/@me/channels'): (5, 1),        # Undocumented; observed to be well below the global limit
+    ('GET', '/guilds/{guild_id}/members'): (10, 10),
+    ('POST', '/webhooks/{webhook_id}/{webhook_token}'): (5, 2),
+    ('PATCH', '/webhooks/{webhook_id}/{webhook_token}/messages/{message_id}'): (5, 2),
+}
+DEFAULT_LIMIT = (50, 1)
+GLOBAL_LIMIT = (50, 1)
+MAJOR_PARAMETERS = ('channel_id', 'guild_id', 'webhook_id', 'webhook_token')
+# Interaction endpoints don't count against the bot's global limit
+GLOBAL_EXEMPT_PREFIXES = ('/interactions/', '/webhooks/')
+
+# Interaction types
+APPLICATION_COMMAND, MESSAGE_COMPONENT, MODAL_SUBMIT = 2, 3, 5
+# Interaction callback types
+PONG, CHANNEL_MESSAGE, DEFERRED_CHANNEL_MESSAGE, DEFERRED_UPDATE, UPDATE_MESSAGE, AUTOCOMPLETE, MODAL = 1, 4, 5, 6, 7, 8, 9
+EPHEMERAL = 1 << 6
+
+def json_response(data, status=200, headers=None):
+    # discord.py only decodes bodies whose Content-Type is exactly application/json (no charset)
+    return web.Response(body=json.dumps(data).encode("utf-8"), status=status,
+                        headers={**(headers or {}), 'Content-Type': "application/json"})
+
+def iso_now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+def find_component(components, type=None, custom_id=None):
+    """First component (searched recursively through rows/labels) matching type and/or custom_id."""
+    for component in components or []:
+        if (type is None or component.get('type') == type) and (custom_id is None or component.get('custom_id') == custom_id) \
+                and ('custom_id' in component):
+            return component
+        children = component.get('components') or ([component['component']] if component.get('component') else [])
+        found = find_component(children, type, custom_id)
+        if found:
+            return found
+    return None
+
+def modal_submit_data(modal, value_for):
+    """MODAL_SUBMIT data for a modal the bot sent, filling every text input with value_for(custom_id)."""
+    def fill(component):
+        if component.get('type') == 4:
+            return {'type': 4, 'custom_id': component['custom_id'], 'value': value_for(component['custom_id'])}
+        if component.get('component'):
+            return {'type': component['type'], 'component': fill(component['component'])}
+        return {'type': component.get('type', 1), 'components': [fill(c) for c in component.get('components', [])]}
+    return {'custom_id': modal['custom_id'], 'components': [fill(c) for c in modal.get('components', [])]}
+
+class Bucket:
+    __slots__ = ('limit', 'per', 'remaining', 'reset_at')
+
+    def __init__(self, limit, per):
+        self.limit = limit
+        self.per = per
+        self.remaining = limit
+        self.reset_at = 0.0
+
+    def take(self, now):
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.per
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+    def headers(self, now, bucket_hash):
+        reset_after = max(0.0, self.reset_at - now)
+        return {
+            'X-RateLimit-Limit': str(self.limit),
+            'X-RateLimit-Remaining': str(self.remaining),
+            'X-RateLimit-Reset': f"{time.time() + reset_after:.3f}",
+            'X-RateLimit-Reset-After': f"{reset_after:.3f}",
+            'X-RateLimit-Bucket': bucket_hash,
+        }
+
+class InteractionRecord:
+    """One injected interaction and everything the bot answered to it."""
+    def __init__(self, interaction_id, interaction_type, token, guild_id, channel_id, user_id):
+        self.id = interaction_id
+        self.type = interaction_type
+        self.token = token
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.user_id = user_id
+        self.sent_at = time.perf_counter()
+        self.acked_at = None      # Callback received
+        self.done_at = None       # First visible answer (message, modal, or follow-up after a defer)
+        self.last_at = None       # Latest answer
+        self.callback = None      # {'type': ..., 'data': ...}
+        self.original = None      # Original response message
+        self.messages = []        # Follow-ups and original edits, in order
+        self._changed = asyncio.Event()
+
+    def _touch(self, visible, render_delay):
+        self.last_at = time.perf_counter()
+        if visible and self.done_at is None:
+            self.done_at = self.last_at
+        # The user sees the answer a moment later; waking waiters right away would let a simulated
+        # user click a component before the bot has even received the callback response
+        asyncio.get_running_loop().call_later(render_delay, self._changed.set)
+
+    def texts(self):
+        out = []
+        for msg in ([self.callback.get('data') or {}] if self.callback else []) + self.messages:
+            out.append(msg.get('content') or "")
+            out.extend(e.get('description') or "" for e in msg.get('embeds') or [])
+        return out
+
+    def contains(self, text):
+        return any(text in t for t in self.texts())
+
+    async def wait(self, predicate=None, timeout=30.0):
+        """Waits until predicate(self) holds (default: a visible answer). Raises TimeoutError."""
+        predicate = predicate or (lambda r: r.done_at is not None)
+        deadline = time.perf_counter() + timeout
+        while not predicate(self):
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        return self
+
+class GatewaySession:
+    def __init__(self, ws):
+        self.ws = ws
+        self.bot = None
+        self.intents = 0
+        self.seq = 0
+        self.session_id = uuid.uuid4().hex
+        self.queue = asyncio.Queue()
+        self.writer = asyncio.create_task(self._write())
+
+    async def _write(self):
+        while True:
+            payload = await self.queue.get()
+            if payload.get('op') == 0:
+                self.seq += 1
+                payload['s'] = self.seq
+            try:
+                await self.ws.send_str(json.dumps(payload))
+            except (ConnectionError, RuntimeError):
+                return
+
+    def send(self, payload):
+        self.queue.put_nowait(payload)
+
+    def dispatch(self, event, data):
+        self.send({'op': 0, 't': event, 'd': data})
+
+    def close(self):
+        self.writer.cancel()
+
+class FakeDiscord:
+    def __init__(self, latency=0.04, jitter=0.01, rate_limits=True, dm_closed_ratio=0.0, seed=42):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limits = rate_limits
+        self.dm_closed_ratio = dm_closed_ratio
+        self.render_delay = max(latency, MIN_RENDER_DELAY)
+        self.rng = random.Random(seed)
+        self._seq = itertools.count()
+        self.base_url = None
+        self.gateway_url = None # Another host name, as Discord's gateway is not on the REST host
+
+        self.bots = {}          # token -> {'user', 'guild_ids', 'session', 'commands'}
+        self.users = {}         # user_id -> user payload
+        self.guilds = {}        # guild_id -> {'id', 'name', 'token', 'roles', 'members'}
+        self.channels = {}      # channel_id -> channel payload
+        self.messages = {}      # channel_id -> [message payload] (oldest first)
+        self.dm_channels = {}   # (bot_id, user_id) -> channel_id
+        self.dm_closed = set()
+        self.interactions = {}  # token -> InteractionRecord
+        self.deleted_channels = {}  # channel_id -> asyncio.Event (waited on by the load generator)
+
+        self.buckets = {}
+        self.global_buckets = {}
+        self.route_stats = defaultdict(Counter)   # "METHOD template" -> {status: count}
+        self.ratelimited = Counter()              # scope -> 429s
+        self.dm_messages = 0
+        self.unknown_routes = Counter()
+        self._routes = []
+        self._register_routes()
+        self._runner = None
+
+    # --- World ---
+
+    def snowflake(self):
+        ms = int(time.time() * 1000) - DISCORD_EPOCH
+        return (ms << 22) | (next(self._seq) & 0x3FFFFF)
+
+    def add_user(self, user_id, name, bot=False):
+        user = {'id': str(user_id), 'username': name, 'global_name': None if bot else name.title(), 'discriminator': "0",
+                'avatar': None, 'bot': bot, 'public_flags': 0}
+        self.users[user_id] = user
+        if not bot and self.rng.random() < self.dm_closed_ratio:
+            self.dm_closed.add(user_id)
+        return user
+
+    def add_bot(self, token, name):
+        bot_id = self.snowflake()
+        user = self.add_user(bot_id, name, bot=True)
+        self.bots[token] = {'user': user, 'guild_ids': [], 'session': None, 'commands': {}}
+        return user
+
+    def add_guild(self, guild_id, name, token, member_ids, channels=(), roles=(), admin_ids=(), extra_tokens=()):
+        """A guild with a text channel per name, roles, and member_ids as members (users created on the fly)."""
+        guild = {'id': guild_id, 'name': name, 'token': token, 'roles': [], 'members': {}, 'owner_id': None}
+        self.guilds[guild_id] = guild
+        guild['roles'].append(self._role(guild_id, "@everyone", MEMBER_PERMISSIONS))
+        for role_name in roles:
+            guild['roles'].append(self._role(self.snowflake(), role_name, MEMBER_PERMISSIONS))
+        for channel_name in channels:
+            self._create_channel(guild_id, {'name': channel_name, 'type': 0})
+
+        for user_id in member_ids:
+            if user_id not in self.users:
+                self.add_user(user_id, f"user{user_id % 1_000_000}")
+            guild['members'][user_id] = self._member(user_id, ADMINISTRATOR if user_id in admin_ids else 0)
+        guild['owner_id'] = next(iter(admin_ids), None) or next(iter(guild['members']), None)
+
+        for bot_token in (token, *extra_tokens):
+            bot = self.bots[bot_token]
+            bot['guild_ids'].append(guild_id)
+            bot_id = int(bot['user']['id'])
+            guild['members'][bot_id] = self._member(bot_id, ADMINISTRATOR)
+        return guild
+
+    def channel_id(self, guild_id, name):
+        return next(int(c['id']) for c in self.channels.values() if c.get('guild_id') == str(guild_id) and c['name'] == name)
+
+    def _role(self, role_id, name, permissions):
+        return {'id': str(role_id), 'name': name, 'permissions': str(permissions), 'position': 0, 'color': 0,
+                'hoist': False, 'managed': False, 'mentionable': False, 'flags': 0}
+
+    def _member(self, user_id, permissions=0):
+        return {'user': self.users[user_id], 'roles': [], 'joined_at': iso_now(), 'deaf': False, 'mute': False,
+                'flags': 0, 'pending': False, 'nick': None, 'avatar': None, 'premium_since': None,
+                'communication_disabled_until': None, '_permissions': permissions}
+
+    @staticmethod
+    def _member_payload(member):
+        return {k: v for k, v in member.items() if not k.startswith('_')}
+
+    def _guild_payload(self, guild, bot_id):
+        channels = [c for c in self.channels.values() if c.get('guild_id') == str(guild['id'])]
+        # Like Discord without the presence intent: only the bot's own member comes with GUILD_CREATE
+        me = guild['members'][bot_id]
+        return {
+            'id': str(guild['id']), 'name': guild['name'], 'icon': None, 'splash': None, 'discovery_splash': None,
+            'owner_id': str(guild['owner_id'] or bot_id), 'afk_channel_id': None, 'afk_timeout': 300,
+            'verification_level': 0, 'default_message_notifications': 0, 'explicit_content_filter': 0,
+            'roles': guild['roles'], 'emojis': [], 'stickers': [], 'features': [], 'mfa_level': 0,
+            'application_id': None, 'system_channel_id': None, 'system_channel_flags': 0, 'rules_channel_id': None,
+            'vanity_url_code': None, 'description': None, 'banner': None, 'premium_tier': 0,
+            'preferred_locale': "es-ES", 'public_updates_channel_id': None, 'nsfw_level': 0,
+            'premium_progress_bar_enabled': False, 'joined_at': me['joined_at'], 'large': len(guild['members']) > LARGE_THRESHOLD,
+            'unavailable': False, 'member_count': len(guild['members']), 'voice_states': [], 'presences': [],
+            'members': [self._member_payload(me)], 'channels': [{k: v for k, v in c.items() if k != 'guild_id'} for c in channels],
+            'threads': [], 'stage_instances': [], 'guild_scheduled_events': [], 'soundboard_sounds': [],
+        }
+
+    def _create_channel(self, guild_id, body):
+        channel_id = self.snowflake()
+        channel = {
+            'id': str(channel_id), 'type': body.get('type', 0), 'guild_id': str(guild_id), 'name': body.get('name', "canal"),
+            'position': body.get('position') or len(self.channels), 'parent_id': body.get('parent_id'),
+            'permission_overwrites': body.get('permission_overwrites') or [], 'topic': body.get('topic'),
+            'nsfw': bool(body.get('nsfw')), 'rate_limit_per_user': body.get('rate_limit_per_user', 0),
+            'last_message_id': None, 'flags': 0,
+        }
+        self.channels[channel_id] = channel
+        self.messages[channel_id] = []
+        return channel
+
+    def _message(self, channel_id, author, body, *, flags=0, extra=None):
+        attachments = body.get('_attachments', [])
+        message = {
+            'id': str(self.snowflake()), 'channel_id': str(channel_id), 'author': author,
+            'content': body.get('content') or "", 'timestamp': iso_now(), 'edited_timestamp': None,
+            'tts': bool(body.get('tts')), 'mention_everyone': False, 'mentions': [], 'mention_roles': [],
+            'attachments': attachments, 'embeds': body.get('embeds') or [], 'pinned': False, 'type': 0,
+            'components': body.get('components') or [], 'flags': flags | (body.get('flags') or 0),
+        }
+        if extra:
+            message.update(extra)
+        return message
+
+    def _post_message(self, channel_id, author, body, extra=None):
+        channel = self.channels[channel_id]
+        message = self._message(channel_id, author, body, extra=extra)
+        self.messages[channel_id].append(message)
+        channel['last_message_id'] = message['id']
+        if channel.get('guild_id'):
+            self._dispatch_guild(int(channel['guild_id']), 'MESSAGE_CREATE', {**message, 'guild_id': channel['guild_id']})
+        return message
+
+    # --- Gateway ---
+
+    def _dispatch_guild(self, guild_id, event, data):
+        """Sends a gateway event to every bot session in the guild."""
+        for bot in self.bots.values():
+            if guild_id in bot['guild_ids'] and bot['session'] is not None:
+                bot['session'].dispatch(event, data)
+
+    def ready_bots(self):
+        return [token for token, bot in self.bots.items() if bot['session'] is not None]
+
+    async def _gateway(self, request):
+        ws = web.WebSocketResponse(max_msg_size=0, heartbeat=None)
+        await ws.prepare(request)
+        session = GatewaySession(ws)
+        session.send({'op': 10, 'd': {'heartbeat_interval': HEARTBEAT_INTERVAL_MS}})
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                payload = json.loads(msg.data)
+                op, data = payload.get('op'), payload.get('d')
+                if op == 1:
+                    session.send({'op': 11})
+                elif op == 2:
+                    if not await self._identify(session, data):
+                        break
+                elif op == 6:
+                    session.send({'op': 9, 'd': False}) # Sessions aren't resumable here
+                elif op == 8:
+                    self._request_members(session, data)
+        finally:
+            session.close()
+            if session.bot is not None and session.bot['session'] is session:
+                session.bot['session'] = None
+        return ws
+
+    async def _identify(self, session, data):
+        bot = self.bots.get((data or {}).get('token', "").removeprefix("Bot "))
+        if bot is None:
+            await session.ws.close(code=4004, message=b"Authentication failed.")
+            return False
+        if bot['session'] is not None:
+            bot['session'].close()
+        bot['session'] = session
+        session.bot = bot
+        session.intents = data.get('intents', 0)
+        bot_id = int(bot['user']['id'])
+        session.dispatch('READY', {
+            'v': 10, 'user': {**bot['user'], 'verified': True, 'mfa_enabled': False, 'flags': 0},
+            'guilds': [{'id': str(gid), 'unavailable': True} for gid in bot['guild_ids']],
+            'session_id': session.session_id, 'resume_gateway_url': self.gateway_url,
+            'application': {'id': bot['user']['id'], 'flags': 0}, 'private_channels': [], 'relationships': [],
+        })
+        for gid in bot['guild_ids']:
+            session.dispatch('GUILD_CREATE', self._guild_payload(self.guilds[gid], bot_id))
+        return True
+
+    def _request_members(self, session, data):
+        guild = self.guilds.get(int(data['guild_id']))
+        if guild is None:
+            return
+        members = list(guild['members'].values())
+        not_found = []
+        if data.get('user_ids'):
+            wanted = {int(u) for u in (data['user_ids'] if isinstance(data['user_ids'], list) else [data['user_ids']])}
+            members = [m for m in members if int(m['user']['id']) in wanted]
+            not_found = [str(u) for u in wanted - {int(m['user']['id']) for m in members}]
+        elif data.get('query'):
+            members = [m for m in members if m['user']['username'].lower().startswith(data['query'].lower())]
+        if data.get('limit'):
+            members = members[:data['limit']]
+        chunks = [members[i:i + CHUNK_SIZE] for i in range(0, len(members), CHUNK_SIZE)] or [[]]
+        for index, chunk in enumerate(chunks):
+            payload = {'guild_id': str(guild['id']), 'members': [self._member_payload(m) for m in chunk],
+                       'chunk_index': index, 'chunk_count': len(chunks), 'nonce': data.get('nonce')}
+            if not_found and index == 0:
+                payload['not_found'] = not_found
+            session.dispatch('GUILD_MEMBERS_CHUNK', payload)
+
+    # --- Interactions (driven by the load generator) ---
+
+    def interact(self, guild_id, user_id, interaction_type, data, channel_id, message=None):
+        """Injects INTERACTION_CREATE into the guild's main bot and returns its record."""
+        guild = self.guilds[guild_id]
+        bot = self.bots[guild['token']]
+        if bot['session'] is None:
+            raise RuntimeError(f"el bot de {guild_id} no está conectado")
+        interaction_id = self.snowflake()
+        token = f"aW50ZXJhY3Rpb246{uuid.uuid4().hex}"
+        member = guild['members'][user_id]
+        permissions = (1 << 53) - 1 if member['_permissions'] & ADMINISTRATOR else MEMBER_PERMISSIONS
+        payload = {
+            'id': str(interaction_id), 'application_id': bot['user']['id'], 'type': interaction_type, 'data': data,
+            'guild_id': str(guild_id), 'channel_id': str(channel_id), 'channel': {k: v for k, v in self.channels[channel_id].items()},
+            'member': {**self._member_payload(member), 'permissions': str(permissions)}, 'token': token, 'version': 1,
+            'app_permissions': str((1 << 53) - 1), 'locale': "es-ES", 'guild_locale': "es-ES", 'entitlements': [],
+            'authorizing_integration_owners': {'0': str(guild_id)}, 'context': 0, 'attachment_size_limit': ATTACHMENT_LIMIT,
+        }
+        if message is not None:
+            payload['message'] = message
+        record = InteractionRecord(interaction_id, interaction_type, token, guild_id, channel_id, user_id)
+        self.interactions[token] = record
+        bot['session'].dispatch('INTERACTION_CREATE', payload)
+        return record
+
+    def user_payload(self, user_id):
+        return self.users[user_id]
+
+    def resolved_member(self, guild_id, user_id):
+        member = self._member_payload(self.guilds[guild_id]['members'][user_id])
+        member.pop('user')
+        return member
+
+    def ephemeral_reply(self, record):
+        """The ephemeral message an interaction answered with, as a component interaction would carry it."""
+        message = dict(record.original or self._message(record.channel_id, self.bots[self.guilds[record.guild_id]['token']]['user'], {}))
+        message['interaction_metadata'] = {'id': str(record.id), 'type': record.type, 'user': self.users[record.user_id],
+                                           'authorizing_integration_owners': {'0': str(record.guild_id)}}
+        return message
+
+    def seed_message(self, guild_id, channel_name, body):
+        """A message from the guild's bot that exists before the run (mailbox/ticket panels)."""
+        bot_user = self.bots[self.guilds[guild_id]['token']]['user']
+        return self._post_message(self.channel_id(guild_id, channel_name), bot_user, body)
+
+    def channel_messages(self, channel_id):
+        return self.messages.get(channel_id, [])
+
+    async def wait_channel_deleted(self, channel_id, timeout):
+        event = self.deleted_channels.setdefault(channel_id, asyncio.Event())
+        await asyncio.wait_for(event.wait(), timeout)
+
+    # --- REST plumbing ---
+
+    def _register_routes(self):
+        add = lambda method, template, handler: self._routes.append(
+            (method, template, re.compile("^" + re.sub(r"\{(\w+)\}", r"(?P<\1>[^/]+)", template) + "$"), handler))
+        add('GET', '/gateway', self.get_gateway)
+        add('GET', '/gateway/bot', self.get_gateway)
+        add('GET', '/users/@me', self.get_me)
+        add('GET', '/oauth2/applications/@me', self.get_application)
+        add('GET', '/applications/{application_id}/commands', self.get_commands)
+        add('PUT', '/applications/{application_id}/commands', self.put_commands)
+        add('GET', '/applications/{application_id}/guilds/{guild_id}/commands', self.get_commands)
+        add('PUT', '/applications/{application_id}/guilds/{guild_id}/commands', self.put_commands)
+        add('POST', '/users/@me/channels', self.create_dm)
+        add('GET', '/users/{user_id}', self.get_user)
+        add('GET', '/channels/{channel_id}', self.get_channel)
+        add('PATCH', '/channels/{channel_id}', self.edit_channel)
+        add('DELETE', '/channels/{channel_id}', self.delete_channel)
+        add('PUT', '/channels/{channel_id}/permissions/{overwrite_id}', self.no_content)
+        add('POST', '/channels/{channel_id}/typing', self.no_content)
+        add('GET', '/channels/{channel_id}/messages', self.history)
+        add('POST', '/channels/{channel_id}/messages', self.send_message)
+        add('GET', '/channels/{channel_id}/messages/{message_id}', self.get_message)
+        add('PATCH', '/channels/{channel_id}/messages/{message_id}', self.edit_message)
+        add('DELETE', '/channels/{channel_id}/messages/{message_id}', self.delete_message)
+        add('PUT', '/channels/{channel_id}/messages/{message_id}/reactions/{emoji}/@me', self.no_content)
+        add('GET', '/guilds/{guild_id}/channels', self.guild_channels)
+        add('POST', '/guilds/{guild_id}/channels', self.create_channel)
+        add('GET', '/guilds/{guild_id}/members', self.list_members)
+        add('GET', '/guilds/{guild_id}/members/{user_id}', self.get_member)
+        add('PUT', '/guilds/{guild_id}/members/{user_id}/roles/{role_id}', self.add_role)
+        add('DELETE', '/guilds/{guild_id}/members/{user_id}/roles/{role_id}', self.remove_role)
+        add('GET', '/guilds/{guild_id}/roles', self.list_roles)
+        add('POST', '/guilds/{guild_id}/roles', self.create_role)
+        add('POST', '/interactions/{interaction_id}/{interaction_token}/callback', self.interaction_callback)
+        add('POST', '/webhooks/{webhook_id}/{webhook_token}', self.webhook_send)
+        add('GET', '/webhooks/{webhook_id}/{webhook_token}/messages/{message_id}', self.webhook_get)
+        add('PATCH', '/webhooks/{webhook_id}/{webhook_token}/messages/{message_id}', self.webhook_edit)
+        add('DELETE', '/webhooks/{webhook_id}/{webhook_token}/messages/{message_id}', self.webhook_delete)
+
+    def _match(self, method, path):
+        for route_method, template, pattern, handler in self._routes:
+            if route_method == method:
+                m = pattern.match(path)
+                if m:
+                    return template, m.groupdict(), handler
+        return None, None, None
+
+    def _check_limits(self, token, method, template, params):
+        """Returns (headers, None) when allowed or (headers, 429 response)."""
+        now = time.monotonic()
+        if not template.startswith(GLOBAL_EXEMPT_PREFIXES):
+            bucket = self.global_buckets.setdefault(token, Bucket(*GLOBAL_LIMIT))
+            if not bucket.take(now):
+                self.ratelimited['global'] += 1
+                return {}, self._too_many(bucket.reset_at - now, 'global', is_global=True)
+
+        limit = ROUTE_LIMITS.get((method, template), DEFAULT_LIMIT)
+        bucket_hash = uuid.uuid5(uuid.NAMESPACE_URL, f"{method} {template}").hex[:16]
+        major = tuple(params.get(p) for p in MAJOR_PARAMETERS)
+        key = (token, bucket_hash, major)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = Bucket(*limit)
+        if not bucket.take(now):
+            self.ratelimited['user'] += 1
+            return {}, self._too_many(bucket.reset_at - now, 'user', headers=bucket.headers(now, bucket_hash))
+        return bucket.headers(now, bucket_hash), None
+
+    @staticmethod
+    def _too_many(retry_after, scope, is_global=False, headers=None):
+        retry_after = round(max(retry_after, 0.001), 3)
+        return json_response(
+            {'message': "You are being rate limited.", 'retry_after': retry_after, 'global': is_global, 'code': 0},
+            status=429,
+            headers={**(headers or {}), 'Retry-After': str(max(1, int(retry_after + 0.999))), 'X-RateLimit-Global': str(is_global).lower(),
+                     'X-RateLimit-Scope': scope, 'Via': "1.1 google"},
+        )
+
+    @staticmethod
+    def _error(status, code, message):
+        return json_response({'message': message, 'code': code}, status=status)
+
+    async def _read_body(self, request):
+        """JSON body, or payload_json + files of a multipart request (files become attachments)."""
+        if request.content_type.startswith("multipart/"):
+            body, attachments = {}, []
+            reader = await request.multipart()
+            async for part in reader:
+                if part.name == 'payload_json':
+                    body = json.loads(await part.text())
+                else:
+                    data = await part.read()
+                    attachment_id = self.snowflake()
+                    url = f"{self.base_url}/attachments/{attachment_id}/{part.filename}"
+                    attachments.append({'id': str(attachment_id), 'filename': part.filename or "file", 'size': len(data),
+                                        'url': url, 'proxy_url': url})
+            body['_attachments'] = attachments
+            return body
+        if request.can_read_body:
+            return await request.json()
+        return {}
+
+    async def _sleep_latency(self):
+        if self.latency:
+            await asyncio.sleep(max(0.0, self.rng.gauss(self.latency, self.jitter)) / 2)
+
+    async def _api(self, request):
+        path = "/" + request.match_info['tail']
+        template, params, handler = self._match(request.method, path)
+        if handler is None:
+            self.unknown_routes[f"{request.method} {path}"] += 1
+            return self._error(404, 0, "404: Not Found")
+
+        stats = self.route_stats[f"{request.method} {template}"]
+        token = request.headers.get('Authorization', "").removeprefix("Bot ")
+        if token and token not in self.bots:
+            stats[401] += 1
+            return self._error(401, 0, "401: Unauthorized")
+
+        await self._sleep_latency()
+        headers = {}
+        if self.rate_limits:
+            headers, limited = self._check_limits(token or params.get('webhook_token') or params.get('interaction_token'), request.method, template, params)
+            if limited is not None:
+                stats[429] += 1
+                return limited
+
+        request['bot'] = self.bots.get(token)
+        try:
+            response = await handler(request, **params)
+        except KeyError:
+            response = self._error(404, 10003, "Unknown Channel")
+        await self._sleep_latency()
+        response.headers.update(headers)
+        stats[response.status] += 1
+        return response
+
+    # --- REST handlers ---
+
+    async def no_content(self, request, **params):
+        return web.Response(status=204)
+
+    async def get_gateway(self, request):
+        return json_response({'url': self.gateway_url, 'shards': 1,
+                                  'session_start_limit': {'total': 1000, 'remaining': 1000, 'reset_after': 0, 'max_concurrency': 1}})
+
+    async def get_me(self, request):
+        return json_response({**request['bot']['user'], 'verified': True, 'mfa_enabled': False, 'flags': 0})
+
+    async def get_application(self, request):
+        user = request['bot']['user']
+        return json_response({
+            'id': user['id'], 'name': user['username'], 'icon': None, 'description': "", 'bot_public': False,
+            'bot_require_code_grant': False, 'owner': user, 'verify_key': "0" * 64, 'summary': "", 'flags': 0,
+            'team': None, 'rpc_origins': [], 'bot': user,
+        })
+
+    async def get_commands(self, request, application_id, guild_id=None):
+        return json_response(request['bot']['commands'].get(guild_id, []))
+
+    async def put_commands(self, request, application_id, guild_id=None):
+        commands = []
+        for command in await self._read_body(request):
+            command = {**command, 'id': str(self.snowflake()), 'application_id': application_id, 'version': str(self.snowflake()),
+                       'default_member_permissions': command.get('default_member_permissions'), 'nsfw': False}
+            command.setdefault('type', 1)
+            command.setdefault('description', "")
+            if guild_id:
+                command['guild_id'] = guild_id
+            commands.append(command)
+        request['bot']['commands'][guild_id] = commands
+        return json_response(commands)
+
+    async def create_dm(self, request):
+        body = await self._read_body(request)
+        user_id = int(body['recipient_id'])
+        if user_id not in self.users:
+            return self._error(400, 50033, "Invalid Recipients")
+        key = (request['bot']['user']['id'], user_id)
+        channel_id = self.dm_channels.get(key)
+        if channel_id is None:
+            channel_id = self.snowflake()
+            self.channels[channel_id] = {'id': str(channel_id), 'type': 1, 'recipients': [self.users[user_id]], 'last_message_id': None, 'flags': 0}
+            self.messages[channel_id] = []
+            self.dm_channels[key] = channel_id
+        return json_response(self.channels[channel_id])
+
+    async def get_user(self, request, user_id):
+        user = self.users.get(int(user_id))
+        return json_response(user) if user else self._error(404, 10013, "Unknown User")
+
+    async def get_channel(self, request, channel_id):
+        return json_response(self.channels[int(channel_id)])
+
+    async def edit_channel(self, request, channel_id):
+        channel = self.channels[int(channel_id)]
+        body = await self._read_body(request)
+        for key in ('name', 'topic', 'position', 'parent_id', 'permission_overwrites', 'nsfw', 'rate_limit_per_user'):
+            if key in body:
+                channel[key] = body[key]
+        self._dispatch_guild(int(channel['guild_id']), 'CHANNEL_UPDATE', channel)
+        return json_response(channel)
+
+    async def delete_channel(self, request, channel_id):
+        channel = self.channels.pop(int(channel_id))
+        self.messages.pop(int(channel_id), None)
+        if channel.get('guild_id'):
+            self._dispatch_guild(int(channel['guild_id']), 'CHANNEL_DELETE', channel)
+        self.deleted_channels.setdefault(int(channel_id), asyncio.Event()).set()
+        return json_response(channel)
+
+    async def history(self, request, channel_id):
+        messages = self.messages[int(channel_id)]
+        limit = min(100, int(request.query.get('limit', 50)))
+        if 'after' in request.query:
+            after = int(request.query['after'])
+            selected = [m for m in messages if int(m['id']) > after][:limit]
+            return json_response(list(reversed(selected)))
+        before = int(request.query.get('before', 1 << 63))
+        selected = [m for m in messages if int(m['id']) < before][-limit:]
+        return json_response(list(reversed(selected)))
+
+    async def send_message(self, request, channel_id):
+        channel_id = int(channel_id)
+        channel = self.channels[channel_id]
+        body = await self._read_body(request)
+        if channel['type'] == 1:
+            if int(channel['recipients'][0]['id']) in self.dm_closed:
+                return self._error(403, 50007, "Cannot send messages to this user")
+            self.dm_messages += 1
+        return json_response(self._post_message(channel_id, request['bot']['user'], body))
+
+    def _find_message(self, channel_id, message_id):
+        return next(m for m in self.messages.get(int(channel_id), []) if m['id'] == str(message_id))
+
+    async def get_message(self, request, channel_id, message_id):
+        try:
+            return json_response(self._find_message(channel_id, message_id))
+        except StopIteration:
+            return self._error(404, 10008, "Unknown Message")
+
+    async def edit_message(self, request, channel_id, message_id):
+        try:
+            message = self._find_message(channel_id, message_id)
+        except StopIteration:
+            return self._error(404, 10008, "Unknown Message")
+        body = await self._read_body(request)
+        for key in ('content', 'embeds', 'components', 'flags'):
+            if key in body:
+                message[key] = body[key]
+        message['edited_timestamp'] = iso_now()
+        return json_response(message)
+
+    async def delete_message(self, request, channel_id, message_id):
+        messages = self.messages.get(int(channel_id), [])
+        self.messages[int(channel_id)] = [m for m in messages if m['id'] != str(message_id)]
+        return web.Response(status=204)
+
+    async def guild_channels(self, request, guild_id):
+        return json_response([c for c in self.channels.values() if c.get('guild_id') == guild_id])
+
+    async def create_channel(self, request, guild_id):
+        channel = self._create_channel(int(guild_id), await self._read_body(request))
+        self._dispatch_guild(int(guild_id), 'CHANNEL_CREATE', channel)
+        return json_response(channel, status=201)
+
+    async def list_members(self, request, guild_id):
+        members = self.guilds[int(guild_id)]['members']
+        after = int(request.query.get('after', 0))
+        limit = min(1000, int(request.query.get('limit', 1)))
+        ids = sorted(uid for uid in members if uid > after)[:limit]
+        return json_response([self._member_payload(members[uid]) for uid in ids])
+
+    async def get_member(self, request, guild_id, user_id):
+        member = self.guilds[int(guild_id)]['members'].get(int(user_id))
+        return json_response(self._member_payload(member)) if member else self._error(404, 10007, "Unknown Member")
+
+    async def _update_roles(self, guild_id, user_id, role_id, add):
+        member = self.guilds[int(guild_id)]['members'].get(int(user_id))
+        if member is None:
+            return self._error(404, 10007, "Unknown Member")
+        roles = [r for r in member['roles'] if r != role_id]
+        member['roles'] = roles + [role_id] if add else roles
+        self._dispatch_guild(int(guild_id), 'GUILD_MEMBER_UPDATE', {**self._member_payload(member), 'guild_id': guild_id})
+        return web.Response(status=204)
+
+    async def add_role(self, request, guild_id, user_id, role_id):
+        return await self._update_roles(guild_id, user_id, role_id, add=True)
+
+    async def remove_role(self, request, guild_id, user_id, role_id):
+        return await self._update_roles(guild_id, user_id, role_id, add=False)
+
+    async def list_roles(self, request, guild_id):
+        return json_response(self.guilds[int(guild_id)]['roles'])
+
+    async def create_role(self, request, guild_id):
+        body = await self._read_body(request)
+        role = self._role(self.snowflake(), body.get('name', "new role"), int(body.get('permissions') or 0))
+        self.guilds[int(guild_id)]['roles'].append(role)
+        self._dispatch_guild(int(guild_id), 'GUILD_ROLE_CREATE', {'guild_id': guild_id, 'role': role})
+        return json_response(role)
+
+    async def interaction_callback(self, request, interaction_id, interaction_token):
+        record = self.interactions.get(interaction_token)
+        if record is None or str(record.id) != interaction_id:
+            return self._error(404, 10062, "Unknown interaction")
+        if record.callback is not None:
+            return self._error(400, 40060, "Interaction has already been acknowledged.")
+        body = await self._read_body(request)
+        callback_type, data = body.get('type'), body.get('data') or {}
+        record.callback = {'type': callback_type, 'data': data}
+        record.acked_at = time.perf_counter()
+
+        bot_user = self.bots[self.guilds[record.guild_id]['token']]['user']
+        response = {'interaction': {'id': interaction_id, 'type': record.type, 'response_message_loading': callback_type == DEFERRED_CHANNEL_MESSAGE,
+                                    'response_message_ephemeral': bool((data.get('flags') or 0) & EPHEMERAL)}}
+        if callback_type in (CHANNEL_MESSAGE, DEFERRED_CHANNEL_MESSAGE):
+            if callback_type == CHANNEL_MESSAGE and not (data.get('flags') or 0) & EPHEMERAL:
+                record.original = self._post_message(record.channel_id, bot_user, {**data, '_attachments': body.get('_attachments', [])},
+                                                     extra={'webhook_id': bot_user['id'], 'application_id': bot_user['id']})
+            else:
+                record.original = self._message(record.channel_id, bot_user, {**data, '_attachments': body.get('_attachments', [])},
+                                                extra={'webhook_id': bot_user['id'], 'application_id': bot_user['id']})
+            response['interaction']['response_message_id'] = record.original['id']
+            response['resource'] = {'type': callback_type, 'message': record.original}
+        else:
+            response['resource'] = {'type': callback_type}
+        record._touch(callback_type not in (DEFERRED_CHANNEL_MESSAGE, DEFERRED_UPDATE), self.render_delay)
+        return json_response(response)
+
+    async def webhook_send(self, request, webhook_id, webhook_token):
+        record = self.interactions.get(webhook_token)
+        if record is None:
+            return self._error(404, 10015, "Unknown Webhook")
+        body = await self._read_body(request)
+        bot_user = self.bots[self.guilds[record.guild_id]['token']]['user']
+        extra = {'webhook_id': webhook_id, 'application_id': webhook_id}
+        if (body.get('flags') or 0) & EPHEMERAL:
+            message = self._message(record.channel_id, bot_user, body, extra=extra)
+        else:
+            message = self._post_message(record.channel_id, bot_user, body, extra=extra)
+        record.messages.append(message)
+        record._touch(True, self.render_delay)
+        return json_response(message)
+
+    def _webhook_message(self, record, message_id):
+        if message_id == "@original":
+            return record.original
+        return next((m for m in record.messages if m['id'] == message_id), None)
+
+    async def webhook_get(self, request, webhook_id, webhook_token, message_id):
+        record = self.interactions.get(webhook_token)
+        message = record and self._webhook_message(record, message_id)
+        return json_response(message) if message else self._error(404, 10008, "Unknown Message")
+
+    async def webhook_edit(self, request, webhook_id, webhook_token, message_id):
+        record = self.interactions.get(webhook_token)
+        message = record and self._webhook_message(record, message_id)
+        if not message:
+            return self._error(404, 10008, "Unknown Message")
+        body = await self._read_body(request)
+        for key in ('content', 'embeds', 'components'):
+            if key in body:
+                message[key] = body[key]
+        message['edited_timestamp'] = iso_now()
+        record.messages.append(message)
+        record._touch(True, self.render_delay)
+        return json_response(message)
+
+    async def webhook_delete(self, request, webhook_id, webhook_token, message_id):
+        return web.Response(status=204)
+
+    # --- Lifecycle ---
+
+    def report(self):
+        routes = {route: dict(sorted(statuses.items())) for route, statuses in sorted(self.route_stats.items())}
+        return {
+            'rest_requests': sum(sum(s.values()) for s in self.route_stats.values()),
+            'rate_limited': dict(self.ratelimited),
+            'dm_messages': self.dm_messages,
+            'routes': routes,
+            'unknown_routes': dict(self.unknown_routes),
+        }
+
+    async def start(self, host="127.0.0.1", port=0):
+        app = web.Application(client_max_size=32 * 1024 * 1024)
+        app.router.add_get("/gateway", self._gateway)
+        app.router.add_route("*", API_PREFIX + "/{tail:.*}", self._api)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        self.gateway_url = f"ws://{'localhost' if host == '127.0.0.1' else host}:{port}/gateway"
+        return self.base_url
+
+    async def stop(self):
+        for bot in self.bots.values():
+            if bot['session'] is not None:
+                bot['session'].close()
+                await bot['session'].ws.close()
+        if self._runner:
+            await self._runner.cleanup()
@@ -0,0 +1,187 @@
+import itertools
+import discord
+from utils_resources import ResourceIndex
+
+# Minimal stand-ins for the discord.py objects the handlers touch. They record what the
+# handler would have sent instead of calling Discord, so a benchmark measures our code + SQLite.
+
+_ids = itertools.count(700_000_000_000_000_000)
+
+def next_id() -> int:
+    return next(_ids)
+
+class FakeAsset:
+    url = "https://cdn.discordapp.com/embed/avatars/0.png"
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str = None):
+        self.id = user_id
+        self.name = name or f"user{user_id % 100000}"
+        self.display_name = self.name
+        self.mention = f"<@{user_id}>"
+        self.display_avatar = FakeAsset()
+        self.roles = []
+        self.bot = False
+
+    def __str__(self):
+        return self.name
+
+    async def send(self, *args, **kwargs):
+        return FakeMessage()
+
+    async def add_roles(self, *roles):
+        self.roles.extend(roles)
+
+    async def remove_roles(self, *roles):
+        self.roles = [r for r in self.roles if r not in roles]
+
+class FakeRole:
+    def __init__(self, name: str):
+        self.id = next_id()
+        self.name = name
+        self.mention = f"<@&{self.id}>"
+
+class FakeMessage:
+    def __init__(self):
+        self.id = next_id()
+
+    async def edit(self, **kwargs):
+        return self
+
+class FakeChannel:
+    def __init__(self, name: str, category=None, type=discord.ChannelType.text):
+        self.id = next_id()
+        self.name = name
+        self.category = category
+        self.type = type
+        self.mention = f"<#{self.id}>"
+        self.sent = 0
+
+    async def send(self, *args, **kwargs):
+        self.sent += 1
+        return FakeMessage()
+
+    async def edit(self, **kwargs):
+        self.name = kwargs.get('name', self.name)
+        return self
+
+    async def delete(self, **kwargs):
+        pass
+
+class FakeGuild:
+    def __init__(self, guild_id: int, members=()):
+        self.id = guild_id
+        self.name = f"Bench {guild_id}"
+        self.members = {m.id: m for m in members}
+        self.roles = [FakeRole("Staff"), FakeRole("Notificaciones de Cumpleaños")]
+        self.categories = []
+        self._channels = {}
+        self.default_role = FakeRole("@everyone")
+        self.me = FakeUser(next_id(), "bench-bot")
+        self.chunked = False
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+    async def query_members(self, query=None, *, limit=5, user_ids=None, presences=False, cache=True):
+        # Uncached users are not members here (the gateway would answer with an empty chunk)
+        return [self.members[u] for u in user_ids or () if u in self.members]
+
+    def get_role(self, role_id):
+        return next((r for r in self.roles if r.id == role_id), None)
+
+    @property
+    def channels(self):
+        return list(self._channels.values())
+
+    def get_channel(self, channel_id):
+        return self._channels.get(channel_id)
+
+    def add_channel(self, channel):
+        self._channels[channel.id] = channel
+        return channel
+
+    async def create_category(self, name, **kwargs):
+        category = self.add_channel(FakeChannel(name, type=discord.ChannelType.category))
+        self.categories.append(category)
+        return category
+
+    async def create_text_channel(self, name, category=None, overwrites=None, **kwargs):
+        return self.add_channel(FakeChannel(name, category))
+
+    async def create_role(self, name, **kwargs):
+        role = FakeRole(name)
+        self.roles.append(role)
+        return role
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def defer(self, **kwargs):
+        self._done = True
+
+    async def send_message(self, content=None, **kwargs):
+        self._done = True
+        self._interaction.record(content, kwargs)
+
+    async def send_modal(self, modal):
+        self._done = True
+        self._interaction.modal = modal
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        self._interaction.record(content, kwargs)
+        return FakeMessage()
+
+class FakeClient:
+    def __init__(self, guilds=(), cogs=None):
+        self.guilds = list(guilds)
+        self.cogs = cogs or {}
+        self.resources = ResourceIndex()
+        self.users = {}
+        for guild in self.guilds:
+            self.users.update(guild.members)
+
+    def get_cog(self, name):
+        return self.cogs.get(name)
+
+    def get_user(self, user_id):
+        return self.users.get(user_id)
+
+    async def fetch_user(self, user_id):
+        return FakeUser(user_id)
+
+    async def wait_until_ready(self):
+        pass
+
+class FakeInteraction:
+    def __init__(self, client: FakeClient, guild: FakeGuild, user: FakeUser, custom_id: str = None):
+        self.id = next_id()
+        self.client = client
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.channel = guild.add_channel(FakeChannel("bench"))
+        self.data = {'custom_id': custom_id} if custom_id else {}
+        self.extras = {}
+        self.command = None
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.modal = None
+        self.messages = 0
+        self.payload_chars = 0
+
+    def record(self, content, kwargs):
+        self.messages += 1
+        self.payload_chars += len(content or "")
+        embed = kwargs.get('embed')
+        if embed is not None and embed.description:
+            self.payload_chars += len(embed.description)
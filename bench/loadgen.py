@@ -0,0 +1,511 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import time
+
+from bench.fake_discord import (
+    APPLICATION_COMMAND, MESSAGE_COMPONENT, MODAL, MODAL_SUBMIT, FakeDiscord, find_component, modal_submit_data,
+)
+from bench.replay import Replayer, load_recording, recording_size
+
+# End-to-end load tests: the real bot process (main.py) against the local Discord stand-in.
+#
+#   python -m bench.loadgen --profile valentine --guilds 2 --users 300 --ramp 60
+#   python -m bench.loadgen --profile ticket_rush --users 150 --ramp 10 --close 0.3
+#   python -m bench.loadgen --profile status --rounds 5
+#   python -m bench.loadgen --profile replay --recording recordings/feb14.jsonl --speed 4
+#
+# The stand-in is started in this process, the bot is spawned against it with fresh DBs and a
+# generated registry (bench/.data/load) and, once every bot reports ready over the control
+# socket, the traffic profile is replayed:
+#   valentine    users open the mailbox, pick a recipient and submit a letter (think times in
+#                between), then every guild's admin releases the mailbox at once (DM fan-out);
+#   ticket_rush  users open tickets within a short window; a fraction closes them afterwards;
+#   status       the admin runs /estado, which updates every bot's presence and status message;
+#   replay       replays interactions recorded with INTERACTION_RECORD_FILE (see bench/replay.py).
+# --record FILE makes the spawned bot record its own traffic, e.g. to replay a synthetic profile later.
+# Per step it reports ack latency (interaction callback), done latency (first visible answer,
+# i.e. the follow-up after a defer), timeouts and rejections, plus flow throughput, REST calls per
+# route and 429s from the stand-in. Results are saved as JSON next to the handler benchmarks.
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+LOAD_DIR = os.path.join(BENCH_DIR, ".data", "load")
+
+BASE_GUILD_ID = 910_000_000_000_000_000
+ADMIN_ID = 810_000_000_000_000_000 # Guild N's admin is ADMIN_ID - N (button cooldowns are per user, across guilds)
+FIRST_MEMBER_ID = ADMIN_ID + 1
+CHANNELS = ("general", "buzon", "tickets", "estado", "logs", "cumpleaños")
+TICKET_TYPES = ("Soporte Técnico", "Reportar Usuario", "Dudas / Consultas", "Donaciones")
+WORDS = "querida gracias por estar siempre ahí eres increíble feliz san valentín te aprecio mucho".split()
+
+# Think times in seconds (scaled by --think)
+THINK_PICK = (2, 8)       # Choosing a recipient
+THINK_WRITE = (30, 120)   # Writing the letter
+THINK_TICKET = (5, 30)    # Before closing a ticket
+
+STEP_TIMEOUT = 30
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+class StepStats:
+    def __init__(self):
+        self.steps = {}
+
+    def _step(self, name):
+        return self.steps.setdefault(name, {'ack': [], 'done': [], 'timeouts': 0, 'rejected': 0})
+
+    def record(self, name, record, until_last=False):
+        step = self._step(name)
+        if record.acked_at is not None:
+            step['ack'].append(record.acked_at - record.sent_at)
+        done_at = record.last_at if until_last else record.done_at
+        if done_at is not None:
+            step['done'].append(done_at - record.sent_at)
+
+    def duration(self, name, seconds):
+        self._step(name)['done'].append(seconds)
+
+    def timeout(self, name):
+        self._step(name)['timeouts'] += 1
+
+    def reject(self, name):
+        self._step(name)['rejected'] += 1
+
+    def summary(self):
+        ms = lambda s: round(s * 1000, 1)
+        out = {}
+        for name, step in self.steps.items():
+            entry = {'count': len(step['done']), 'timeouts': step['timeouts'], 'rejected': step['rejected']}
+            for key in ('ack', 'done'):
+                values = sorted(step[key])
+                if values:
+                    entry[f'{key}_p50_ms'] = ms(percentile(values, 0.50))
+                    entry[f'{key}_p90_ms'] = ms(percentile(values, 0.90))
+                    entry[f'{key}_p99_ms'] = ms(percentile(values, 0.99))
+                    entry[f'{key}_max_ms'] = ms(values[-1])
+            out[name] = entry
+        return out
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.fd = FakeDiscord(latency=args.latency / 1000, jitter=args.latency / 4000,
+                              rate_limits=not args.no_rate_limits, dm_closed_ratio=args.dm_closed, seed=args.seed)
+        self.stats = StepStats()
+        self.footprint = {}        # Peak RSS/sockets of the bot process (sample_process)
+        self.guild_ids = [BASE_GUILD_ID + n + 1 for n in range(args.guilds)]
+        self.members = [FIRST_MEMBER_ID + n for n in range(args.members)]
+        self.admins = {guild_id: ADMIN_ID - n for n, guild_id in enumerate(self.guild_ids, 1)}
+        self.panels = {}
+        self.flows = 0
+        self.process = None
+
+    # --- Setup ---
+
+    def build_world(self):
+        for n, guild_id in enumerate(self.guild_ids, 1):
+            self.fd.add_bot(f"load-main-{n}", f"valentine-{n}")
+            self.fd.add_bot(f"load-logs-{n}", f"logs-{n}")
+            admin_id = self.admins[guild_id]
+            self.fd.add_guild(guild_id, f"Carga {n}", f"load-main-{n}", [admin_id] + self.members,
+                              channels=CHANNELS, roles=("Staff",), admin_ids=(admin_id,), extra_tokens=(f"load-logs-{n}",))
+            button = lambda custom_id: {'type': 2, 'style': 2, 'custom_id': custom_id, 'label': custom_id}
+            self.panels[guild_id] = {
+                'mailbox': self.fd.seed_message(guild_id, "buzon", {'components': [
+                    {'type': 1, 'components': [button("btn_anon"), button("btn_signed")]},
+                    {'type': 1, 'components': [button("btn_release")]},
+                ]}),
+                'tickets': self.fd.seed_message(guild_id, "tickets", {'components': [
+                    {'type': 1, 'components': [{'type': 3, 'custom_id': "select_ticket_type", 'options': [
+                        {'label': t, 'value': t} for t in TICKET_TYPES]}]},
+                ]}),
+            }
+
+    def write_registry(self, path):
+        entries = []
+        for n, guild_id in enumerate(self.guild_ids, 1):
+            staff_role = next(int(r['id']) for r in self.fd.guilds[guild_id]['roles'] if r['name'] == "Staff")
+            entries.append({
+                'id': guild_id,
+                'name': f"Carga {n}",
+                'emoji': "🧪",
+                'token': f"load-main-{n}",
+                'log_token': f"load-logs-{n}",
+                'status_channel_id': self.fd.channel_id(guild_id, "estado"),
+                'ticket_log_channel_id': self.fd.channel_id(guild_id, "logs"),
+                'birthday_channel_id': self.fd.channel_id(guild_id, "cumpleaños"),
+                'ticket_support_role_id': [staff_role],
+                'admin_ids': [self.admins[guild_id]],
+                'enable_staff_applications': True,
+                'ticket_max_per_type': 1,
+                'member_cache': self.args.member_cache,
+            })
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({'guilds': entries}, f)
+
+    def spawn_bot(self, registry_path):
+        env = {
+            **os.environ,
+            'DISCORD_API_BASE': self.fd.base_url,
+            'DISCORD_GATEWAY_URL': self.fd.gateway_url,
+            'GUILD_REGISTRY_FILE': registry_path,
+            'DB_DIR': LOAD_DIR,
+            'LOG_DIR': "",
+            'LOG_LEVEL': self.args.log_level,
+            'ADMIN_USER_ID': ",".join(str(a) for a in self.admins.values()),
+            'BOT_CONTROL_PORT': str(self.args.control_port),
+            'METRICS_PORT': "",
+            'BOT_WORKERS': "1",
+            'SHARED_HTTP': "1" if self.args.shared_http == "on" else "0",
+            'INTERACTION_RECORD_FILE': os.path.abspath(self.args.record) if self.args.record else "",
+        }
+        # cwd = the run directory, so status_config.json and friends stay out of the tree
+        self.bot_log = open(os.path.join(LOAD_DIR, "bot.log"), "w", encoding="utf-8")
+        self.process = subprocess.Popen([sys.executable, os.path.join(ROOT_DIR, "main.py")], cwd=LOAD_DIR, env=env,
+                                        stdout=self.bot_log, stderr=subprocess.STDOUT)
+
+    def stop_bot(self):
+        if self.process is None or self.process.poll() is not None:
+            return
+        # SIGINT lets main.py run its shutdown path (status broadcast, cleanup)
+        if os.name == "nt":
+            self.process.terminate()
+        else:
+            self.process.send_signal(signal.SIGINT)
+        try:
+            self.process.wait(timeout=20)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.bot_log.close()
+
+    async def sample_process(self, interval=0.5):
+        """Peak RSS and open sockets of the bot process during the profile (Linux only)."""
+        while True:
+            sample = process_footprint(self.process.pid)
+            if sample is None:
+                return
+            for key, value in sample.items():
+                self.footprint[key] = max(self.footprint.get(key, 0), value)
+            await asyncio.sleep(interval)
+
+    async def ping(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.args.control_port)
+        try:
+            writer.write(json.dumps({"op": "ping"}).encode("utf-8") + b"\n")
+            await writer.drain()
+            return json.loads(await asyncio.wait_for(reader.readline(), 5) or b"{}")
+        finally:
+            writer.close()
+
+    async def wait_ready(self, timeout):
+        expected = len(self.guild_ids) # The control socket reports the main bots
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"el bot terminó con código {self.process.returncode} (ver {LOAD_DIR}/bot.log)")
+            try:
+                bots = (await self.ping()).get('bots', {})
+                if len(bots) == expected and all(bots.values()):
+                    return
+            except (OSError, ValueError, asyncio.TimeoutError):
+                pass
+            await asyncio.sleep(0.5)
+        raise RuntimeError(f"los bots no estuvieron listos en {timeout}s (ver {LOAD_DIR}/bot.log)")
+
+    # --- Helpers ---
+
+    async def think(self, bounds):
+        if self.args.think:
+            await asyncio.sleep(self.rng.uniform(*bounds) * self.args.think)
+
+    async def step(self, name, record, predicate=None, timeout=STEP_TIMEOUT):
+        """
+        Waits for the bot's answer and records it. With a predicate, 'done' is the answer that satisfied it.
+        False on timeout or a ⛔/❌ answer (or ⏳, a cooldown).
+        """
+        try:
+            await record.wait(predicate, timeout)
+        except asyncio.TimeoutError:
+            self.stats.timeout(name)
+            return False
+        self.stats.record(name, record, until_last=predicate is not None)
+        texts = [t for t in record.texts() if t]
+        if texts and texts[0].startswith(("⛔", "❌", "⏳")):
+            self.stats.reject(name)
+            return False
+        return True
+
+    def button(self, guild_id, user_id, custom_id, channel_id, message):
+        return self.fd.interact(guild_id, user_id, MESSAGE_COMPONENT, {'custom_id': custom_id, 'component_type': 2}, channel_id, message)
+
+    def arrivals(self, count, window):
+        """Start offsets for `count` users arriving at random over `window` seconds."""
+        return sorted(self.rng.uniform(0, window) for _ in range(count))
+
+    async def run_arrivals(self, flow, count):
+        async def delayed(offset, guild_id, user_id):
+            await asyncio.sleep(offset)
+            await flow(guild_id, user_id)
+
+        users = self.rng.sample(self.members, min(count, len(self.members)))
+        tasks = [delayed(offset, self.rng.choice(self.guild_ids), user_id)
+                 for offset, user_id in zip(self.arrivals(len(users), self.args.ramp), users)]
+        await asyncio.gather(*tasks)
+
+    # --- Profiles ---
+
+    async def letter_flow(self, guild_id, user_id):
+        mailbox = self.panels[guild_id]['mailbox']
+        channel_id = int(mailbox['channel_id'])
+        click = self.button(guild_id, user_id, "btn_anon" if self.rng.random() < 0.7 else "btn_signed", channel_id, mailbox)
+        if not await self.step("buzón: abrir", click):
+            return
+        select = find_component(click.callback['data'].get('components'), type=5)
+        if select is None:
+            self.stats.reject("buzón: abrir")
+            return
+
+        await self.think(THINK_PICK)
+        recipient = self.rng.choice([m for m in self.members if m != user_id])
+        pick = self.fd.interact(guild_id, user_id, MESSAGE_COMPONENT, {
+            'custom_id': select['custom_id'], 'component_type': 5, 'values': [str(recipient)],
+            'resolved': {'users': {str(recipient): self.fd.user_payload(recipient)},
+                         'members': {str(recipient): self.fd.resolved_member(guild_id, recipient)}},
+        }, channel_id, self.fd.ephemeral_reply(click))
+        if not await self.step("buzón: destinatario", pick):
+            return
+        if pick.callback['type'] != MODAL:
+            self.stats.reject("buzón: destinatario")
+            return
+
+        await self.think(THINK_WRITE)
+        letter = lambda _: " ".join(self.rng.choices(WORDS, k=self.rng.randint(8, 80)))
+        submit = self.fd.interact(guild_id, user_id, MODAL_SUBMIT, modal_submit_data(pick.callback['data'], letter), channel_id)
+        if await self.step("buzón: enviar carta", submit):
+            self.flows += 1
+
+    async def release(self, guild_id):
+        mailbox = self.panels[guild_id]['mailbox']
+        record = self.button(guild_id, self.admins[guild_id], "btn_release", int(mailbox['channel_id']), mailbox)
+        finished = lambda r: r.contains("Reporte de entrega") or r.contains("No hay cartas")
+        await self.step("buzón: liberar (reporte final)", record, finished, timeout=self.args.release_timeout)
+
+    async def valentine(self):
+        await self.run_arrivals(self.letter_flow, self.args.users)
+        print(f"📮 {self.flows} cartas enviadas. Liberando buzones...")
+        dms_before, started = self.fd.dm_messages, time.perf_counter()
+        await asyncio.gather(*(self.release(guild_id) for guild_id in self.guild_ids))
+        elapsed = time.perf_counter() - started
+        delivered = self.fd.dm_messages - dms_before
+        return {'release': {'dms': delivered, 'seconds': round(elapsed, 2), 'dms_per_second': round(delivered / elapsed, 2) if elapsed else None}}
+
+    async def ticket_flow(self, guild_id, user_id):
+        panel = self.panels[guild_id]['tickets']
+        open_record = self.fd.interact(guild_id, user_id, MESSAGE_COMPONENT, {
+            'custom_id': "select_ticket_type", 'component_type': 3, 'values': [self.rng.choice(TICKET_TYPES)],
+        }, int(panel['channel_id']), panel)
+        if not await self.step("tickets: abrir", open_record):
+            return
+        match = re.search(r"<#(\d+)>", " ".join(open_record.texts()))
+        if match is None:
+            self.stats.reject("tickets: abrir")
+            return
+        self.flows += 1
+        if self.rng.random() >= self.args.close:
+            return
+
+        await self.think(THINK_TICKET)
+        channel_id = int(match.group(1))
+        control = None
+        for _ in range(50): # The control message is sent right after the follow-up
+            control = next((m for m in self.fd.channel_messages(channel_id) if find_component(m['components'], custom_id="btn_close_ticket")), None)
+            if control:
+                break
+            await asyncio.sleep(0.1)
+        if control is None:
+            self.stats.timeout("tickets: cerrar")
+            return
+        close = self.button(guild_id, user_id, "btn_close_ticket", channel_id, control)
+        if not await self.step("tickets: cerrar", close):
+            return
+        try:
+            await self.fd.wait_channel_deleted(channel_id, STEP_TIMEOUT)
+            self.stats.duration("tickets: canal borrado", time.perf_counter() - close.sent_at)
+        except asyncio.TimeoutError:
+            self.stats.timeout("tickets: canal borrado")
+
+    async def ticket_rush(self):
+        await self.run_arrivals(self.ticket_flow, self.args.users)
+        return {}
+
+    async def status(self):
+        guild_id = self.guild_ids[0]
+        commands = self.fd.bots[self.fd.guilds[guild_id]['token']]['commands'].get(str(guild_id), [])
+        command_id = next(c['id'] for c in commands if c['name'] == "estado")
+        for n in range(self.args.rounds):
+            record = self.fd.interact(guild_id, self.admins[guild_id], APPLICATION_COMMAND, {
+                'id': command_id, 'name': "estado", 'type': 1, 'guild_id': str(guild_id),
+                'options': [{'name': "tipo", 'type': 3, 'value': "mantenimiento" if n % 2 else "active"},
+                            {'name': "mensaje", 'type': 3, 'value': f"Prueba de carga {n + 1}"}],
+            }, self.fd.channel_id(guild_id, "general"))
+            if await self.step("estado: broadcast", record, lambda r: bool(r.messages), timeout=60):
+                self.flows += 1
+            await asyncio.sleep(self.args.interval)
+        return {}
+
+    async def replay(self):
+        _, events = load_recording(self.args.recording)
+        replayer = Replayer(self, events, self.admins, self.args.speed)
+        extra = await replayer.run()
+        self.flows = replayer.sent
+        return extra
+
+    async def run(self):
+        self.build_world()
+        base_url = await self.fd.start(port=self.args.port)
+        print(f"🧪 Discord local en {base_url} ({len(self.guild_ids)} servidores, {len(self.members)} miembros c/u)")
+        registry_path = os.path.join(LOAD_DIR, "guilds.load.json")
+        self.write_registry(registry_path)
+        self.spawn_bot(registry_path)
+        try:
+            started = time.perf_counter()
+            await self.wait_ready(self.args.ready_timeout)
+            print(f"🟢 Bots listos en {time.perf_counter() - started:.1f}s. Perfil: {self.args.profile}")
+
+            started = time.perf_counter()
+            sampler = asyncio.create_task(self.sample_process())
+            extra = await getattr(self, self.args.profile)()
+            elapsed = time.perf_counter() - started
+            sampler.cancel()
+        finally:
+            await asyncio.to_thread(self.stop_bot)
+            await self.fd.stop()
+
+        return {
+            'elapsed_seconds': round(elapsed, 2),
+            'flows': self.flows,
+            'flows_per_second': round(self.flows / elapsed, 2) if elapsed else None,
+            'steps': self.stats.summary(),
+            **extra,
+            'process': self.footprint,
+            'discord': self.fd.report(),
+        }
+
+def process_footprint(pid):
+    """{'rss_mb', 'sockets'} of a running process from /proc, or None where there is no /proc."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        sockets = 0
+        for fd in os.listdir(f"/proc/{pid}/fd"):
+            try:
+                sockets += os.readlink(f"/proc/{pid}/fd/{fd}").startswith("socket:")
+            except OSError:
+                pass
+    except (OSError, ValueError, AttributeError):
+        return None
+    return {'rss_mb': round(rss / 1024 / 1024, 1), 'sockets': sockets}
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=ROOT_DIR).stdout.strip() or None
+    except OSError:
+        return None
+
+def print_results(results):
+    print(f"\n⏱️ {results['flows']} flujos completos en {results['elapsed_seconds']}s ({results['flows_per_second']}/s)")
+    for name, s in results['steps'].items():
+        print(f"  {name:<30} n={s['count']:<5} ack p50 {s.get('ack_p50_ms', '-'):>8} p99 {s.get('ack_p99_ms', '-'):>8} ms  "
+              f"listo p50 {s.get('done_p50_ms', '-'):>8} p99 {s.get('done_p99_ms', '-'):>8} ms  "
+              f"timeouts {s['timeouts']} rechazos {s['rejected']}")
+    if 'replay' in results:
+        r = results['replay']
+        print(f"  🔁 Reproducción x{r.get('speed')}: {r.get('sent', 0)}/{r['events']} eventos en {r.get('seconds')}s "
+              f"(grabados {r.get('recorded_seconds')}s, retraso x{r.get('lag_factor')})")
+        for reason, count in (r.get('skipped') or {}).items():
+            print(f"    ⏭️ {reason}: {count}")
+    if 'release' in results:
+        r = results['release']
+        print(f"  💌 Liberación: {r['dms']} DMs en {r['seconds']}s ({r['dms_per_second']}/s)")
+    p = results.get('process')
+    if p:
+        print(f"  🧠 Proceso del bot (pico): RSS {p['rss_mb']} MB, {p['sockets']} sockets")
+    d = results['discord']
+    print(f"  🌐 REST: {d['rest_requests']} peticiones, 429: {d['rate_limited'] or 0}")
+    if d['unknown_routes']:
+        print(f"  ⚠️ Rutas no emuladas: {', '.join(d['unknown_routes'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Pruebas de carga extremo a extremo contra un Discord local")
+    parser.add_argument("--profile", choices=("valentine", "ticket_rush", "status", "replay"), default="valentine")
+    parser.add_argument("--guilds", type=int, default=2)
+    parser.add_argument("--members", type=int, default=1000, help="Miembros por servidor")
+    parser.add_argument("--users", type=int, default=200, help="Usuarios activos durante la prueba")
+    parser.add_argument("--ramp", type=float, default=30, help="Ventana de llegada de usuarios (segundos)")
+    parser.add_argument("--think", type=float, default=0.1, help="Multiplicador de los tiempos de pensar (0 = sin pausas)")
+    parser.add_argument("--close", type=float, default=0.3, help="ticket_rush: fracción de tickets que se cierran")
+    parser.add_argument("--rounds", type=int, default=5, help="status: número de /estado")
+    parser.add_argument("--interval", type=float, default=2, help="status: segundos entre /estado")
+    parser.add_argument("--recording", default=None, help="replay: grabación JSONL de INTERACTION_RECORD_FILE")
+    parser.add_argument("--speed", type=float, default=1, help="replay: velocidad de reproducción (2 = el doble de rápido)")
+    parser.add_argument("--record", default=None, help="Graba las interacciones que recibe el bot en este archivo")
+    parser.add_argument("--member-cache", choices=("all", "lazy", "none"), default="lazy", help="member_cache de los servidores")
+    parser.add_argument("--shared-http", choices=("on", "off"), default="on", help="Pool HTTP compartido entre los bots (SHARED_HTTP)")
+    parser.add_argument("--latency", type=float, default=40, help="Latencia simulada de la API (ms)")
+    parser.add_argument("--dm-closed", type=float, default=0.05, help="Fracción de usuarios con DMs cerrados")
+    parser.add_argument("--no-rate-limits", action="store_true", help="Desactiva los límites emulados")
+    parser.add_argument("--release-timeout", type=float, default=900)
+    parser.add_argument("--ready-timeout", type=float, default=120)
+    parser.add_argument("--port", type=int, default=0, help="Puerto del Discord local (0 = libre)")
+    parser.add_argument("--control-port", type=int, default=8799)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--seed", type=int, default=14)
+    parser.add_argument("--out", default=None, help="Archivo JSON de salida (por defecto bench/results/load-<fecha>.json)")
+    args = parser.parse_args()
+    if args.profile == "replay":
+        if not args.recording:
+            parser.error("--profile replay necesita --recording")
+        # Enough guilds and members for every recorded one
+        guilds, users = recording_size(load_recording(args.recording)[1])
+        args.guilds = max(args.guilds, guilds)
+        args.members = max(args.members, users + 1)
+
+    # Fresh DBs and status files every run
+    shutil.rmtree(LOAD_DIR, ignore_errors=True)
+    os.makedirs(LOAD_DIR)
+
+    results = asyncio.run(LoadTest(args).run())
+    print_results(results)
+
+    out = args.out or os.path.join(BENCH_DIR, "results", "load-" + datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({
+            'meta': {
+                'timestamp': datetime.datetime.now().isoformat(timespec="seconds"),
+                'revision': git_revision(),
+                'python': sys.version.split()[0],
+                'platform': platform.platform(),
+                'args': vars(args),
+            },
+            'results': results,
+        }, f, indent=2, ensure_ascii=False)
+    print(f"\n💾 Resultados guardados en {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+import asyncio
+import json
+import re
+import time
+
+from bench.fake_discord import APPLICATION_COMMAND, MESSAGE_COMPONENT, MODAL, MODAL_SUBMIT, find_component, modal_submit_data
+
+# Replays a recording made with INTERACTION_RECORD_FILE (utils_record.py) against the local
+# Discord stand-in. Used by bench/loadgen.py:
+#
+#   python -m bench.loadgen --profile replay --recording recordings/feb14.jsonl --speed 4
+#
+# Recorded guilds/users are mapped onto the load test's guilds and members by number (admins onto
+# the guild's load test admin). Each event is sent at its recorded offset divided by --speed, but a user's
+# events stay in order: an event waits for the bot to answer that user's previous one, since it
+# usually clicks something that answer contained.
+# Auto-generated custom_ids were recorded as "~", so they are bound to the live replay instead:
+#   component "~"   the component of the same type in the user's last answer (the select of the
+#                   "pick a recipient" message...);
+#   modal submit    the last modal the bot opened for that user, filled with the recorded lengths;
+#   persistent id   the newest message carrying it: first in the last channel the bot mentioned to
+#                   the user (their ticket), then anywhere in the guild, else a seeded panel.
+# Events whose context is gone (the bot answered differently this time) are counted as skipped.
+
+DYNAMIC_CUSTOM_ID = "~"
+USER_OPTION = 6
+USER_SELECT = 5
+_CHANNEL_MENTION = re.compile(r"<#(\d+)>")
+
+def load_recording(path):
+    """
+    (header, events) from a recording; events sorted by offset. A bot restart appends a new session
+    (header line + offsets from 0): sessions are played back to back. Numbers restart too, so the
+    same number in two sessions replays as the same member.
+    """
+    header, events = {}, []
+    base = end = 0.0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if 'v' in entry:
+                header = header or entry
+                base = end
+                continue
+            entry['t'] += base
+            end = max(end, entry['t'])
+            events.append(entry)
+    events.sort(key=lambda e: e['t'])
+    return header, events
+
+def recording_size(events):
+    """(guilds, users) needed to replay: the highest recorded numbers."""
+    guilds = max((e['g'] or 0 for e in events), default=1)
+    users = max([e['u'] for e in events if not e['a']] +
+                [v for e in events for v in user_refs(e['d'])], default=1)
+    return max(guilds, 1), max(users, 1)
+
+def user_refs(data):
+    """Recorded user numbers referenced by an event's data (user options, user selects)."""
+    refs = []
+    if data.get('component_type') == USER_SELECT:
+        refs.extend(v for v in data.get('values', []) if v)
+    stack = list(data.get('options', []))
+    while stack:
+        option = stack.pop()
+        stack.extend(option.get('options', []))
+        if option.get('type') == USER_OPTION and option.get('value'):
+            refs.append(option['value'])
+    return refs
+
+class UserState:
+    def __init__(self):
+        self.last = None          # Last InteractionRecord of this user
+        self.modal = None         # Last record the bot answered with a modal
+        self.channel_id = None    # Last channel the bot mentioned (e.g. the ticket it opened)
+
+class Replayer:
+    def __init__(self, test, events, admins, speed=1.0):
+        self.test = test
+        self.admins = admins      # guild_id -> admin user_id
+        self.fd = test.fd
+        self.events = events
+        self.speed = speed
+        self.users = {}
+        self.seeded = {}          # (guild_id, custom_id) -> message carrying a persistent component
+        self.sent = 0
+        self.skipped = {}
+
+    # --- Mapping ---
+
+    def guild_id(self, event):
+        return self.test.guild_ids[((event['g'] or 1) - 1) % len(self.test.guild_ids)]
+
+    def member_id(self, number):
+        return self.test.members[(number - 1) % len(self.test.members)]
+
+    def user_id(self, event):
+        return self.admins[self.guild_id(event)] if event['a'] else self.member_id(event['u'])
+
+    def skip(self, reason):
+        self.skipped[reason] = self.skipped.get(reason, 0) + 1
+
+    def resolved(self, guild_id, numbers):
+        users = [self.member_id(n) for n in numbers if n]
+        return {'users': {str(u): self.fd.user_payload(u) for u in users},
+                'members': {str(u): self.fd.resolved_member(guild_id, u) for u in users}}
+
+    # --- Building interactions ---
+
+    def command(self, event, guild_id, user_id):
+        data = event['d']
+        commands = self.fd.bots[self.fd.guilds[guild_id]['token']]['commands'].get(str(guild_id), [])
+        command = next((c for c in commands if c['name'] == data['name'] and c.get('type', 1) == data.get('type', 1)), None)
+        if command is None:
+            self.skip(f"comando /{data['name']} no registrado")
+            return None
+
+        def option(o):
+            out = {'name': o['name'], 'type': o['type']}
+            if 'options' in o:
+                out['options'] = [option(sub) for sub in o['options']]
+            elif 'value' in o:
+                out['value'] = str(self.member_id(o['value'])) if o['type'] == USER_OPTION else o['value']
+            return out
+
+        payload = {'id': command['id'], 'name': data['name'], 'type': data.get('type', 1), 'guild_id': str(guild_id),
+                   'options': [option(o) for o in data.get('options', [])]}
+        refs = user_refs(data)
+        if refs:
+            payload['resolved'] = self.resolved(guild_id, refs)
+        return self.fd.interact(guild_id, user_id, APPLICATION_COMMAND, payload, self.fd.channel_id(guild_id, "general"))
+
+    def persistent_message(self, guild_id, state, custom_id):
+        channels = [state.channel_id] if state.channel_id else []
+        channels += [cid for cid, c in reversed(self.fd.channels.items()) if c.get('guild_id') == str(guild_id)]
+        for channel_id in channels:
+            for message in reversed(self.fd.channel_messages(channel_id)):
+                if find_component(message['components'], custom_id=custom_id):
+                    return message
+        # Not on screen in the replay (a panel the load test does not seed): show it once in #general
+        key = (guild_id, custom_id)
+        if key not in self.seeded:
+            self.seeded[key] = self.fd.seed_message(guild_id, "general", {'components': [
+                {'type': 1, 'components': [{'type': 2, 'style': 2, 'custom_id': custom_id, 'label': custom_id}]}]})
+        return self.seeded[key]
+
+    def component(self, event, guild_id, user_id, state):
+        data = event['d']
+        component_type = data.get('component_type', 2)
+        if data.get('custom_id') == DYNAMIC_CUSTOM_ID:
+            if state.last is None:
+                self.skip("componente sin respuesta previa")
+                return None
+            message = self.fd.ephemeral_reply(state.last)
+            target = find_component(message.get('components'), type=component_type)
+            if target is None:
+                self.skip("componente ya no presente")
+                return None
+            custom_id = target['custom_id']
+        else:
+            custom_id = data['custom_id']
+            message = self.persistent_message(guild_id, state, custom_id)
+
+        payload = {'custom_id': custom_id, 'component_type': component_type, 'values': list(data.get('values', []))}
+        if component_type == USER_SELECT:
+            payload['values'] = [str(self.member_id(v)) for v in data['values'] if v]
+            payload['resolved'] = self.resolved(guild_id, data['values'])
+        elif component_type == 2:
+            payload.pop('values')
+        return self.fd.interact(guild_id, user_id, MESSAGE_COMPONENT, payload, int(message['channel_id']), message)
+
+    def modal_submit(self, event, guild_id, user_id, state):
+        if state.modal is None:
+            self.skip("modal no abierto")
+            return None
+        values = []
+        stack = list(event['d'].get('components', []))
+        while stack:
+            component = stack.pop(0)
+            if component.get('type') == 4:
+                values.append(component.get('value', ""))
+            stack[0:0] = component.get('components', []) + ([component['component']] if component.get('component') else [])
+        values = iter(values)
+        data = modal_submit_data(state.modal.callback['data'], lambda _: next(values, "x"))
+        record = self.fd.interact(guild_id, user_id, MODAL_SUBMIT, data, state.modal.channel_id)
+        state.modal = None
+        return record
+
+    # --- Running ---
+
+    def step_name(self, event):
+        data = event['d']
+        if event['k'] == APPLICATION_COMMAND:
+            return f"comando: /{data['name']}"
+        if event['k'] == MODAL_SUBMIT:
+            return "modal: enviar"
+        if data.get('custom_id') == DYNAMIC_CUSTOM_ID:
+            return f"componente dinámico (tipo {data.get('component_type')})"
+        return f"componente: {data.get('custom_id')}"
+
+    async def send(self, event, state):
+        guild_id, user_id = self.guild_id(event), self.user_id(event)
+        if event['k'] == APPLICATION_COMMAND:
+            record = self.command(event, guild_id, user_id)
+        elif event['k'] == MESSAGE_COMPONENT:
+            record = self.component(event, guild_id, user_id, state)
+        elif event['k'] == MODAL_SUBMIT:
+            record = self.modal_submit(event, guild_id, user_id, state)
+        else:
+            self.skip(f"tipo {event['k']} no soportado")
+            record = None
+        if record is None:
+            return
+        self.sent += 1
+        await self.test.step(self.step_name(event), record)
+        state.last = record
+        if record.callback and record.callback['type'] == MODAL:
+            state.modal = record
+        match = _CHANNEL_MENTION.search(" ".join(record.texts()))
+        if match and int(match.group(1)) in self.fd.channels:
+            state.channel_id = int(match.group(1))
+
+    async def run_user(self, key, events, started):
+        state = self.users.setdefault(key, UserState())
+        for event in events:
+            delay = started + event['t'] / self.speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.send(event, state)
+
+    async def settle(self, quiet=2.0, timeout=120):
+        """Waits until the bot stops calling the API, so work started by the last events (a mailbox
+        release's DMs...) is not cut off when the bot is stopped."""
+        deadline = time.perf_counter() + timeout
+        last, last_change = None, time.perf_counter()
+        while time.perf_counter() < deadline:
+            count = self.fd.report()['rest_requests']
+            if count != last:
+                last, last_change = count, time.perf_counter()
+            elif time.perf_counter() - last_change >= quiet:
+                return
+            await asyncio.sleep(0.25)
+
+    async def run(self):
+        if not self.events:
+            return {'replay': {'events': 0}}
+        first = self.events[0]['t']
+        by_user = {}
+        for event in self.events:
+            by_user.setdefault((event['g'], event['u']), []).append({**event, 't': event['t'] - first})
+        started = time.perf_counter()
+        await asyncio.gather(*(self.run_user(key, events, started) for key, events in by_user.items()))
+        elapsed = time.perf_counter() - started
+        await self.settle()
+        recorded = self.events[-1]['t'] - first
+        return {'replay': {
+            'events': len(self.events),
+            'sent': self.sent,
+            'skipped': self.skipped,
+            'speed': self.speed,
+            'recorded_seconds': round(recorded, 2),
+            'seconds': round(elapsed, 2),
+            # > 1 means the bot could not keep up with the requested speed
+            'lag_factor': round(elapsed * self.speed / recorded, 2) if recorded else None,
+        }}
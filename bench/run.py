@@ -0,0 +1,274 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+# Handler-level benchmarks on synthetic guild DBs.
+#
+#   python -m bench.run                                  # 1k + 100k letters, 10k birthdays
+#   python -m bench.run --sizes 1k,100k,1m -n 200
+#   python -m bench.run --only view_letters_user,ticket_open --compare bench/results/<old>.json
+#
+# Every scenario calls the real handler (cog command callbacks, view/select callbacks, modal
+# on_submit) with fake interactions from bench/fakes.py. Per scenario it reports latency
+# percentiles, SQLite time and operations (statements + fetches) per call from the
+# db_query_seconds metrics, and allocation peaks (a separate, shorter pass under tracemalloc).
+# Results are saved as JSON.
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ADMIN_ID = 1
+
+# Must be set before the bot modules are imported
+os.environ.setdefault('DB_DIR', os.path.join(BENCH_DIR, ".data"))
+os.environ.setdefault('GUILD_REGISTRY_FILE', os.path.join(os.environ['DB_DIR'], "guilds.bench.json"))
+os.environ.setdefault('FILTER_DIR', os.path.join(os.environ['DB_DIR'], "filters"))
+os.environ.setdefault('LOG_DIR', "")
+os.environ.setdefault('LOG_LEVEL', "WARNING")
+os.environ['ADMIN_USER_ID'] = str(ADMIN_ID)
+os.environ['OUTBOUND_RATE'] = "1000000" # The fakes have no rate limits; keep scheduler pacing out of handler timings
+
+from bench import synth
+from bench.fakes import FakeChannel, FakeClient, FakeGuild, FakeInteraction, FakeUser, next_id
+
+def db_totals():
+    from utils_metrics import REGISTRY
+    series = REGISTRY.metrics.get("db_query_seconds", {})
+    return sum(h.sum for h in series.values()), sum(h.count for h in series.values())
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+class Context:
+    """One synthetic guild: fake client/guild/members plus the real cog instances."""
+    def __init__(self, size_name):
+        from cogs.letters import Letters
+        from cogs.birthdays import Birthdays
+        from cogs.tickets import OpenTicketIndex
+        import utils_outbound
+        utils_outbound.ROUTE_LIMITS = {}
+        utils_outbound.DEFAULT_ROUTE_LIMIT = (1_000_000, 1)
+
+        self.size_name = size_name
+        self.letters = synth.SIZES[size_name]
+        self.guild_id = synth.guild_for(size_name)
+        self.rng = random.Random(7)
+        # ~60% of the user pool is cached as members; the rest goes through fetch_user
+        members = [FakeUser(synth.user_id(n)) for n in range(0, synth.USER_POOL) if n % 5 < 3]
+        self.guild = FakeGuild(self.guild_id, members)
+        birthday_channel = FakeChannel("cumpleaños")
+        birthday_channel.id = self.guild_id + 1 # birthday_channel_id in the bench registry
+        self.guild.add_channel(birthday_channel)
+
+        tickets = type("BenchTickets", (), {})()
+        tickets.open_tickets = OpenTicketIndex()
+        tickets.pool = None
+        tickets.arm_autoclose = lambda channel_id, guild_id: None
+        self.client = FakeClient([self.guild], cogs={"Tickets": tickets})
+
+        self.letters_cog = Letters(self.client)
+        self.birthdays_cog = Birthdays.__new__(Birthdays) # Skip __init__: it starts the daily loop
+        self.birthdays_cog.bot = self.client
+
+    def random_user(self):
+        return FakeUser(synth.user_id(self.rng.randrange(synth.USER_POOL)))
+
+    def interaction(self, user=None, custom_id=None):
+        return FakeInteraction(self.client, self.guild, user or self.random_user(), custom_id)
+
+# --- Scenarios: each runs one handler invocation ---
+
+async def recipient_select(ctx):
+    from cogs.letters import RecipientSelect
+    select = RecipientSelect(is_anonymous=True)
+    select._values = [ctx.random_user()]
+    await select.callback(ctx.interaction())
+
+async def letter_submit(ctx):
+    from cogs.letters import LetterModal
+    modal = LetterModal(True, ctx.random_user())
+    modal.message._value = " ".join(ctx.rng.choices(synth.WORDS, k=60))
+    await modal.on_submit(ctx.interaction())
+
+async def view_letters_user(ctx):
+    cog = ctx.letters_cog
+    await cog.view_letters.callback(cog, ctx.interaction(FakeUser(ADMIN_ID)), user=ctx.random_user(), tipo=None)
+
+async def view_letters_all(ctx):
+    cog = ctx.letters_cog
+    await cog.view_letters.callback(cog, ctx.interaction(FakeUser(ADMIN_ID)), user=None, tipo=None)
+
+async def read_letter(ctx):
+    cog = ctx.letters_cog
+    await cog.read_letter.callback(cog, ctx.interaction(FakeUser(ADMIN_ID)), letter_id=ctx.rng.randint(1, ctx.letters))
+
+async def letters_stats(ctx):
+    cog = ctx.letters_cog
+    await cog.letters_stats.callback(cog, ctx.interaction(FakeUser(ADMIN_ID)))
+
+async def bday_view_next(ctx):
+    from cogs.birthdays import BirthdayView
+    view = BirthdayView()
+    button = next(item for item in view.children if getattr(item, 'custom_id', None) == "btn_bday_view")
+    await button.callback(ctx.interaction(custom_id="btn_bday_view"))
+
+async def check_birthdays(ctx):
+    cog = ctx.birthdays_cog
+    await cog.check_birthdays.coro(cog)
+
+async def ticket_open(ctx):
+    from cogs.tickets import TicketTypeSelect
+    select = TicketTypeSelect(ctx.guild_id)
+    select._values = ["Soporte Técnico"]
+    user = FakeUser(next_id()) # New user each time so the per-type cap never rejects
+    await select.callback(ctx.interaction(user, custom_id="select_ticket_type"))
+
+SCENARIOS = {
+    'recipient_select': recipient_select,
+    'letter_submit': letter_submit,
+    'view_letters_user': view_letters_user,
+    'view_letters_all': view_letters_all,
+    'read_letter': read_letter,
+    'letters_stats': letters_stats,
+    'bday_view_next': bday_view_next,
+    'check_birthdays': check_birthdays,
+    'ticket_open': ticket_open,
+}
+# Formats every letter into one reply; beyond this size it only measures string building
+MAX_LETTERS = {'view_letters_all': 100_000}
+
+async def measure(fn, ctx, iterations, alloc_iterations, warmup=3):
+    for _ in range(warmup):
+        await fn(ctx)
+
+    latencies = []
+    db_time = db_count = 0.0
+    for _ in range(iterations):
+        db_before = db_totals()
+        started = time.perf_counter()
+        await fn(ctx)
+        latencies.append(time.perf_counter() - started)
+        db_after = db_totals()
+        db_time += db_after[0] - db_before[0]
+        db_count += db_after[1] - db_before[1]
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(alloc_iterations):
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            await fn(ctx)
+            peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    ms = lambda s: round(s * 1000, 3)
+    return {
+        'iterations': iterations,
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p90_ms': ms(percentile(latencies, 0.90)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'max_ms': ms(latencies[-1]),
+        'mean_ms': ms(sum(latencies) / len(latencies)),
+        'db_ms_per_call': ms(db_time / iterations),
+        'db_ops_per_call': round(db_count / iterations, 2),
+        'alloc_peak_kb': round(sum(peaks) / len(peaks) / 1024, 1) if peaks else None,
+    }
+
+def prepare(sizes):
+    os.makedirs(os.environ['DB_DIR'], exist_ok=True)
+    synth.write_registry(os.environ['GUILD_REGISTRY_FILE'], [synth.guild_for(s) for s in synth.SIZES])
+    from utils_db import get_db_path
+    os.makedirs(os.environ['FILTER_DIR'], exist_ok=True)
+    for size in sizes:
+        started = time.perf_counter()
+        synth.build_db(get_db_path(synth.guild_for(size)), synth.SIZES[size])
+        # Every letter_submit is screened against a 1000-entry list
+        synth.write_filter(os.path.join(os.environ['FILTER_DIR'], f"letters_{synth.guild_for(size)}.txt"))
+        print(f"🧪 DB sintética {size}: {synth.SIZES[size]} cartas, {synth.BIRTHDAYS} cumpleaños ({time.perf_counter() - started:.1f}s)")
+
+async def run_all(sizes, only, iterations, alloc_iterations):
+    results = {}
+    for size in sizes:
+        ctx = Context(size)
+        results[size] = {}
+        for name, fn in SCENARIOS.items():
+            if only and name not in only:
+                continue
+            if ctx.letters > MAX_LETTERS.get(name, float('inf')):
+                results[size][name] = {'skipped': f"más de {MAX_LETTERS[name]} cartas"}
+                continue
+            results[size][name] = stats = await measure(fn, ctx, iterations, alloc_iterations)
+            print(f"  {size:>5} {name:<18} p50 {stats['p50_ms']:>9.3f} ms  p99 {stats['p99_ms']:>9.3f} ms  "
+                  f"db {stats['db_ms_per_call']:>8.3f} ms/{stats['db_ops_per_call']} ops  alloc {stats['alloc_peak_kb']} KB")
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=BENCH_DIR).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(current, baseline_path):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)['results']
+    print(f"\n📊 Comparación con {os.path.basename(baseline_path)} (negativo = más rápido)")
+    for size, scenarios in current.items():
+        for name, stats in scenarios.items():
+            old = baseline.get(size, {}).get(name)
+            if not old or 'p50_ms' not in old or 'p50_ms' not in stats:
+                continue
+            delta = lambda key: (stats[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            print(f"  {size:>5} {name:<18} p50 {delta('p50_ms'):+6.1f}%  p99 {delta('p99_ms'):+6.1f}%  db {delta('db_ms_per_call'):+6.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de handlers sobre bases de datos sintéticas")
+    parser.add_argument("--sizes", default="1k,100k", help=f"Tamaños de buzón: {','.join(synth.SIZES)}")
+    parser.add_argument("--only", default="", help=f"Escenarios: {','.join(SCENARIOS)}")
+    parser.add_argument("-n", "--iterations", type=int, default=50)
+    parser.add_argument("--alloc-iterations", type=int, default=10)
+    parser.add_argument("--out", default=None, help="Archivo JSON de salida (por defecto bench/results/<fecha>.json)")
+    parser.add_argument("--compare", default=None, help="JSON de una ejecución anterior")
+    args = parser.parse_args()
+
+    sizes = [s.strip().lower() for s in args.sizes.split(',') if s.strip()]
+    unknown = [s for s in sizes if s not in synth.SIZES]
+    if unknown:
+        parser.error(f"tamaño desconocido: {', '.join(unknown)}")
+    only = {s.strip() for s in args.only.split(',') if s.strip()}
+
+    from utils_log import setup_logging
+    setup_logging()
+    prepare(sizes)
+    results = asyncio.run(run_all(sizes, only, args.iterations, args.alloc_iterations))
+
+    out = args.out or os.path.join(BENCH_DIR, "results", datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({
+            'meta': {
+                'timestamp': datetime.datetime.now().isoformat(timespec="seconds"),
+                'revision': git_revision(),
+                'python': sys.version.split()[0],
+                'platform': platform.platform(),
+                'iterations': args.iterations,
+            },
+            'results': results,
+        }, f, indent=2, ensure_ascii=False)
+    print(f"\n💾 Resultados guardados en {out}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import datetime
+import json
+import os
+import random
+import sqlite3
+
+# Synthetic guild databases for the benchmarks. Each size gets its own guild ID so the
+# files can be generated once and reused between runs (bench/.data by default).
+
+SIZES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+BIRTHDAYS = 10_000
+BASE_GUILD_ID = 900_000_000_000_000_000
+USER_POOL = 50_000          # Distinct senders/recipients
+FIRST_USER_ID = 800_000_000_000_000_000
+BATCH = 20_000
+
+WORDS = ("amor amistad gracias feliz siempre contigo sonrisa abrazo mensaje corazón "
+         "especial recuerdo juntos increíble querido secreto día flores alegría").split()
+
+def guild_for(size_name: str) -> int:
+    return BASE_GUILD_ID + list(SIZES).index(size_name) + 1
+
+def user_id(n: int) -> int:
+    return FIRST_USER_ID + n
+
+def _letters(rng, count):
+    start = datetime.datetime(2026, 2, 1)
+    for _ in range(count):
+        sender = rng.randrange(USER_POOL)
+        recipient = rng.randrange(USER_POOL)
+        body = " ".join(rng.choices(WORDS, k=rng.randint(8, 120)))
+        ts = start + datetime.timedelta(seconds=rng.randrange(13 * 86400))
+        yield (user_id(sender), f"user{sender}", f"<@{user_id(recipient)}>", body, rng.random() < 0.6, ts.isoformat(" "))
+
+def _birthdays(rng, count):
+    for n in rng.sample(range(USER_POOL), count):
+        month = rng.randint(1, 12)
+        day = rng.randint(1, 28)
+        yield (user_id(n), day, month, rng.choice([None, rng.randint(1970, 2010)]))
+
+def build_db(path: str, letters: int, birthdays: int = BIRTHDAYS, seed: int = 14):
+    """Creates (or tops up) a guild DB with the app schema plus synthetic rows."""
+    from utils_db import init_db, get_db_path
+    import asyncio
+    guild_id = int(os.path.basename(path)[len("letters_"):-len(".db")])
+    assert get_db_path(guild_id) == path
+    asyncio.run(init_db([guild_id]))
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    try:
+        have = conn.execute("SELECT COUNT(*) FROM letters").fetchone()[0]
+        rows = _letters(rng, max(0, letters - have))
+        while True:
+            chunk = [row for _, row in zip(range(BATCH), rows)]
+            if not chunk:
+                break
+            conn.executemany(
+                "INSERT INTO letters (sender_id, sender_name, recipient, message, is_anonymous, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                chunk
+            )
+            conn.commit()
+        if conn.execute("SELECT COUNT(*) FROM birthdays").fetchone()[0] < birthdays:
+            conn.executemany("INSERT OR REPLACE INTO birthdays (user_id, day, month, year) VALUES (?, ?, ?, ?)", _birthdays(rng, birthdays))
+            conn.commit()
+    finally:
+        conn.close()
+
+def write_filter(path: str, entries: int = 1_000, seed: int = 3):
+    """Letter filter list of `entries` words (none of them in WORDS, so nothing gets held) and two regexes."""
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = {"".join(rng.choices(letters, k=rng.randint(4, 10))) for _ in range(entries)} - set(WORDS)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("# Bench filter list\nre:\\b\\d{9,}\\b\nre:https?://\\S+\n" + "\n".join(sorted(words)) + "\n")
+
+def write_registry(path: str, guild_ids):
+    """Registry with a birthday channel and tickets enabled for every synthetic guild."""
+    entries = [{
+        'id': gid,
+        'name': f"Bench {gid - BASE_GUILD_ID}",
+        'birthday_channel_id': gid + 1,
+        'enable_staff_applications': True,
+        'ticket_max_per_type': 1,
+    } for gid in guild_ids]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({'guilds': entries}, f)
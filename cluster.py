@@ -0,0 +1,256 @@
+import asyncio
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+from utils_log import get_logger
+from runner import BACKOFF_BASE, BACKOFF_MAX, STABLE_SECONDS, CRASH_LOOP_COUNT, CRASH_LOOP_WINDOW
+
+log = get_logger("cluster")
+
+# Multi-process mode: a supervisor spreads the guild bots over N worker processes.
+# Each worker runs main.main_runner() for its share of guilds and talks to the supervisor
+# over a multiprocessing Pipe. Messages are plain dicts:
+#   worker -> supervisor: {"op": "heartbeat"} | {"op": <controller op>, "id", "args"} | {"reply_to", "result"}
+#   supervisor -> worker: {"op": <controller op>, "id", "args"} | {"reply_to", "result"} | {"op": "shutdown"}
+
+HEARTBEAT_INTERVAL = 5    # Seconds between worker heartbeats
+HEARTBEAT_TIMEOUT = 30    # A worker silent for this long is considered hung
+SHUTDOWN_TIMEOUT = 20     # Seconds a worker gets to broadcast 'shutdown' and exit
+REQUEST_TIMEOUT = 30      # Seconds a fanned-out controller op may take per worker
+
+# Dead/hung workers are respawned with runner.py's policy, per worker: exponential backoff from
+# BACKOFF_BASE, and no more restarts for a worker that crashes CRASH_LOOP_COUNT times within
+# CRASH_LOOP_WINDOW. The supervisor exits once every worker has stopped that way.
+
+# Controller operations that may be called across processes
+CONTROLLER_OPS = ("broadcast_status",)
+
+def partition(guild_ids, workers):
+    """Round-robin split of guild IDs into `workers` non-empty groups."""
+    groups = [[] for _ in range(min(workers, len(guild_ids)))]
+    for i, guild_id in enumerate(sorted(guild_ids)):
+        groups[i % len(groups)].append(guild_id)
+    return groups
+
+def worker_main(index, guild_ids, conn):
+    """Entry point of a worker process."""
+    os.environ['BOT_WORKER'] = str(index) # Separate log file per worker
+    import main
+    try:
+        asyncio.run(main.main_runner(guild_ids=guild_ids, ipc=conn, worker_index=index))
+    except KeyboardInterrupt:
+        pass
+
+class WorkerLink:
+    """
+    Worker side of the pipe. Stands in for `bot.controller`: controller ops are forwarded to the
+    supervisor, which runs them on every worker (including this one) and returns the merged result.
+    """
+    def __init__(self, conn, controller, main_task):
+        self.conn = conn
+        self.controller = controller
+        self.main_task = main_task
+        self.pending = {}
+        self._ids = itertools.count(1)
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._heartbeat()), asyncio.create_task(self._reader())]
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+
+    def _send(self, msg):
+        self.conn.send(msg)
+
+    async def _heartbeat(self):
+        while True:
+            self._send({"op": "heartbeat", "bots": [b.bot_name for b in self.controller.bots if b.is_ready()]})
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    async def _reader(self):
+        while True:
+            try:
+                msg = await asyncio.to_thread(self.conn.recv)
+            except (EOFError, OSError):
+                log.error("🛑 [Cluster] Conexión con el supervisor perdida. Apagando worker...")
+                self.main_task.cancel()
+                return
+
+            if "reply_to" in msg:
+                future = self.pending.pop(msg["reply_to"], None)
+                if future and not future.done():
+                    future.set_result(msg["result"])
+            elif msg.get("op") == "shutdown":
+                self.main_task.cancel()
+                return
+            elif msg.get("op") in CONTROLLER_OPS:
+                asyncio.create_task(self._run_local(msg))
+
+    async def _run_local(self, msg):
+        try:
+            result = await getattr(self.controller, msg["op"])(*msg["args"])
+        except Exception as e:
+            result = [("worker", False, str(e))]
+        self._send({"reply_to": msg["id"], "result": result})
+
+    async def _request(self, op, *args):
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self._send({"op": op, "id": request_id, "args": args})
+        return await future
+
+    async def broadcast_status(self, status_type, activity_text, message_text=None):
+        return await self._request("broadcast_status", status_type, activity_text, message_text)
+
+class Supervisor:
+    """Starts the workers, relays controller ops between them and restarts dead or hung ones."""
+    def __init__(self, groups):
+        self.groups = groups
+        self.ctx = multiprocessing.get_context("spawn")
+        self.procs = {}       # index -> Process
+        self.conns = {}       # index -> Connection
+        self.last_seen = {}   # index -> monotonic time of last message
+        self.readers = {}     # index -> reader task
+        self.pending = {}     # request id -> future
+        self._ids = itertools.count(1)
+        self.stopping = False
+        self.started_at = {}  # index -> monotonic time of last spawn
+        self.consecutive = {} # index -> crashes in a row (reset after STABLE_SECONDS up)
+        self.crashes = {}     # index -> monotonic times of crashes within CRASH_LOOP_WINDOW
+        self.halted = set()   # workers left down after a crash loop
+
+    def start_worker(self, index):
+        parent_conn, child_conn = self.ctx.Pipe()
+        proc = self.ctx.Process(target=worker_main, args=(index, self.groups[index], child_conn), name=f"bot-worker-{index}")
+        proc.start()
+        child_conn.close()
+        self.procs[index] = proc
+        self.conns[index] = parent_conn
+        self.last_seen[index] = self.started_at[index] = time.monotonic()
+        self.readers[index] = asyncio.create_task(self._reader(index, parent_conn))
+        log.info("🧩 [Cluster] Worker %s iniciado (PID %s) con %s servidores", index, proc.pid, len(self.groups[index]))
+
+    def _send(self, index, msg):
+        try:
+            self.conns[index].send(msg)
+        except (OSError, KeyError):
+            pass
+
+    async def _reader(self, index, conn):
+        while True:
+            try:
+                msg = await asyncio.to_thread(conn.recv)
+            except (EOFError, OSError):
+                return
+            self.last_seen[index] = time.monotonic()
+
+            if msg.get("op") == "heartbeat":
+                continue
+            if "reply_to" in msg:
+                future = self.pending.pop(msg["reply_to"], None)
+                if future and not future.done():
+                    future.set_result(msg["result"])
+            elif msg.get("op") in CONTROLLER_OPS:
+                asyncio.create_task(self._fan_out(index, msg))
+
+    async def _ask(self, index, op, args):
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self._send(index, {"op": op, "id": request_id, "args": args})
+        try:
+            return await asyncio.wait_for(future, timeout=REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.pending.pop(request_id, None)
+            return [(f"worker {index}", False, f"timeout ({REQUEST_TIMEOUT}s)")]
+
+    async def _fan_out(self, origin, msg):
+        # Run the op on every live worker and hand the merged result back to the caller
+        live = [i for i, p in self.procs.items() if p.is_alive()]
+        results = await asyncio.gather(*(self._ask(i, msg["op"], msg["args"]) for i in live))
+        self._send(origin, {"reply_to": msg["id"], "result": [r for part in results for r in part]})
+
+    def _backoff(self, index):
+        """Records a crash of worker `index`; returns the restart delay, or None after a crash loop."""
+        now = time.monotonic()
+        if now - self.started_at[index] >= STABLE_SECONDS:
+            self.consecutive[index] = 0
+        self.consecutive[index] = self.consecutive.get(index, 0) + 1
+        self.crashes[index] = [t for t in self.crashes.get(index, []) if now - t < CRASH_LOOP_WINDOW] + [now]
+        if len(self.crashes[index]) >= CRASH_LOOP_COUNT:
+            return None
+        return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self.consecutive[index] - 1))
+
+    async def _restart(self, index, reason):
+        delay = self._backoff(index)
+        if delay is None:
+            log.error(f"🛑 [Cluster] Worker {index} {reason}: {len(self.crashes[index])} caídas en {CRASH_LOOP_WINDOW}s. "
+                      f"Sus {len(self.groups[index])} servidores quedan sin bot hasta reiniciar el sistema.")
+        else:
+            log.warning(f"⚠️ [Cluster] Worker {index} {reason}. Reiniciando en {delay} segundos...")
+        proc = self.procs[index]
+        if proc.is_alive():
+            proc.terminate()
+        await asyncio.to_thread(proc.join, 5)
+        self.conns[index].close()
+        self.readers[index].cancel()
+        if delay is None:
+            self.halted.add(index)
+            return
+        await asyncio.sleep(delay)
+        if not self.stopping:
+            self.start_worker(index)
+
+    async def run(self):
+        for index in range(len(self.groups)):
+            self.start_worker(index)
+
+        restarting = set()
+        try:
+            while True:
+                await asyncio.sleep(HEARTBEAT_INTERVAL)
+                now = time.monotonic()
+                if len(self.halted) == len(self.groups):
+                    log.error("🛑 [Cluster] Todos los workers en crash loop. Apagando supervisor...")
+                    return False
+                for index, proc in list(self.procs.items()):
+                    if index in restarting or index in self.halted:
+                        continue
+                    if not proc.is_alive():
+                        reason = f"terminó (código {proc.exitcode})"
+                    elif now - self.last_seen[index] > HEARTBEAT_TIMEOUT:
+                        reason = f"no responde desde hace {now - self.last_seen[index]:.0f}s"
+                    else:
+                        continue
+                    restarting.add(index)
+                    task = asyncio.create_task(self._restart(index, reason))
+                    task.add_done_callback(lambda _, i=index: restarting.discard(i))
+        finally:
+            await self.shutdown()
+
+    async def shutdown(self):
+        self.stopping = True
+        for index in self.procs:
+            self._send(index, {"op": "shutdown"})
+        for index, proc in self.procs.items():
+            await asyncio.to_thread(proc.join, SHUTDOWN_TIMEOUT)
+            if proc.is_alive():
+                proc.terminate()
+
+def run_supervisor(guild_ids, workers):
+    groups = partition(guild_ids, workers)
+    if not groups:
+        log.error("❌ [Cluster] No hay servidores configurados: ningún worker que iniciar.")
+        sys.exit(1)
+    log.info("🧩 [Cluster] Repartiendo %s servidores en %s procesos", len(guild_ids), len(groups))
+    supervisor = Supervisor(groups)
+    try:
+        if asyncio.run(supervisor.run()) is False:
+            sys.exit(1)
+    except KeyboardInterrupt:
+        pass
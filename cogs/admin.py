@@ -1,28 +1,85 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
+import io
 import os
+from utils_db import clean_id_list, get_db_path, get_guild_config
+from utils_backup import backup_guild, backup_settings, list_backups, newest_backup_age, BACKUP_SLACK
+import utils_retention
+from utils_log import get_logger
+import utils_profile
+import utils_loopmon
+
+log = get_logger("admin")
 
 class AdminCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        interval_hours, _, _ = backup_settings()
+        if interval_hours and getattr(bot, 'target_guild_id', None):
+            self.scheduled_backup.change_interval(hours=interval_hours)
+            self.scheduled_backup.start()
+        retention_hours, _ = utils_retention.retention_settings()
+        if retention_hours and getattr(bot, 'target_guild_id', None):
+            self.scheduled_compaction.change_interval(hours=retention_hours)
+            self.scheduled_compaction.start()
+
+    def cog_unload(self):
+        self.scheduled_backup.cancel()
+        self.scheduled_compaction.cancel()
+
+    @tasks.loop(hours=24)
+    async def scheduled_backup(self):
+        # The loop's first run is at startup: after a restart (runner.py, crash backoff, cog reload)
+        # a recent snapshot already covers this interval
+        interval_hours, _, _ = backup_settings()
+        age = newest_backup_age(self.bot.target_guild_id)
+        if age is not None and age < interval_hours * 3600 - BACKUP_SLACK:
+            log.debug("💾 [%s] Backup omitido: el último tiene %.1f h", self.bot.bot_name, age / 3600)
+            return
+        try:
+            path, elapsed, removed = await backup_guild(self.bot.target_guild_id)
+            if path:
+                log.info("💾 [%s] Backup creado en %.1fs: %s (%s antiguos eliminados)", self.bot.bot_name, elapsed, os.path.basename(path), removed)
+        except Exception as e:
+            log.error(f"❌ [{self.bot.bot_name}] Error creando backup: {e}")
+
+    @tasks.loop(hours=24)
+    async def scheduled_compaction(self):
+        guild = self.bot.get_guild(self.bot.target_guild_id)
+        if guild is None:
+            return
+        try:
+            summary = await utils_retention.compact_guild(guild)
+            if summary:
+                log.info("🧹 [%s] Retención: %s", self.bot.bot_name, utils_retention.describe(summary), extra={"guild": guild.id})
+        except Exception as e:
+            log.error(f"❌ [{self.bot.bot_name}] Error en la compactación: {e}", extra={"guild": guild.id})
+
+    @scheduled_compaction.before_loop
+    async def before_compaction(self):
+        await self.bot.wait_until_ready()
+
+    # Member events drive birthday retention (members intent, requested by utils_members.intents_for)
+    @commands.Cog.listener()
+    async def on_raw_member_remove(self, payload):
+        if payload.guild_id == self.bot.target_guild_id:
+            utils_retention.note_departure(payload.guild_id, payload.user.id)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        if member.guild.id == self.bot.target_guild_id:
+            utils_retention.note_return(member.guild.id, member.id)
 
     def is_admin(self, interaction: discord.Interaction) -> bool:
         # Check if user is in the admin list of the current guild
-        admin_id_str = ""
-        if interaction.guild_id == int(os.getenv('ZEROP_GUILD_ID', 0)):
-            admin_id_str = os.getenv('ZEROP_ADMIN_USER_ID', '')
-        elif interaction.guild_id == int(os.getenv('IGLESIA_GUILD_ID', 0)):
-            admin_id_str = os.getenv('IGLESIA_ADMIN_USER_ID', '')
+        guild_conf = get_guild_config(interaction.guild_id)
+        admin_ids = guild_conf.get('admin_ids') if guild_conf else []
         
         # Also check global backup
-        if not admin_id_str:
-            admin_id_str = os.getenv('ADMIN_USER_ID', '')
-
-        if not admin_id_str:
-            return False
+        if not admin_ids:
+            admin_ids = clean_id_list(os.getenv('ADMIN_USER_ID', ''))
 
-        admin_ids = [int(x.strip()) for x in admin_id_str.split(',') if x.strip()]
         return interaction.user.id in admin_ids
 
     @app_commands.command(name="estado", description="[ADMIN] Cambiar estado global del bot y anunciar")
@@ -45,20 +102,137 @@ class AdminCommands(commands.Cog):
         await interaction.response.defer(ephemeral=True)
 
         status_type = tipo.value
-        activity_text = texto_actividad if texto_actividad else "Comunidad Zero"
+        guild_conf = get_guild_config(interaction.guild_id)
+        activity_text = texto_actividad if texto_actividad else (guild_conf['name'] if guild_conf else interaction.guild.name)
 
         # Broadcast update via controller
-        await self.bot.controller.broadcast_status(status_type, activity_text, mensaje)
+        results = await self.bot.controller.broadcast_status(status_type, activity_text, mensaje)
+
+        lines = [f"{'✅' if ok else '❌'} {name}: {detail}" for name, ok, detail in results]
+        ok_count = sum(1 for _, ok, _ in results if ok)
+        await interaction.followup.send(
+            f"📢 Estado global **{tipo.name}** aplicado en {ok_count}/{len(results)} bots.\n" + "\n".join(lines),
+            ephemeral=True
+        )
+
+
+    @app_commands.command(name="backup_now", description="[ADMIN] Crear un backup de la base de datos del servidor")
+    async def backup_now(self, interaction: discord.Interaction):
+        if not self.is_admin(interaction):
+            await interaction.response.send_message("❌ No tienes permisos para usar este comando.", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        try:
+            path, elapsed, removed = await backup_guild(interaction.guild_id)
+        except Exception as e:
+            await interaction.followup.send(f"❌ Error creando el backup: {e}", ephemeral=True)
+            return
+
+        if not path:
+            await interaction.followup.send("❌ No existe base de datos para este servidor.", ephemeral=True)
+            return
+
+        size_kb = os.path.getsize(path) // 1024
+        total = len(list_backups(interaction.guild_id))
+        await interaction.followup.send(
+            f"💾 **Backup creado** en {elapsed:.1f}s: `{os.path.basename(path)}` ({size_kb} KB)\n"
+            f"🗂️ Backups guardados: {total} • Eliminados por rotación: {removed}",
+            ephemeral=True
+        )
+
+    @app_commands.command(name="compact_now", description="[ADMIN] Aplicar la retención y compactar la base de datos")
+    async def compact_now(self, interaction: discord.Interaction):
+        if not self.is_admin(interaction):
+            await interaction.response.send_message("❌ No tienes permisos para usar este comando.", ephemeral=True)
+            return
 
-        await interaction.followup.send(f"✅ Estado global actualizado a **{tipo.name}** en todos los bots.", ephemeral=True)
+        await interaction.response.defer(ephemeral=True)
+        db_path = get_db_path(interaction.guild_id)
+        size_before = os.path.getsize(db_path) if os.path.exists(db_path) else 0
+        try:
+            summary = await utils_retention.compact_guild(interaction.guild)
+        except Exception as e:
+            await interaction.followup.send(f"❌ Error compactando: {e}", ephemeral=True)
+            return
+
+        if not summary:
+            await interaction.followup.send("❌ No existe base de datos para este servidor.", ephemeral=True)
+            return
+
+        size_after = os.path.getsize(db_path)
+        await interaction.followup.send(
+            f"🧹 **Retención aplicada**: {utils_retention.describe(summary)}\n"
+            f"💽 Tamaño: {size_before // 1024} KB → {size_after // 1024} KB",
+            ephemeral=True
+        )
+
+    @app_commands.command(name="profile", description="[ADMIN] Perfilar el proceso en vivo (CPU o memoria)")
+    @app_commands.choices(modo=[
+        app_commands.Choice(name="CPU 🔥", value="cpu"),
+        app_commands.Choice(name="Memoria 🧠", value="memory")
+    ])
+    @app_commands.describe(segundos=f"Duración de la captura (1-{utils_profile.MAX_SECONDS})", top="Entradas en el resumen")
+    async def profile(self, interaction: discord.Interaction, modo: app_commands.Choice[str], segundos: app_commands.Range[int, 1, utils_profile.MAX_SECONDS] = 10, top: app_commands.Range[int, 5, 40] = 15):
+        if not self.is_admin(interaction):
+            await interaction.response.send_message("❌ No tienes permisos para usar este comando.", ephemeral=True)
+            return
+
+        if utils_profile.is_busy():
+            await interaction.response.send_message("⏳ Ya hay una captura en curso. Espera a que termine.", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        log.info("🔬 Perfilado %s de %ss iniciado por %s", modo.value, segundos, interaction.user, extra={"guild": interaction.guild_id, "command": "profile"})
+        try:
+            if modo.value == "cpu":
+                report, data = await utils_profile.profile_cpu(segundos, top)
+                filename = "cpu_profile.folded.txt"
+            else:
+                report, data = await utils_profile.profile_memory(segundos, top)
+                filename = "memory_diff.txt"
+        except Exception as e:
+            log.exception(f"❌ Error perfilando: {e}")
+            await interaction.followup.send(f"❌ Error durante la captura: {e}", ephemeral=True)
+            return
+
+        if len(report) > 1900:
+            report = report[:1900] + "\n…"
+        files = [discord.File(io.BytesIO(data), filename=filename)] if data else []
+        await interaction.followup.send(f"🔬 **Perfil {modo.name}**\n```\n{report}\n```", files=files, ephemeral=True)
+
+    @app_commands.command(name="loop_stats", description="[ADMIN] Lag del event loop y bloqueos recientes")
+    async def loop_stats(self, interaction: discord.Interaction):
+        if not self.is_admin(interaction):
+            await interaction.response.send_message("❌ No tienes permisos para usar este comando.", ephemeral=True)
+            return
+
+        monitor = utils_loopmon.monitor
+        if monitor is None:
+            await interaction.response.send_message("ℹ️ El monitor del event loop está desactivado (LOOP_LAG_INTERVAL=0).", ephemeral=True)
+            return
 
+        s = monitor.summary()
+        embed = discord.Embed(title="⏱️ Event Loop", color=discord.Color.green() if s['p99'] <= monitor.slo else discord.Color.orange())
+        embed.add_field(name="Último minuto", value=f"p50 {s['p50'] * 1000:.1f} ms • p99 {s['p99'] * 1000:.1f} ms", inline=False)
+        embed.add_field(name="Últimos 10 min", value=f"p99 {s['p99_10m'] * 1000:.1f} ms • máx {s['max_10m'] * 1000:.1f} ms", inline=False)
+        embed.add_field(name="SLO", value=f"{monitor.slo * 1000:.0f} ms", inline=True)
+        embed.add_field(name="Bloqueos registrados", value=str(len(s['slow'])), inline=True)
+        for event in s['slow'][-5:][::-1]:
+            where = event.stack.strip().splitlines()[-2:] if event.stack else []
+            embed.add_field(
+                name=f"🐢 {event.task} • {(event.duration or 0) * 1000:.0f} ms",
+                value=f"<t:{int(event.started)}:R>\n```\n" + "\n".join(where)[-500:] + "\n```",
+                inline=False
+            )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
 
     @commands.Cog.listener()
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
         # 1. Check if it's a Bridge Message (from Webhook)
         if message.webhook_id and message.content.startswith("[LINK_BYPASS]"):
-            print(f"🌉 Bridge Message Detected in {message.channel}")
+            log.info("🌉 Bridge Message Detected in %s", message.channel, extra={"guild": message.guild.id if message.guild else None})
             # 2. Extract Data
             try:
                 # Content format: [LINK_BYPASS] **Original:** <url>\n**Destino (Enc):** ||<base64>||
@@ -73,7 +247,7 @@ class AdminCommands(commands.Cog):
                 final_url = None
 
                 if enc_line:
-                    print(f"   ↳ Encrypted line found: {enc_line}")
+                    log.debug("   ↳ Encrypted line found: %s", enc_line)
                     # Clean up wrappers like || or spaces
                     cleaned_enc = enc_line.replace("**Destino (Enc):**", "").replace("||", "").strip()
                     
@@ -81,9 +255,9 @@ class AdminCommands(commands.Cog):
                         # Decode Base64
                         decoded_bytes = base64.b64decode(cleaned_enc)
                         final_url = decoded_bytes.decode('utf-8')
-                        print(f"   ↳ Decoded URL: {final_url}")
+                        log.debug("   ↳ Decoded URL: %s", final_url)
                     except Exception as e:
-                        print(f"Error decoding base64: {e}")
+                        log.error(f"Error decoding base64: {e}")
 
                 # OLD FORMAT FALLBACK: Check for "Destino:" with explicit URL
                 if not final_url:
@@ -104,34 +278,35 @@ class AdminCommands(commands.Cog):
                         match_user = re.search(r'User:.*?(\d+)', user_line)
                         if match_user:
                             target_id = int(match_user.group(1))
-                            print(f"   ↳ Explicit Target User ID found: {target_id}")
+                            log.debug("   ↳ Explicit Target User ID found: %s", target_id)
 
                     # Fallback to Admin ID config
                     if not target_id:
-                        admin_id_str = os.getenv('ADMIN_USER_ID', '') or os.getenv('ZEROP_ADMIN_USER_ID', '')
-                        print(f"   ↳ Target Admin IDs (Fallback): {admin_id_str}")
-                        if admin_id_str:
-                            target_id = int(admin_id_str.split(',')[0].strip())
+                        guild_conf = get_guild_config(message.guild.id) if message.guild else None
+                        admin_ids = clean_id_list(os.getenv('ADMIN_USER_ID', '')) or (guild_conf['admin_ids'] if guild_conf else [])
+                        log.debug("   ↳ Target Admin IDs (Fallback): %s", admin_ids)
+                        if admin_ids:
+                            target_id = admin_ids[0]
                     
                     if not target_id:
-                        print("   ❌ No target user found.")
+                        log.error("   ❌ No target user found.")
                         return
 
                     # Get user object
                     target_user = self.bot.get_user(target_id) or await self.bot.fetch_user(target_id)
                     
                     if target_user:
-                        print(f"   ↳ Sending DM to {target_user}")
+                        log.debug("   ↳ Sending DM to %s", target_user)
                         embed = discord.Embed(title="🔓 Link Desbloqueado", description=f"Aquí tienes tu link:\n\n👉 **[Clic para abrir]({final_url})**\n`{final_url}`", color=discord.Color.green())
                         embed.set_footer(text="Enviado desde ZeroBot Web Tools")
                         await target_user.send(embed=embed)
                         
                         await message.add_reaction("✅")
                     else:
-                        print(f"   ❌ Could not find admin user {target_id}")
+                        log.error(f"   ❌ Could not find admin user {target_id}")
 
             except Exception as e:
-                print(f"Error in Link Bridge: {e}")
+                log.exception(f"Error in Link Bridge: {e}")
 
 async def setup(bot):
     await bot.add_cog(AdminCommands(bot))
@@ -1,16 +1,24 @@
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands
-import aiosqlite
 import datetime
 import os
 from dotenv import load_dotenv
-from utils_db import get_db_path, load_server_config
+from utils_db import get_db_path, load_server_config, connect as db_connect
+from utils_ratelimit import CooldownView
+from utils_metrics import InstrumentedModal
+import utils_outbound as outbound
+from utils_members import resolve_members
+from utils_resources import resources_for
+from utils_log import get_logger
+
+log = get_logger("birthdays")
 
 load_dotenv()
 BIRTHDAY_CHANNEL_ID = os.getenv('BIRTHDAY_CHANNEL_ID')
+BIRTHDAY_ROLE_NAME = "Notificaciones de Cumpleaños" # Mentioned in the daily announcement
 
-class BirthdayModal(discord.ui.Modal, title="Registrar Cumpleaños 🎂"):
+class BirthdayModal(InstrumentedModal, title="Registrar Cumpleaños 🎂"):
     day = discord.ui.TextInput(
         label="Día",
         placeholder="Ej: 15",
@@ -56,7 +64,7 @@ class BirthdayModal(discord.ui.Modal, title="Registrar Cumpleaños 🎂"):
 
         db_path = get_db_path(interaction.guild_id)
 
-        async with aiosqlite.connect(db_path) as db:
+        async with db_connect(db_path) as db:
             await db.execute("""
                 INSERT OR REPLACE INTO birthdays (user_id, day, month, year)
                 VALUES (?, ?, ?, ?)
@@ -65,7 +73,10 @@ class BirthdayModal(discord.ui.Modal, title="Registrar Cumpleaños 🎂"):
 
         await interaction.response.send_message(f"✅ **¡Guardado!** Tu cumpleaños se ha registrado para el **{d}/{m}**.", ephemeral=True)
 
-class BirthdayView(discord.ui.View):
+class BirthdayView(CooldownView):
+    # "Ver Próximos" looks members up over the gateway; "Alertas" edits member roles
+    cooldowns = {"btn_bday_view": (3, 30), "btn_bday_role": (2, 30)}
+
     def __init__(self):
         super().__init__(timeout=None)
 
@@ -84,8 +95,9 @@ class BirthdayView(discord.ui.View):
         
         db_path = get_db_path(interaction.guild_id)
 
-        async with aiosqlite.connect(db_path) as db:
-            async with db.execute("SELECT user_id, day, month FROM birthdays") as cursor:
+        async with db_connect(db_path) as db:
+            # Members who left are archived (utils_retention.py) and never shown
+            async with db.execute("SELECT user_id, day, month FROM birthdays WHERE departed_at IS NULL") as cursor:
                 all_bdays = await cursor.fetchall()
 
         if not all_bdays:
@@ -107,20 +119,15 @@ class BirthdayView(discord.ui.View):
             except ValueError:
                 continue # Skip invalid dates (leap years etc)
 
-        # Sort by days until
+        # Sort by days until; a few spares stand in for anyone who left since the last reconciliation
         upcoming.sort(key=lambda x: x[1])
-        upcoming = upcoming[:5] # Top 5
+        upcoming = upcoming[:10]
 
         desc = ""
+        members = await resolve_members(interaction.guild, [uid for uid, _, _ in upcoming])
+        upcoming = [entry for entry in upcoming if entry[0] in members][:5] # Top 5
         for uid, days, date_obj in upcoming:
-            user = interaction.guild.get_member(uid)
-            if not user:
-                try:
-                    user = await interaction.client.fetch_user(uid)
-                except:
-                    user = None
-            
-            name = f"**{user.display_name}**" if user else f"Usuario {uid}"
+            name = f"**{members[uid].display_name}**"
             
             if days == 0:
                 time_str = "**¡ES HOY!** 🎉"
@@ -142,20 +149,21 @@ class BirthdayView(discord.ui.View):
 
         db_path = get_db_path(interaction.guild_id)
 
-        async with aiosqlite.connect(db_path) as db:
+        async with db_connect(db_path) as db:
             await db.execute("DELETE FROM birthdays WHERE user_id = ?", (interaction.user.id,))
             await db.commit()
         await interaction.response.send_message("🗑️ **Datos eliminados.** Ya no recibirás felicitaciones.", ephemeral=True)
 
     @discord.ui.button(label="Alertas", style=discord.ButtonStyle.secondary, emoji="🔔", custom_id="btn_bday_role")
     async def toggle_alert(self, interaction: discord.Interaction, button: discord.ui.Button):
-        role_name = "Notificaciones de Cumpleaños"
-        role = discord.utils.get(interaction.guild.roles, name=role_name)
+        resources = resources_for(interaction.client, interaction.guild)
+        role = resources.role_named(BIRTHDAY_ROLE_NAME)
         
         if not role:
             # Create role if it doesn't exist (Requires Manage Roles)
             try:
-                role = await interaction.guild.create_role(name=role_name, mentionable=True, color=discord.Color.gold())
+                role = await interaction.guild.create_role(name=BIRTHDAY_ROLE_NAME, mentionable=True, color=discord.Color.gold())
+                resources.note_role(role)
             except discord.Forbidden:
                 await interaction.response.send_message("⛔ No tengo permisos para crear/gestionar el rol de alertas.", ephemeral=True)
                 return
@@ -174,6 +182,7 @@ class Birthdays(commands.Cog):
 
     def cog_unload(self):
         self.check_birthdays.cancel()
+        outbound.cancel(self.bot, tag="birthdays")
 
     @app_commands.command(name="setup_birthdays", description="Admin: Configura el panel de cumpleaños")
     @app_commands.checks.has_permissions(administrator=True)
@@ -213,7 +222,7 @@ class Birthdays(commands.Cog):
             await interaction.response.send_message(f"❌ Fecha inválida: {day}/{month}", ephemeral=True)
             return
 
-        async with aiosqlite.connect(db_path) as db:
+        async with db_connect(db_path) as db:
             await db.execute("""
                 INSERT OR REPLACE INTO birthdays (user_id, day, month, year)
                 VALUES (?, ?, ?, ?)
@@ -244,8 +253,8 @@ class Birthdays(commands.Cog):
                 if not os.path.exists(db_path):
                     continue
 
-                async with aiosqlite.connect(db_path) as db:
-                    async with db.execute("SELECT user_id FROM birthdays WHERE day = ? AND month = ?", (today.day, today.month)) as cursor:
+                async with db_connect(db_path) as db:
+                    async with db.execute("SELECT user_id FROM birthdays WHERE day = ? AND month = ? AND departed_at IS NULL", (today.day, today.month)) as cursor:
                         birthday_users = await cursor.fetchall()
                 
                 if birthday_users:
@@ -253,24 +262,27 @@ class Birthdays(commands.Cog):
                     
                     if channel:
                         # Get Role for Mention
-                        role = discord.utils.get(guild.roles, name="Notificaciones de Cumpleaños")
+                        role = resources_for(self.bot, guild).role_named(BIRTHDAY_ROLE_NAME)
                         role_mention = role.mention if role else "@here"
 
-                        mentions = []
-                        for (uid,) in birthday_users:
-                            member = guild.get_member(uid)
-                            if member:
-                                mentions.append(member.mention)
+                        # Only people still in the server (looked up on demand: members are not chunked by default)
+                        members = await resolve_members(guild, [uid for (uid,) in birthday_users])
+                        mentions = [member.mention for member in members.values()]
                         
                         if mentions:
                             users_str = ", ".join(mentions)
-                            await channel.send(f"🎉 {role_mention} **¡HOY ES UN DÍA ESPECIAL!** 🎉\n\nDeseadle un muy feliz cumpleaños a {users_str} 🎂🥳\n¡Que paséis un día genial!")
+                            content = f"🎉 {role_mention} **¡HOY ES UN DÍA ESPECIAL!** 🎉\n\nDeseadle un muy feliz cumpleaños a {users_str} 🎂🥳\n¡Que paséis un día genial!"
+                            # Bulk work: queued behind whatever users and staff are waiting for
+                            await outbound.submit(self.bot, outbound.BULK, lambda: channel.send(content),
+                                                  guild_id=guild.id, route=outbound.route_for(channel), tag="birthdays")
             except Exception as e:
-                print(f"Error checking birthdays for guild {guild.name} ({guild.id}): {e}")
+                log.error(f"Error checking birthdays for guild {guild.name} ({guild.id}): {e}", extra={"guild": guild.id})
 
     @check_birthdays.before_loop
     async def before_check(self):
         await self.bot.wait_until_ready()
 
 async def setup(bot):
+    # Persistent views live with their cog so a hot reload re-registers the new classes
     await bot.add_cog(Birthdays(bot))
+    bot.add_view(BirthdayView())
@@ -1,13 +1,36 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import aiosqlite
+import asyncio
 import datetime
 import re
 import os
-from utils_db import get_db_path
+from utils_db import get_db_path, get_guild_config, connect as db_connect
+from utils_ratelimit import CooldownView
+from utils_metrics import InstrumentedView, InstrumentedModal, REGISTRY
+from utils_filter import get_filter, encode_spans, decode_spans, highlight, CLEAN, HELD, APPROVED
+import utils_audit as audit
+import utils_letterstats as letterstats
+import utils_outbound as outbound
+from utils_log import get_logger
 from typing import Literal
 
+log = get_logger("letters")
+
+HELD_LIST_MAX = 50 # Letters listed by /held_letters (oldest first)
+
+def _count_held(stage, amount=1):
+    if amount:
+        REGISTRY.counter("letters_held_total", {'stage': stage}, "Letters held for review by the content filter").inc(amount)
+
+def _is_letters_admin(interaction: discord.Interaction) -> bool:
+    # Same rule as /view_letters: the global ADMIN_USER_ID list plus the guild's admin_ids
+    allowed_ids = [aid.strip() for aid in (os.getenv('ADMIN_USER_ID') or "").split(',') if aid.strip()]
+    guild_conf = get_guild_config(interaction.guild_id)
+    if guild_conf and guild_conf.get('admin_ids'):
+        allowed_ids.extend([str(x) for x in guild_conf.get('admin_ids')])
+    return str(interaction.user.id) in allowed_ids
+
 # --- UI Components ---
 
 class RecipientSelect(discord.ui.UserSelect):
@@ -23,7 +46,7 @@ class RecipientSelect(discord.ui.UserSelect):
 
         db_path = get_db_path(interaction.guild_id)
         
-        async with aiosqlite.connect(db_path) as db:
+        async with db_connect(db_path) as db:
             async with db.execute("SELECT COUNT(*) FROM letters WHERE sender_id = ?", (interaction.user.id,)) as cursor:
                 count_row = await cursor.fetchone()
                 current_count = count_row[0] if count_row else 0
@@ -35,12 +58,12 @@ class RecipientSelect(discord.ui.UserSelect):
         target_user = self.values[0]
         await interaction.response.send_modal(LetterModal(self.is_anonymous, target_user))
 
-class RecipientView(discord.ui.View):
+class RecipientView(InstrumentedView):
     def __init__(self, is_anonymous: bool):
         super().__init__(timeout=60)
         self.add_item(RecipientSelect(is_anonymous))
 
-class LetterModal(discord.ui.Modal):
+class LetterModal(InstrumentedModal):
     def __init__(self, is_anonymous: bool, target_user: discord.User):
         title = "Escribiendo a: " + target_user.display_name
         super().__init__(title=title[:45])
@@ -69,11 +92,18 @@ class LetterModal(discord.ui.Modal):
 
         db_path = get_db_path(interaction.guild_id)
 
-        async with aiosqlite.connect(db_path) as db:
+        # Screened before storing: a flagged letter is kept out of the release until a moderator approves it
+        letter_filter = get_filter(interaction.guild_id)
+        spans = letter_filter.scan(message_text) if letter_filter else []
+        if spans:
+            _count_held("submit")
+
+        async with db_connect(db_path) as db:
             await db.execute("""
-                INSERT INTO letters (sender_id, sender_name, recipient, message, is_anonymous, timestamp)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (sender_id, sender_name, recipient_text, message_text, self.is_anonymous, timestamp))
+                INSERT INTO letters (sender_id, sender_name, recipient, message, is_anonymous, timestamp, moderation, flags)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (sender_id, sender_name, recipient_text, message_text, self.is_anonymous, timestamp,
+                  HELD if spans else CLEAN, encode_spans(spans) if spans else None))
             await db.commit()
 
         # Log logic
@@ -92,35 +122,30 @@ class LetterModal(discord.ui.Modal):
             embed.add_field(name="Tipo", value="Anónima 🕵️" if self.is_anonymous else "Firmada ✍️", inline=True)
             embed.add_field(name="Mensaje", value=message_text, inline=False)
             embed.add_field(name="Servidor", value=f"{interaction.guild.name} ({interaction.guild_id})", inline=False)
+            if spans:
+                embed.add_field(name="🚩 Retenida", value=highlight(message_text, spans, 80)[:1024], inline=False)
+                embed.color = discord.Color.dark_red()
             embed.timestamp = timestamp
 
-            # Use bot to send logs
-            for rid in recipients:
-                try:
-                    target = interaction.client.get_channel(rid) or interaction.client.get_user(rid)
-                    if not target:
-                        try:
-                            target = await interaction.client.fetch_user(rid)
-                        except:
-                            continue
-                    
-                    if target:
-                        await target.send(embed=embed)
-
-                except Exception as e:
-                    print(f"Error sending log to {rid}: {e}")
+            # Queued for the guild's LogBot (keeps audit traffic off this bot's rate limits)
+            await audit.publish(interaction.guild_id, "letter", recipients, embed=embed)
 
         confirm_embed = discord.Embed(
             title="¡Carta Guardada! 💌",
             description=f"Carta lista para **{self.target_user.display_name}**. Se enviará el 14.",
             color=discord.Color.green()
         )
+        if spans:
+            confirm_embed.description += "\n🔎 Quedó pendiente de revisión por el equipo antes de enviarse."
         if self.is_anonymous:
             confirm_embed.set_footer(text="Tu identidad está segura 🤫")
         
         await interaction.followup.send(embed=confirm_embed, ephemeral=True)
 
-class MailboxView(discord.ui.View):
+class MailboxView(CooldownView):
+    # Release walks the whole mailbox and DMs every recipient
+    cooldowns = {"btn_anon": (5, 60), "btn_signed": (5, 60), "btn_release": (1, 60)}
+
     def __init__(self):
         super().__init__(timeout=None)
 
@@ -148,20 +173,43 @@ class MailboxView(discord.ui.View):
 
         db_path = get_db_path(interaction.guild_id)
         
-        async with aiosqlite.connect(db_path) as db:
-            async with db.execute("SELECT sender_name, recipient, message, is_anonymous FROM letters") as cursor:
+        async with db_connect(db_path) as db:
+            async with db.execute("SELECT id, sender_name, recipient, message, is_anonymous, moderation FROM letters WHERE moderation != ?", (HELD,)) as cursor:
                 letters = await cursor.fetchall()
-                
+
+            # One pass of the current list over everything not yet screened by it (the list may have
+            # changed since the letters were written); approved letters are not screened again
+            letter_filter = get_filter(interaction.guild_id)
+            if letter_filter and letters:
+                flagged = await asyncio.to_thread(letter_filter.screen, [(row[0], row[3] or "") for row in letters if row[5] != APPROVED])
+                if flagged:
+                    await db.executemany("UPDATE letters SET moderation = ?, flags = ? WHERE id = ?",
+                                         [(HELD, encode_spans(spans), letter_id) for letter_id, spans in flagged])
+                    await db.commit()
+                    _count_held("release", len(flagged))
+                    held_ids = {letter_id for letter_id, _ in flagged}
+                    letters = [row for row in letters if row[0] not in held_ids]
+
+            async with db.execute("SELECT COUNT(*) FROM letters WHERE moderation = ?", (HELD,)) as cursor:
+                (held_count,) = await cursor.fetchone()
+
+        held_note = f"\n🚩 Retenidas para revisión: {held_count} (usa `/held_letters`)" if held_count else ""
         if not letters:
-            await interaction.followup.send("¡No hay cartas en el buzón! 😢", ephemeral=True)
+            await interaction.followup.send(f"¡No hay cartas en el buzón! 😢{held_note}", ephemeral=True)
             return
 
         await interaction.followup.send(f"🚀 Procesando {len(letters)} cartas...", ephemeral=True)
-        
-        sent_count = 0
+
+        async def deliver(user_id, dm_embed):
+            user = interaction.client.get_user(user_id) or await interaction.client.fetch_user(user_id)
+            await user.send(embed=dm_embed)
+
+        # DMs go through the bot's outbound scheduler as bulk work, so ticket replies and status
+        # edits keep going out while the release drains
+        deliveries = []
         failed_count = 0
 
-        for sender_name, recipient, message, is_anonymous in letters:
+        for _, sender_name, recipient, message, is_anonymous, _ in letters:
             title = "💌 Carta de San Valentín"
             color = discord.Color.red() if is_anonymous else discord.Color.pink()
             author_text = "Admirador Secreto 🕵️" if is_anonymous else sender_name
@@ -172,23 +220,24 @@ class MailboxView(discord.ui.View):
             
             match = re.search(r'<@!?(\d+)>', recipient)
             if match:
-                user_id = int(match.group(1))
-                try:
-                    user = interaction.client.get_user(user_id) or await interaction.client.fetch_user(user_id)
-                    if user:
-                        dm_embed = embed.copy()
-                        dm_embed.description = f"**¡Has recibido una carta!**\n\n{message}"
-                        await user.send(embed=dm_embed)
-                        sent_count += 1
-                    else:
-                        failed_count += 1
-                except:
-                    failed_count += 1
+                dm_embed = embed.copy()
+                dm_embed.description = f"**¡Has recibido una carta!**\n\n{message}"
+                deliveries.append(outbound.submit(interaction.client, outbound.BULK, lambda uid=int(match.group(1)), e=dm_embed: deliver(uid, e),
+                                                  guild_id=interaction.guild_id, route=f"dm:{match.group(1)}", tag="release"))
             else:
                 failed_count += 1
 
+        results = await asyncio.gather(*deliveries, return_exceptions=True)
+        sent_count = sum(1 for r in results if not isinstance(r, BaseException))
+        failed_count += len(results) - sent_count
+
+        report = f"📊 **Reporte de entrega:**\n✅ Entregadas: {sent_count}\n❌ Fallidas: {failed_count}{held_note}"
         await interaction.channel.send("✅ **¡Se han enviado todas las cartas a sus correspondientes destinos!** 📬💕")
-        await interaction.followup.send(f"📊 **Reporte de entrega:**\n✅ Entregadas: {sent_count}\n❌ Fallidas: {failed_count}", ephemeral=True)
+        if interaction.is_expired():
+            # A long release outlives the 15-minute interaction token: the report goes to the channel
+            await interaction.channel.send(report)
+        else:
+            await interaction.followup.send(report, ephemeral=True)
 
 class Letters(commands.Cog):
     def __init__(self, bot):
@@ -224,13 +273,16 @@ class Letters(commands.Cog):
 
         db_path = get_db_path(interaction.guild_id)
 
-        async with aiosqlite.connect(db_path) as db:
+        async with db_connect(db_path) as db:
             await db.execute("DELETE FROM letters")
             await db.commit()
             await db.execute("VACUUM")
             await db.commit()
-        
-        await interaction.followup.send("🗑️ **¡Buzón vaciado!** Se han eliminado todas las cartas.", ephemeral=True)
+
+        # A release still draining would deliver letters that no longer exist
+        cancelled = outbound.cancel(interaction.client, tag="release", guild_id=interaction.guild_id)
+        note = f"\n⏹️ {cancelled} entregas pendientes canceladas." if cancelled else ""
+        await interaction.followup.send(f"🗑️ **¡Buzón vaciado!** Se han eliminado todas las cartas.{note}", ephemeral=True)
 
     @app_commands.command(name="view_letters", description="Admin: Ver cartas guardadas (Filtros opcionales)")
     @app_commands.describe(user="Filtrar por usuario", tipo="Filtrar por tipo (Enviadas/Recibidas)")
@@ -280,7 +332,7 @@ class Letters(commands.Cog):
 
             db_path = get_db_path(interaction.guild_id)
             
-            async with aiosqlite.connect(db_path) as db:
+            async with db_connect(db_path) as db:
                 async with db.execute(query, tuple(params)) as cursor:
                     letters = await cursor.fetchall()
                     
@@ -357,8 +409,7 @@ class Letters(commands.Cog):
                 await interaction.followup.send(response_text, ephemeral=True)
                     
         except Exception as e:
-            import traceback
-            traceback.print_exc()
+            log.exception("Error en /view_letters", extra={"guild": interaction.guild_id, "command": "view_letters"})
             await interaction.followup.send(f"❌ Error interno: {e}", ephemeral=True)
 
     @app_commands.command(name="read_letter", description="Admin: Leer/Descargar el contenido completo de una carta")
@@ -386,16 +437,17 @@ class Letters(commands.Cog):
 
         db_path = get_db_path(interaction.guild_id)
         
-        async with aiosqlite.connect(db_path) as db:
-            async with db.execute("SELECT sender_name, recipient, message, is_anonymous, timestamp FROM letters WHERE id = ?", (letter_id,)) as cursor:
+        async with db_connect(db_path) as db:
+            async with db.execute("SELECT sender_name, recipient, message, is_anonymous, timestamp, moderation, flags FROM letters WHERE id = ?", (letter_id,)) as cursor:
                 row = await cursor.fetchone()
                 
         if not row:
             await interaction.response.send_message(f"❌ No encontré carta con ID `{letter_id}`.", ephemeral=True)
             return
 
-        sender_name, recipient, message, is_anonymous, timestamp = row
+        sender_name, recipient, message, is_anonymous, timestamp, moderation, flags = row
         anon_str = "SÍ" if is_anonymous else "NO"
+        spans = decode_spans(flags)
         
         # Create text file content
         content = f"""=== CARTA #{letter_id} ===
@@ -412,13 +464,112 @@ Anónima: {anon_str}
         import io
         file = discord.File(io.BytesIO(content.encode('utf-8')), filename=f"carta_{letter_id}.txt")
         
-        embed = discord.Embed(title=f"📜 Visualizando Carta #{letter_id}", description=message[:4000], color=discord.Color.blue())
+        embed = discord.Embed(title=f"📜 Visualizando Carta #{letter_id}", description=highlight(message, spans)[:4000], color=discord.Color.blue())
         embed.add_field(name="De", value=sender_name, inline=True)
         embed.add_field(name="Para", value=recipient, inline=True)
+        if spans:
+            state = "retenida" if moderation == HELD else "aprobada" if moderation == APPROVED else "marcada"
+            matched = ", ".join(dict.fromkeys(f"`{rule}`" for _, _, rule in spans))
+            embed.add_field(name=f"🚩 Filtro ({state})", value=matched[:1024], inline=False)
         embed.set_footer(text="Archivo adjunto con el contenido completo.")
         
         await interaction.response.send_message(embed=embed, file=file, ephemeral=True)
 
+    @app_commands.command(name="held_letters", description="Admin: Cartas retenidas por el filtro de contenido")
+    async def held_letters(self, interaction: discord.Interaction):
+        if not _is_letters_admin(interaction):
+            await interaction.response.send_message(f"⛔ ¡Solo administradores!", ephemeral=True)
+            return
+
+        if not interaction.guild_id:
+             await interaction.response.send_message("❌ Error: No se pudo identificar el servidor.", ephemeral=True)
+             return
+
+        await interaction.response.defer(ephemeral=True)
+        async with db_connect(get_db_path(interaction.guild_id)) as db:
+            async with db.execute("SELECT id, sender_name, recipient, message, is_anonymous, flags FROM letters WHERE moderation = ? ORDER BY id", (HELD,)) as cursor:
+                letters = await cursor.fetchall()
+
+        if not letters:
+            await interaction.followup.send("✅ No hay cartas retenidas.", ephemeral=True)
+            return
+
+        response_text = f"**🚩 Cartas Retenidas ({len(letters)}):**\n"
+        for l_id, s_name, recip, msg, is_anon, flags in letters[:HELD_LIST_MAX]:
+            anon_tag = "🕵️" if is_anon else "✍️"
+            excerpt = highlight(msg or "", decode_spans(flags), 40).replace("\n", " ")
+            response_text += f"🆔 `{l_id}` | De: {s_name} {anon_tag} | Para: {recip}\n📝 \"{excerpt}\"\n-------------------\n"
+        if len(letters) > HELD_LIST_MAX:
+            response_text += f"… y {len(letters) - HELD_LIST_MAX} más (usa `/read_letter <id>`).\n"
+        response_text += "\n💡 `/approve_letter <id>` la incluye en el envío; `/delete_letter <id>` la elimina."
+
+        for i in range(0, len(response_text), 1900):
+            await interaction.followup.send(response_text[i:i+1900], ephemeral=True)
+
+    @app_commands.command(name="approve_letter", description="Admin: Aprobar una carta retenida por el filtro")
+    @app_commands.describe(letter_id="El ID de la carta")
+    async def approve_letter(self, interaction: discord.Interaction, letter_id: int):
+        if not _is_letters_admin(interaction):
+            await interaction.response.send_message(f"⛔ ¡Solo administradores!", ephemeral=True)
+            return
+
+        if not interaction.guild_id:
+             await interaction.response.send_message("❌ Error: No se pudo identificar el servidor.", ephemeral=True)
+             return
+
+        async with db_connect(get_db_path(interaction.guild_id)) as db:
+            cursor = await db.execute("UPDATE letters SET moderation = ? WHERE id = ? AND moderation = ?", (APPROVED, letter_id, HELD))
+            await db.commit()
+
+        if not cursor.rowcount:
+            await interaction.response.send_message(f"❌ No hay ninguna carta retenida con ID `{letter_id}`.", ephemeral=True)
+            return
+        log.info("✅ Carta %s aprobada por %s", letter_id, interaction.user, extra={"guild": interaction.guild_id})
+        await interaction.response.send_message(f"✅ Carta `{letter_id}` aprobada: se enviará con las demás.", ephemeral=True)
+
+    @app_commands.command(name="letters_stats", description="Admin: Estadísticas del buzón (totales, top y volumen por hora)")
+    async def letters_stats(self, interaction: discord.Interaction):
+        if not _is_letters_admin(interaction):
+            await interaction.response.send_message(f"⛔ ¡Solo administradores!", ephemeral=True)
+            return
+
+        if not interaction.guild_id:
+             await interaction.response.send_message("❌ Error: No se pudo identificar el servidor.", ephemeral=True)
+             return
+
+        # Read from the trigger-maintained aggregates only: same cost with 10 or 1M letters
+        stats = await letterstats.summarize(interaction.guild_id)
+        if not stats['total']:
+            await interaction.response.send_message("📭 El buzón está vacío.", ephemeral=True)
+            return
+
+        def ranking(rows, mention):
+            return "\n".join(f"{i}. {mention(key)} — {count}" for i, (key, count) in enumerate(rows, 1)) or "Sin datos"
+
+        embed = discord.Embed(title="📊 Estadísticas del Buzón", description=f"```\n{letterstats.hour_chart(stats['hours'])}\n```", color=discord.Color.from_rgb(255, 105, 180))
+        embed.add_field(name="Total", value=str(stats['total']), inline=True)
+        embed.add_field(name="Anónimas 🕵️ / Firmadas ✍️", value=f"{stats['anonymous']} / {stats['signed']}", inline=True)
+        embed.add_field(name="Retenidas 🚩", value=str(stats['held']), inline=True)
+        embed.add_field(name="📤 Top remitentes", value=ranking(stats['senders'], lambda key: f"<@{key}>"), inline=True)
+        embed.add_field(name="📥 Top destinatarios", value=ranking(stats['recipients'], lambda key: key), inline=True)
+        embed.set_footer(text="Volumen por hora del día • /rebuild_letters_stats recalcula desde las cartas")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @app_commands.command(name="rebuild_letters_stats", description="Admin: Recalcular las estadísticas del buzón desde las cartas")
+    async def rebuild_letters_stats(self, interaction: discord.Interaction):
+        if not _is_letters_admin(interaction):
+            await interaction.response.send_message(f"⛔ ¡Solo administradores!", ephemeral=True)
+            return
+
+        if not interaction.guild_id:
+             await interaction.response.send_message("❌ Error: No se pudo identificar el servidor.", ephemeral=True)
+             return
+
+        await interaction.response.defer(ephemeral=True)
+        rows, seconds = await letterstats.rebuild(interaction.guild_id)
+        log.info("📊 Estadísticas de cartas recalculadas: %s filas en %.2fs", rows, seconds, extra={"guild": interaction.guild_id})
+        await interaction.followup.send(f"📊 Estadísticas recalculadas ({rows} filas en {seconds:.2f}s).", ephemeral=True)
+
     @app_commands.command(name="delete_letter", description="Admin: Borrar una carta por ID")
     @app_commands.describe(letter_id="El ID de la carta a borrar")
     async def delete_letter(self, interaction: discord.Interaction, letter_id: int):
@@ -434,7 +585,7 @@ Anónima: {anon_str}
 
         db_path = get_db_path(interaction.guild_id)
 
-        async with aiosqlite.connect(db_path) as db:
+        async with db_connect(db_path) as db:
             async with db.execute("SELECT id FROM letters WHERE id = ?", (letter_id,)) as cursor:
                 if not await cursor.fetchone():
                     await interaction.response.send_message(f"❌ No encontré ninguna carta con ID `{letter_id}` en este servidor.", ephemeral=True)
@@ -446,4 +597,6 @@ Anónima: {anon_str}
         await interaction.response.send_message(f"🗑️ Carta `{letter_id}` eliminada correctamente de la base de datos de {interaction.guild.name}.", ephemeral=True)
 
 async def setup(bot):
+    # Persistent views live with their cog so a hot reload re-registers the new classes
     await bot.add_cog(Letters(bot))
+    bot.add_view(MailboxView())
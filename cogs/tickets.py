@@ -1,75 +1,417 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
 import asyncio
-import os
 import datetime
+import heapq
+import secrets
+import time
+from collections import deque
 from dotenv import load_dotenv
-from utils_db import load_server_config
+from utils_db import get_db_path, get_guild_config, load_server_config, connect as db_connect
+from utils_ratelimit import CooldownView
+import utils_sla as sla
+from utils_metrics import REGISTRY
+import utils_audit as audit
+import utils_outbound as outbound
+from utils_resources import resources_for
+from utils_log import get_logger
+
+log = get_logger("tickets")
 
 load_dotenv()
 
-class TicketControlView(discord.ui.View):
-    def __init__(self):
-        super().__init__(timeout=None)
+TICKET_CATEGORY_NAME = "Tickets"
+POOL_CHANNEL_PREFIX = "pool-"
 
-    @discord.ui.button(label="Cerrar Ticket", style=discord.ButtonStyle.danger, emoji="🔒", custom_id="btn_close_ticket")
-    async def close_ticket(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.send_message("⚠️ **Cerrando ticket en 5 segundos...**", ephemeral=True)
-        
-        # Transcript Logic
-        transcript_text = f"Transcripción del Ticket: {interaction.channel.name}\n"
-        transcript_text += f"Cerrado por: {interaction.user.name} ({interaction.user.id})\n"
-        transcript_text += f"Fecha: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-        transcript_text += "-" * 50 + "\n\n"
-
-        async for msg in interaction.channel.history(limit=None, oldest_first=True):
-            timestamp = msg.created_at.strftime('%Y-%m-%d %H:%M:%S')
-            author = f"{msg.author.name} ({msg.author.id})"
-            content = msg.content
-            if msg.embeds:
-                content += " [Embed]"
-            if msg.attachments:
-                content += f" [Adjuntos: {', '.join([a.url for a in msg.attachments])}]"
-            
-            transcript_text += f"[{timestamp}] {author}: {content}\n"
+async def get_ticket_category(resources):
+    """Returns the 'Tickets' category, creating it if needed (may raise discord.Forbidden)."""
+    category = resources.category_named(TICKET_CATEGORY_NAME)
+    if not category:
+        category = await resources.guild.create_category(TICKET_CATEGORY_NAME)
+        resources.note_channel(category) # Indexed now, not when the create event arrives
+    return category
+
+def resolve_staff_roles(resources, guild_conf: dict):
+    """Resolves the staff roles for a guild: configured IDs first, then 'Staff'/'Soporte' by name."""
+    support_role_ids = []
+    if guild_conf:
+        ids = guild_conf.get('ticket_support_role_id')
+        if isinstance(ids, list):
+            support_role_ids = ids
+        elif isinstance(ids, int):
+            support_role_ids = [ids]
+
+    # Priority 1: IDs from .env
+    staff_roles = []
+    for rid in support_role_ids:
+        role = resources.role(rid)
+        if role:
+            staff_roles.append(role)
+
+    # Priority 2: Name search (Fallback if no IDs or IDs invalid)
+    if not staff_roles:
+        found = resources.role_named("Staff") or resources.role_named("Soporte")
+        if found:
+            staff_roles.append(found)
+
+    return staff_roles
+
+def build_ticket_overwrites(guild: discord.Guild, staff_roles):
+    """Base overwrites for a ticket channel: hidden for @everyone, visible to the bot and staff."""
+    overwrites = {
+        guild.default_role: discord.PermissionOverwrite(read_messages=False),
+        guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True, manage_channels=True)
+    }
+    for role in staff_roles:
+        overwrites[role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
+    return overwrites
+
+class TicketPool:
+    """
+    Per-guild warm pool of hidden, pre-created ticket channels.
+    Opening a ticket only renames a pooled channel and grants the user access;
+    a background task refills the pool to `ticket_pool_size` channels.
+    """
+    def __init__(self, bot):
+        self.bot = bot
+        self.sizes = {}      # guild_id -> configured pool size
+        self.channels = {}   # guild_id -> deque of pooled channel IDs
+        self.stats = {'hits': 0, 'misses': 0, 'hit_time': 0.0, 'miss_time': 0.0}
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._refill_loop())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
 
-        # Send to Log Channel
+    def enabled_for(self, guild_id: int) -> bool:
+        return self.sizes.get(guild_id, 0) > 0
+
+    def take(self, guild: discord.Guild):
+        """Pops a still-existing pooled channel for this guild (or None) and schedules a refill."""
+        queue = self.channels.get(guild.id)
+        channel = None
+        while queue:
+            channel = guild.get_channel(queue.popleft())
+            if channel:
+                break
+        self._wakeup.set()
+        return channel
+
+    async def discard(self, channel):
+        """Deals with a taken channel that could not be handed out: deleted, or back in the pool if that fails too."""
+        try:
+            await channel.delete(reason="Canal del pool inutilizable")
+        except Exception as e:
+            log.warning(f"⚠️ [TicketPool] No se pudo borrar el canal {channel.id}, vuelve al pool: {e}")
+            self.channels.setdefault(channel.guild.id, deque()).append(channel.id)
+        self._wakeup.set()
+
+    def record(self, hit: bool, elapsed: float):
+        REGISTRY.counter("cache_requests_total", {'cache': 'ticket_pool', 'result': 'hit' if hit else 'miss'}, "Cache lookups by cache and result").inc()
+        if hit:
+            self.stats['hits'] += 1
+            self.stats['hit_time'] += elapsed
+        else:
+            self.stats['misses'] += 1
+            self.stats['miss_time'] += elapsed
+
+    def summary(self) -> dict:
+        hits, misses = self.stats['hits'], self.stats['misses']
+        avg_hit = (self.stats['hit_time'] / hits * 1000) if hits else None
+        avg_miss = (self.stats['miss_time'] / misses * 1000) if misses else None
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if (hits + misses) else 0.0,
+            'avg_hit_ms': avg_hit,
+            'avg_miss_ms': avg_miss,
+            'saved_ms': (avg_miss - avg_hit) if (avg_hit is not None and avg_miss is not None) else None,
+            'pooled': {gid: len(q) for gid, q in self.channels.items()},
+        }
+
+    async def _refill_loop(self):
+        await self.bot.wait_until_ready()
         server_config = load_server_config()
-        guild_conf = server_config.get(interaction.guild_id)
+        for guild in self.bot.guilds:
+            size = (server_config.get(guild.id) or {}).get('ticket_pool_size', 0)
+            if size:
+                self.sizes[guild.id] = size
+                self._adopt_existing(guild)
+
+        while not self.bot.is_closed():
+            for guild in self.bot.guilds:
+                if self.enabled_for(guild.id):
+                    try:
+                        await self._refill(guild, server_config.get(guild.id))
+                    except Exception as e:
+                        log.warning(f"⚠️ [TicketPool] Error rellenando pool en {guild.name}: {e}")
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+    def _adopt_existing(self, guild: discord.Guild):
+        # Reuse pooled channels left over from a previous run instead of leaking them
+        queue = self.channels.setdefault(guild.id, deque())
+        category = resources_for(self.bot, guild).category_named(TICKET_CATEGORY_NAME)
+        if category:
+            for channel in category.text_channels:
+                if channel.name.startswith(POOL_CHANNEL_PREFIX) and channel.id not in queue:
+                    queue.append(channel.id)
+
+    async def _refill(self, guild: discord.Guild, guild_conf: dict):
+        queue = self.channels.setdefault(guild.id, deque())
+        missing = self.sizes[guild.id] - len(queue)
+        if missing <= 0:
+            return
+        resources = resources_for(self.bot, guild)
+        category = await get_ticket_category(resources)
+        overwrites = build_ticket_overwrites(guild, resolve_staff_roles(resources, guild_conf))
+        for _ in range(missing):
+            channel = await guild.create_text_channel(
+                name=f"{POOL_CHANNEL_PREFIX}{secrets.token_hex(3)}",
+                category=category,
+                overwrites=overwrites
+            )
+            queue.append(channel.id)
+        log.info("🎫 [TicketPool] %s: %s canales listos en el pool", guild.name, len(queue))
+
+class OpenTicketIndex:
+    """
+    In-memory index of open tickets, persisted in the `tickets` table of each guild DB.
+    Lookups by channel and by (guild, user, type) are O(1).
+    """
+    def __init__(self):
+        self.by_channel = {}   # channel_id -> (guild_id, user_id, ticket_type)
+        self.by_owner = {}     # (guild_id, user_id, ticket_type) -> set of channel_ids / reservations
+        self.lifecycle = {}    # channel_id -> {'opened', 'first_reply', 'claimed_by'} (epoch seconds / user ID)
+        self._next_reservation = -1
+
+    def count(self, guild_id: int, user_id: int, ticket_type: str) -> int:
+        return len(self.by_owner.get((guild_id, user_id, ticket_type), ()))
+
+    def channels_of(self, guild_id: int, user_id: int, ticket_type: str):
+        return [cid for cid in self.by_owner.get((guild_id, user_id, ticket_type), ()) if cid > 0]
+
+    def reserve(self, guild_id: int, user_id: int, ticket_type: str) -> int:
+        # Placeholder so two concurrent selects can't both pass the cap check
+        token = self._next_reservation
+        self._next_reservation -= 1
+        self.by_owner.setdefault((guild_id, user_id, ticket_type), set()).add(token)
+        return token
+
+    def release(self, guild_id: int, user_id: int, ticket_type: str, token: int):
+        key = (guild_id, user_id, ticket_type)
+        owned = self.by_owner.get(key)
+        if owned:
+            owned.discard(token)
+            if not owned:
+                del self.by_owner[key]
+
+    def add(self, channel_id: int, guild_id: int, user_id: int, ticket_type: str):
+        self.by_channel[channel_id] = (guild_id, user_id, ticket_type)
+        self.by_owner.setdefault((guild_id, user_id, ticket_type), set()).add(channel_id)
+
+    def remove(self, channel_id: int):
+        entry = self.by_channel.pop(channel_id, None)
+        self.lifecycle.pop(channel_id, None)
+        if entry:
+            self.release(*entry, channel_id)
+        return entry
+
+    async def load(self, guild_id: int):
+        async with db_connect(get_db_path(guild_id)) as db:
+            async with db.execute("SELECT channel_id, user_id, ticket_type, opened_at, first_reply_at, claimed_by FROM tickets") as cursor:
+                rows = await cursor.fetchall()
+        for channel_id, user_id, ticket_type, opened_at, first_reply_at, claimed_by in rows:
+            self.add(channel_id, guild_id, user_id, ticket_type)
+            try:
+                opened = datetime.datetime.fromisoformat(str(opened_at)).timestamp()
+            except ValueError:
+                opened = time.time()
+            self.lifecycle[channel_id] = {'opened': opened, 'first_reply': first_reply_at, 'claimed_by': claimed_by}
+
+    async def open(self, channel_id: int, guild_id: int, user_id: int, ticket_type: str):
+        self.add(channel_id, guild_id, user_id, ticket_type)
+        opened = datetime.datetime.now()
+        self.lifecycle[channel_id] = {'opened': opened.timestamp(), 'first_reply': None, 'claimed_by': None}
+        async with db_connect(get_db_path(guild_id)) as db:
+            await db.execute(
+                "INSERT OR REPLACE INTO tickets (channel_id, user_id, ticket_type, opened_at) VALUES (?, ?, ?, ?)",
+                (channel_id, user_id, ticket_type, opened)
+            )
+            await db.commit()
+
+    async def mark(self, channel_id: int, column: str, staff_id: int):
+        """Records a one-off lifecycle event (`first_reply` or `claim`). Returns seconds since open, or None if already set."""
+        entry = self.by_channel.get(channel_id)
+        state = self.lifecycle.get(channel_id)
+        if not entry or not state:
+            return None
+        now = time.time()
+        if column == 'first_reply':
+            if state['first_reply']:
+                return None
+            state['first_reply'] = now
+            sql, params = "UPDATE tickets SET first_reply_at = ? WHERE channel_id = ?", (now, channel_id)
+        else:
+            if state['claimed_by']:
+                return None
+            state['claimed_by'] = staff_id
+            sql, params = "UPDATE tickets SET claimed_at = ?, claimed_by = ? WHERE channel_id = ?", (now, staff_id, channel_id)
+        async with db_connect(get_db_path(entry[0])) as db:
+            await db.execute(sql, params)
+            await db.commit()
+        return now - state['opened']
+
+    async def close(self, channel_id: int):
+        entry = self.remove(channel_id)
+        if entry:
+            async with db_connect(get_db_path(entry[0])) as db:
+                await db.execute("DELETE FROM tickets WHERE channel_id = ?", (channel_id,))
+                await db.commit()
+        return entry
+
+async def close_ticket_channel(channel: discord.TextChannel, closed_by, reason: str = None):
+    """Builds the transcript, sends it to the ticket log channel and deletes the ticket channel."""
+    # Transcript Logic
+    transcript_text = f"Transcripción del Ticket: {channel.name}\n"
+    transcript_text += f"Cerrado por: {closed_by.name} ({closed_by.id})\n"
+    if reason:
+        transcript_text += f"Motivo: {reason}\n"
+    transcript_text += f"Fecha: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+    transcript_text += "-" * 50 + "\n\n"
+
+    async for msg in channel.history(limit=None, oldest_first=True):
+        timestamp = msg.created_at.strftime('%Y-%m-%d %H:%M:%S')
+        author = f"{msg.author.name} ({msg.author.id})"
+        content = msg.content
+        if msg.embeds:
+            content += " [Embed]"
+        if msg.attachments:
+            content += f" [Adjuntos: {', '.join([a.url for a in msg.attachments])}]"
         
-        log_channel_id = None
-        if guild_conf:
-            log_channel_id = guild_conf.get('ticket_log_channel_id')
+        transcript_text += f"[{timestamp}] {author}: {content}\n"
+
+    # Send to Log Channel
+    server_config = load_server_config()
+    guild_conf = server_config.get(channel.guild.id)
+    
+    log_channel_id = None
+    if guild_conf:
+        log_channel_id = guild_conf.get('ticket_log_channel_id')
+
+    if log_channel_id:
+        embed = discord.Embed(
+            title="🔒 Ticket Cerrado",
+            description=f"Ticket **{channel.name}** ha sido cerrado.",
+            color=discord.Color.red(),
+            timestamp=datetime.datetime.now()
+        )
+        embed.add_field(name="Cerrado por", value=closed_by.mention)
+        embed.add_field(name="Canal", value=channel.name)
+        if reason:
+            embed.add_field(name="Motivo", value=reason, inline=False)
 
-        if log_channel_id:
+        # Delivered by the guild's LogBot; the transcript is built in memory
+        await audit.publish(
+            channel.guild.id, "ticket_transcript", [log_channel_id], embed=embed,
+            file_bytes=transcript_text.encode("utf-8"), filename=f"transcript-{channel.name}.txt"
+        )
+
+    await asyncio.sleep(5)
+    await channel.delete()
+
+class InactivityTimer:
+    """
+    Auto-close deadlines for open tickets, kept in a min-heap with a single sleeping task.
+    Message activity only moves the deadline in `deadlines` (O(1)). Stale heap entries (moved
+    deadlines, closed tickets, re-scheduled ones) stay in the heap until they surface: then they
+    are re-pushed with the current deadline or dropped. Expiries run as their own tasks, so a
+    slow close never delays the deadlines behind it.
+    Changed deadlines are flushed to the `tickets` table in batches so they survive restarts.
+    """
+    def __init__(self, bot, on_expire):
+        self.bot = bot
+        self.on_expire = on_expire
+        self.deadlines = {}   # channel_id -> (deadline, warned)
+        self.heap = []        # (deadline, channel_id)
+        self.dirty = set()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._expiring = set()  # Running on_expire tasks (the loop only keeps weak references)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def schedule(self, channel_id: int, deadline: float, warned: bool = False):
+        self.deadlines[channel_id] = (deadline, warned)
+        self.dirty.add(channel_id)
+        heapq.heappush(self.heap, (deadline, channel_id))
+        if self.heap[0][1] == channel_id:
+            self._wakeup.set()
+
+    def touch(self, channel_id: int, deadline: float):
+        # Activity only pushes the deadline forward; no heap operation needed
+        if channel_id in self.deadlines:
+            self.deadlines[channel_id] = (deadline, False)
+            self.dirty.add(channel_id)
+
+    def cancel(self, channel_id: int):
+        self.deadlines.pop(channel_id, None)
+        self.dirty.discard(channel_id)
+
+    async def _run(self):
+        await self.bot.wait_until_ready()
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            while self.heap and self.heap[0][0] <= now:
+                deadline, channel_id = heapq.heappop(self.heap)
+                current = self.deadlines.get(channel_id)
+                if current is None:
+                    continue # Ticket already closed
+                if current[0] > deadline:
+                    heapq.heappush(self.heap, (current[0], channel_id)) # Refreshed by activity
+                    continue
+                del self.deadlines[channel_id]
+                task = asyncio.create_task(self._expire(channel_id, current[1]))
+                self._expiring.add(task)
+                task.add_done_callback(self._expiring.discard)
+
+            timeout = (self.heap[0][0] - time.time()) if self.heap else None
             try:
-                log_channel = interaction.guild.get_channel(log_channel_id)
-                if log_channel:
-                    # Create file
-                    with open("transcript.txt", "w", encoding="utf-8") as f:
-                        f.write(transcript_text)
-                    
-                    file = discord.File("transcript.txt", filename=f"transcript-{interaction.channel.name}.txt")
-                    
-                    embed = discord.Embed(
-                        title="🔒 Ticket Cerrado",
-                        description=f"Ticket **{interaction.channel.name}** ha sido cerrado.",
-                        color=discord.Color.red(),
-                        timestamp=datetime.datetime.now()
-                    )
-                    embed.add_field(name="Cerrado por", value=interaction.user.mention)
-                    embed.add_field(name="Canal", value=interaction.channel.name)
-                    
-                    await log_channel.send(embed=embed, file=file)
-                    
-                    # Clean up file
-                    os.remove("transcript.txt")
-            except Exception as e:
-                print(f"Error enviando log: {e}")
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _expire(self, channel_id: int, warned: bool):
+        try:
+            await self.on_expire(channel_id, warned)
+        except Exception as e:
+            log.warning(f"⚠️ [AutoClose] Error procesando ticket {channel_id}: {e}")
 
-        await asyncio.sleep(5)
-        await interaction.channel.delete()
+class TicketControlView(CooldownView):
+    cooldowns = {"btn_close_ticket": (1, 10), "btn_claim_ticket": (2, 10)}
+
+    def __init__(self):
+        super().__init__(timeout=None)
+
+    @discord.ui.button(label="Cerrar Ticket", style=discord.ButtonStyle.danger, emoji="🔒", custom_id="btn_close_ticket")
+    async def close_ticket(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.send_message("⚠️ **Cerrando ticket en 5 segundos...**", ephemeral=True)
+        await close_ticket_channel(interaction.channel, interaction.user)
 
     @discord.ui.button(label="Reclamar Ticket", style=discord.ButtonStyle.success, emoji="🙋‍♂️", custom_id="btn_claim_ticket")
     async def claim_ticket(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -93,7 +435,13 @@ class TicketControlView(discord.ui.View):
             
             await interaction.message.edit(embed=original_embed, view=self)
             await interaction.response.send_message(f"✅ Has reclamado este ticket.", ephemeral=True)
-            await interaction.channel.send(f"👮‍♂️ **Atención:** {interaction.user.mention} se ha encargado de este ticket.")
+            notice = f"👮‍♂️ **Atención:** {interaction.user.mention} se ha encargado de este ticket."
+            await outbound.submit(interaction.client, outbound.STAFF, lambda: interaction.channel.send(notice),
+                                  guild_id=interaction.guild_id, route=outbound.route_for(interaction.channel))
+
+            cog = interaction.client.get_cog("Tickets")
+            if cog:
+                await cog.record_lifecycle(interaction.channel.id, 'claim', interaction.user.id)
 
         except Exception as e:
             await interaction.response.send_message(f"Error actualizando el ticket: {e}", ephemeral=True)
@@ -107,63 +455,54 @@ class TicketTypeSelect(discord.ui.Select):
             discord.SelectOption(label="Donaciones", emoji="💸", description="Ayuda al servidor"),
         ]
 
-        # Conditional Option for ZERO Server
-        # ID: 1237573087013109811
-        if guild_id == 1237573087013109811:
+        # Staff applications are enabled per guild in the registry
+        guild_conf = get_guild_config(guild_id) if guild_id else None
+        if guild_conf and guild_conf.get('enable_staff_applications'):
              options.append(discord.SelectOption(label="Postulación a Staff", emoji="🛡️", description="Aplica para formar parte del equipo"))
 
         super().__init__(placeholder="Selecciona el motivo del ticket...", min_values=1, max_values=1, custom_id="select_ticket_type", options=options)
 
     async def callback(self, interaction: discord.Interaction):
-        await interaction.response.defer(ephemeral=True)
-        # Determine role to ping based on selection
         guild = interaction.guild
-        category = discord.utils.get(guild.categories, name="Tickets")
-        if not category:
-            try:
-                category = await guild.create_category("Tickets")
-            except discord.Forbidden:
-                await interaction.followup.send("⛔ Error: No tengo permisos para crear la categoría 'Tickets'.", ephemeral=True)
-                return
-
-        overwrites = {
-            guild.default_role: discord.PermissionOverwrite(read_messages=False),
-            interaction.user: discord.PermissionOverwrite(read_messages=True, send_messages=True, attach_files=True),
-            guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True, manage_channels=True)
-        }
+        ticket_type = self.values[0]
 
         # Load Config
         server_config = load_server_config()
         guild_conf = server_config.get(interaction.guild_id)
-        
-        support_role_ids = []
-        if guild_conf:
-            ids = guild_conf.get('ticket_support_role_id')
-            if isinstance(ids, list):
-                support_role_ids = ids
-            elif isinstance(ids, int):
-                support_role_ids = [ids]
-
-        # Priority 1: IDs from .env
-        staff_roles = []
-        if support_role_ids:
-            for rid in support_role_ids:
-                role = guild.get_role(rid)
-                if role:
-                    staff_roles.append(role)
-        
-        # Priority 2: Name search (Fallback if no IDs or IDs invalid)
-        if not staff_roles:
-             found = discord.utils.get(guild.roles, name="Staff") or discord.utils.get(guild.roles, name="Soporte")
-             if found:
-                 staff_roles.append(found)
 
-        # Apply overwrites to all found roles
-        for role in staff_roles:
-            overwrites[role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
+        # Per-user cap on open tickets of this type (in-memory index, no REST calls)
+        cog = interaction.client.get_cog("Tickets")
+        index = cog.open_tickets if cog else None
+        max_per_type = (guild_conf or {}).get('ticket_max_per_type', 1)
+        reservation = None
+        if index:
+            if max_per_type and index.count(guild.id, interaction.user.id, ticket_type) >= max_per_type:
+                existing = " ".join(f"<#{cid}>" for cid in index.channels_of(guild.id, interaction.user.id, ticket_type))
+                await interaction.response.send_message(f"⛔ Ya tienes un ticket abierto de este tipo. {existing}".strip(), ephemeral=True)
+                return
+            reservation = index.reserve(guild.id, interaction.user.id, ticket_type)
+
+        try:
+            await self._open_ticket(interaction, guild, guild_conf, ticket_type, index)
+        finally:
+            if index:
+                index.release(guild.id, interaction.user.id, ticket_type, reservation)
+
+    async def _open_ticket(self, interaction: discord.Interaction, guild: discord.Guild, guild_conf: dict, ticket_type: str, index):
+        await interaction.response.defer(ephemeral=True)
+        # Determine role to ping based on selection
+        resources = resources_for(interaction.client, guild)
+        try:
+            category = await get_ticket_category(resources)
+        except discord.Forbidden:
+            await interaction.followup.send("⛔ Error: No tengo permisos para crear la categoría 'Tickets'.", ephemeral=True)
+            return
+
+        staff_roles = resolve_staff_roles(resources, guild_conf)
+
+        overwrites = build_ticket_overwrites(guild, staff_roles)
+        overwrites[interaction.user] = discord.PermissionOverwrite(read_messages=True, send_messages=True, attach_files=True)
 
-        ticket_type = self.values[0]
-        
         # Customize Channel Name & Message based on type
         if ticket_type == "Postulación a Staff":
             channel_name = f"postulacion-{interaction.user.name}"
@@ -172,11 +511,37 @@ class TicketTypeSelect(discord.ui.Select):
             channel_name = f"ticket-{interaction.user.name}"
             desc = f"Hola {interaction.user.mention},\n\nHas abierto un ticket por: **{ticket_type}**.\nUn miembro del equipo { ' '.join([r.mention for r in staff_roles]) if staff_roles else '@here' } te atenderá pronto.\n\nDescribe tu consulta detalladamente mientras esperas."
 
-        try:
-            channel = await guild.create_text_channel(name=channel_name, category=category, overwrites=overwrites)
-        except Exception as e:
-            await interaction.followup.send(f"Error creando el canal: {e}", ephemeral=True)
-            return
+        # Fast path: take a pre-created channel from the warm pool (1 PATCH instead of a full create)
+        started = time.perf_counter()
+        cog = interaction.client.get_cog("Tickets")
+        pool = cog.pool if cog else None
+        channel = None
+
+        if pool and pool.enabled_for(guild.id):
+            pooled = pool.take(guild)
+            if pooled:
+                try:
+                    await pooled.edit(name=channel_name, overwrites=overwrites)
+                    channel = pooled
+                except Exception as e:
+                    log.warning(f"⚠️ [TicketPool] Error usando canal del pool {pooled.id}: {e}")
+                    await pool.discard(pooled) # Already out of the pool: don't leave it orphaned
+
+        if channel is None:
+            try:
+                channel = await guild.create_text_channel(name=channel_name, category=category, overwrites=overwrites)
+            except Exception as e:
+                await interaction.followup.send(f"Error creando el canal: {e}", ephemeral=True)
+                return
+            if pool:
+                pool.record(hit=False, elapsed=time.perf_counter() - started)
+        elif pool:
+            pool.record(hit=True, elapsed=time.perf_counter() - started)
+
+        if index:
+            await index.open(channel.id, guild.id, interaction.user.id, ticket_type)
+        if cog:
+            cog.arm_autoclose(channel.id, guild.id)
 
         await interaction.followup.send(f"✅ **Ticket creado:** {channel.mention}", ephemeral=True)
 
@@ -195,9 +560,15 @@ class TicketTypeSelect(discord.ui.Select):
         else:
             ping_content += " @here"
 
-        await channel.send(content=ping_content, embed=embed, view=TicketControlView())
+        # The user is looking at the new channel: ahead of any bulk/audit traffic of this bot
+        await outbound.submit(interaction.client, outbound.INTERACTIVE,
+                              lambda: channel.send(content=ping_content, embed=embed, view=TicketControlView()),
+                              guild_id=interaction.guild_id, route=outbound.route_for(channel))
+
+class TicketView(CooldownView):
+    # Opening a ticket creates a channel: max 2 attempts per user per minute
+    cooldowns = {"select_ticket_type": (2, 60)}
 
-class TicketView(discord.ui.View):
     def __init__(self, guild_id: int = None):
         super().__init__(timeout=None)
         # If no guild_id passed (e.g. at startup/persistence loading), we can't fully determine dynamic options easily 
@@ -213,6 +584,127 @@ class TicketView(discord.ui.View):
 class Tickets(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.pool = TicketPool(bot)
+        self.open_tickets = OpenTicketIndex()
+        self.autoclose = InactivityTimer(bot, self.on_ticket_idle)
+        self.autoclose_conf = {}   # guild_id -> (idle_seconds, grace_seconds)
+
+    async def cog_load(self):
+        guild_id = getattr(self.bot, 'target_guild_id', None)
+        if guild_id:
+            await self.open_tickets.load(guild_id)
+            await self.load_autoclose(guild_id)
+        self.pool.start()
+        self.autoclose.start()
+        self.flush_deadlines.start()
+
+    async def cog_unload(self):
+        self.pool.stop()
+        self.autoclose.stop()
+        self.flush_deadlines.cancel()
+        await self.flush_deadlines()
+
+    async def load_autoclose(self, guild_id: int):
+        guild_conf = load_server_config().get(guild_id) or {}
+        idle_hours = guild_conf.get('ticket_autoclose_hours', 0)
+        if not idle_hours:
+            return
+        idle = idle_hours * 3600
+        self.autoclose_conf[guild_id] = (idle, guild_conf.get('ticket_autoclose_grace_minutes', 60) * 60)
+
+        async with db_connect(get_db_path(guild_id)) as db:
+            async with db.execute("SELECT channel_id, deadline, warned FROM tickets") as cursor:
+                rows = await cursor.fetchall()
+        now = time.time()
+        for channel_id, deadline, warned in rows:
+            self.autoclose.schedule(channel_id, deadline or now + idle, bool(warned))
+        log.info("⏲️ [AutoClose] %s tickets con cierre automático tras %sh de inactividad", len(rows), idle_hours)
+
+    def arm_autoclose(self, channel_id: int, guild_id: int):
+        conf = self.autoclose_conf.get(guild_id)
+        if conf:
+            self.autoclose.schedule(channel_id, time.time() + conf[0])
+
+    async def on_ticket_idle(self, channel_id: int, warned: bool):
+        channel = self.bot.get_channel(channel_id)
+        if not channel:
+            await self.open_tickets.close(channel_id)
+            return
+        idle, grace = self.autoclose_conf[channel.guild.id]
+
+        if not warned:
+            # First expiry: warn and give a grace period
+            owner = self.open_tickets.by_channel.get(channel_id)
+            mention = f"<@{owner[1]}> " if owner else ""
+            warning = f"⏰ {mention}**Este ticket lleva {idle // 3600}h sin actividad.** Se cerrará automáticamente en {grace // 60} minutos si nadie escribe."
+            await outbound.submit(self.bot, outbound.STAFF, lambda: channel.send(warning), guild_id=channel.guild.id, route=outbound.route_for(channel))
+            self.autoclose.schedule(channel_id, time.time() + grace, warned=True)
+            return
+
+        await close_ticket_channel(channel, self.bot.user, reason="Cierre automático por inactividad")
+
+    @tasks.loop(seconds=60)
+    async def flush_deadlines(self):
+        # Persist changed deadlines in one transaction per guild
+        if not self.autoclose.dirty:
+            return
+        dirty, self.autoclose.dirty = self.autoclose.dirty, set()
+        per_guild = {}
+        for channel_id in dirty:
+            entry = self.open_tickets.by_channel.get(channel_id)
+            state = self.autoclose.deadlines.get(channel_id)
+            if entry and state:
+                per_guild.setdefault(entry[0], []).append((state[0], int(state[1]), channel_id))
+        for guild_id, rows in per_guild.items():
+            async with db_connect(get_db_path(guild_id)) as db:
+                await db.executemany("UPDATE tickets SET deadline = ?, warned = ? WHERE channel_id = ?", rows)
+                await db.commit()
+
+    async def record_lifecycle(self, channel_id: int, metric: str, staff_id: int):
+        """Stores a first-reply/claim timestamp and adds it to the SLA histograms."""
+        entry = self.open_tickets.by_channel.get(channel_id)
+        try:
+            elapsed = await self.open_tickets.mark(channel_id, metric, staff_id)
+            if elapsed is not None:
+                await sla.record(entry[0], metric, entry[2], staff_id, elapsed)
+        except Exception as e:
+            log.warning(f"⚠️ [SLA] Error registrando {metric} en {channel_id}: {e}")
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        if message.author.bot:
+            return
+        conf = self.autoclose_conf.get(message.guild.id) if message.guild else None
+        if conf and message.channel.id in self.autoclose.deadlines:
+            self.autoclose.touch(message.channel.id, time.time() + conf[0])
+
+        # First message from anyone other than the owner counts as the first staff reply
+        entry = self.open_tickets.by_channel.get(message.channel.id)
+        if entry and message.author.id != entry[1]:
+            state = self.open_tickets.lifecycle.get(message.channel.id)
+            if state and not state['first_reply']:
+                await self.record_lifecycle(message.channel.id, 'first_reply', message.author.id)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # Drop tickets whose channel was deleted while the bot was offline
+        for channel_id in list(self.open_tickets.by_channel):
+            if not self.bot.get_channel(channel_id):
+                self.autoclose.cancel(channel_id)
+                await self.open_tickets.close(channel_id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        # Covers both the close button and channels deleted by hand
+        self.autoclose.cancel(channel.id)
+        entry = self.open_tickets.by_channel.get(channel.id)
+        state = self.open_tickets.lifecycle.get(channel.id)
+        if entry and state:
+            try:
+                await sla.record(entry[0], 'close', entry[2], state['claimed_by'] or 0, time.time() - state['opened'])
+            except Exception as e:
+                log.warning(f"⚠️ [SLA] Error registrando cierre de {channel.id}: {e}")
+        await self.open_tickets.close(channel.id)
 
     @app_commands.command(name="setup_tickets", description="Admin: Configura el panel de tickets")
     @app_commands.checks.has_permissions(administrator=True)
@@ -234,5 +726,48 @@ class Tickets(commands.Cog):
         except Exception as e:
              await interaction.followup.send(f"⚠️ Error al enviar el panel: {e}", ephemeral=True)
 
+    @app_commands.command(name="ticket_pool", description="Admin: Estadísticas del pool de canales de tickets")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def ticket_pool(self, interaction: discord.Interaction):
+        stats = self.pool.summary()
+        size = self.pool.sizes.get(interaction.guild_id, 0)
+
+        def fmt_ms(val):
+            return f"{val:.0f} ms" if val is not None else "N/A"
+
+        embed = discord.Embed(title="🎫 Pool de Tickets", color=discord.Color.blue())
+        embed.add_field(name="Tamaño configurado", value=str(size) if size else "Desactivado", inline=True)
+        embed.add_field(name="Canales listos", value=str(stats['pooled'].get(interaction.guild_id, 0)), inline=True)
+        embed.add_field(name="Aciertos / Fallos", value=f"{stats['hits']} / {stats['misses']} ({stats['hit_rate']:.0%})", inline=False)
+        embed.add_field(name="Apertura con pool", value=fmt_ms(stats['avg_hit_ms']), inline=True)
+        embed.add_field(name="Apertura sin pool", value=fmt_ms(stats['avg_miss_ms']), inline=True)
+        embed.add_field(name="Ahorro medio", value=fmt_ms(stats['saved_ms']), inline=True)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @app_commands.command(name="ticket_stats", description="Admin: Tiempos de atención de tickets (percentiles)")
+    @app_commands.checks.has_permissions(administrator=True)
+    @app_commands.describe(dias="Ventana en días (por defecto 30)", tipo="Filtrar por tipo de ticket", staff="Filtrar por miembro del staff")
+    async def ticket_stats(self, interaction: discord.Interaction, dias: app_commands.Range[int, 1, 365] = 30, tipo: str = None, staff: discord.Member = None):
+        summary = await sla.summarize(interaction.guild_id, dias, tipo, staff.id if staff else sla.ALL_STAFF)
+
+        scope = f"últimos {dias} días"
+        if tipo:
+            scope += f" • {tipo}"
+        if staff:
+            scope += f" • {staff.display_name}"
+
+        embed = discord.Embed(title="📊 Tiempos de Atención", description=scope, color=discord.Color.blue())
+        for metric in sla.SLA_METRICS:
+            data = summary[metric]
+            if data['count']:
+                value = f"n={data['count']} • p50 **{sla.format_duration(data['p50'])}** • p90 {sla.format_duration(data['p90'])} • p99 {sla.format_duration(data['p99'])}"
+            else:
+                value = "Sin datos"
+            embed.add_field(name=sla.SLA_LABELS[metric], value=value, inline=False)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
 async def setup(bot):
+    # Persistent views live with their cog so a hot reload re-registers the new classes
     await bot.add_cog(Tickets(bot))
+    bot.add_view(TicketView())
+    bot.add_view(TicketControlView())
@@ -1,114 +1,183 @@
 import discord
 from discord.ext import commands
 import os
+import sys
+import time
 from dotenv import load_dotenv
 import asyncio
-from utils_db import init_db, load_server_config
-from cogs.letters import MailboxView
-from cogs.tickets import TicketView, TicketControlView
-from cogs.birthdays import BirthdayView
+import yarl
+from discord.gateway import DiscordWebSocket
+from utils_db import init_db, load_server_config, get_guild_config
+from utils_audit import register_client as register_audit_client
+from utils_log import get_logger, setup_logging
+from utils_control import start_control_server
+from utils_loopmon import start_monitor as start_loop_monitor
+from utils_http import client_http_options, close_shared as close_shared_http
+from utils_members import client_options, member_cache_policy, report_startup
+from utils_record import record_interaction, start_recorder, stop_recorder
+from utils_resources import ResourceIndex
+import utils_outbound as outbound
+from utils_metrics import REGISTRY, InstrumentedTree, http_trace_config, record_command_completion, start_http_server
+
+log = get_logger("main")
 
 load_dotenv()
 
 # We need a custom bot class that knows its target ID to sync commands ONLY there
 class ValentineBot(commands.Bot):
-    def __init__(self, target_guild_id: int, bot_name: str, config: dict):
-        intents = discord.Intents.default()
-        intents.members = True
-        intents.message_content = True
-        super().__init__(command_prefix="!", intents=intents)
+    def __init__(self, target_guild_id: int, bot_name: str, config: dict, **http_options):
+        # Intents and member caching follow the guild's enabled features (utils_members.py)
+        super().__init__(command_prefix="!", **client_options(config), tree_cls=InstrumentedTree, http_trace=http_trace_config(bot_name), **http_options)
         self.target_guild_id = target_guild_id
         self.bot_name = bot_name
         self.config = config
+        # Roles/channels looked up by name (ticket category, staff and alert roles), see utils_resources.py
+        self.resources = ResourceIndex()
+        self.resources.attach(self)
+        self.created_at = time.perf_counter()
+        self._reported = False
 
     async def setup_hook(self):
         # Initialize DBs (Safe to call multiple times as it checks if exists)
         await init_db([self.target_guild_id])
+
+        # Audit events are delivered by this bot only until the guild's LogBot is ready
+        register_audit_client(self.target_guild_id, self)
         
         # Load extensions based on CONFIG
         if self.config.get('enable_letters', True):
             await self.load_extension("cogs.letters")
-            self.add_view(MailboxView())
-            print(f"   [Feature] 💌 Cartas ACTIVADO")
+            log.info("   [Feature] 💌 Cartas ACTIVADO")
 
         if self.config.get('enable_tickets', True):
             await self.load_extension("cogs.tickets")
-            self.add_view(TicketView())
-            self.add_view(TicketControlView())
-            print(f"   [Feature] 🎫 Tickets ACTIVADO")
+            log.info("   [Feature] 🎫 Tickets ACTIVADO")
 
         if self.config.get('enable_birthdays', True):
             await self.load_extension("cogs.birthdays")
-            self.add_view(BirthdayView())
-            print(f"   [Feature] 🎂 Cumpleaños ACTIVADO")
+            log.info("   [Feature] 🎂 Cumpleaños ACTIVADO")
 
         # Load Admin Config always
         await self.load_extension("cogs.admin")
-        print(f"   [Feature] 🛡️ Admin Commands ACTIVADO")
+        log.info("   [Feature] 🛡️ Admin Commands ACTIVADO")
+
+        await self.sync_commands()
 
-        # Sync ONLY to the specific guild
+    async def sync_commands(self):
+        # Sync ONLY to the specific guild (also called after a hot reload)
         if self.target_guild_id:
             guild = discord.Object(id=self.target_guild_id)
             self.tree.copy_global_to(guild=guild)
             try:
                 await self.tree.sync(guild=guild)
-                print(f"✅ [{self.bot_name}] Comandos sincronizados en servidor {self.target_guild_id}")
+                log.info("✅ [%s] Comandos sincronizados en servidor %s", self.bot_name, self.target_guild_id)
             except Exception as e:
-                print(f"❌ [{self.bot_name}] Error sincronizando en {self.target_guild_id}: {e}")
-        
+                log.error(f"❌ [{self.bot_name}] Error sincronizando en {self.target_guild_id}: {e}")
+
+    async def on_interaction(self, interaction):
+        # No-op unless INTERACTION_RECORD_FILE is set (see utils_record.py)
+        record_interaction(interaction)
+
+    async def on_app_command_completion(self, interaction, command):
+        record_command_completion(interaction)
+
     async def on_ready(self):
-         print(f"🟢 [{self.bot_name}] Conectado correctamente como {self.user} (ID: {self.user.id})")
+         log.info("🟢 [%s] Conectado correctamente como %s (ID: %s)", self.bot_name, self.user, self.user.id)
+         if not self._reported: # on_ready fires again after a reconnect
+             self._reported = True
+             report_startup(self, member_cache_policy(self.config))
 
-# Simple Log Bot Class
+# Log Bot: delivers the guild's audit events (letter logs, transcripts) with its own token
 class LogBot(commands.Bot):
-    def __init__(self, bot_name: str):
-        super().__init__(command_prefix="?", intents=discord.Intents.default())
+    def __init__(self, target_guild_id: int, bot_name: str, **http_options):
+        # Only sends: channels for its targets, no members, no message events or message cache
+        super().__init__(command_prefix="?", intents=discord.Intents(guilds=True), chunk_guilds_at_startup=False,
+                         member_cache_flags=discord.MemberCacheFlags.none(), max_messages=None, http_trace=http_trace_config(bot_name),
+                         **http_options)
+        self.target_guild_id = target_guild_id
         self.bot_name = bot_name
+        self.created_at = time.perf_counter()
+        self._reported = False
 
     async def on_ready(self):
-        print(f"🟣 [{self.bot_name}] Log Bot conectado como {self.user}")
+        register_audit_client(self.target_guild_id, self, is_log_bot=True)
+        log.info("🟣 [%s] Log Bot conectado como %s (sink de auditoría activo)", self.bot_name, self.user)
+        if not self._reported:
+            self._reported = True
+            report_startup(self, "none")
+
+def use_api_base(base: str, gateway: str = None):
+    """Points REST and the gateway at another host (bench/fake_discord.py for offline load tests)."""
+    base = base.rstrip("/")
+    discord.http.Route.BASE = f"{base}/api/v{discord.http.INTERNAL_API_VERSION}"
+    DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(gateway or base.replace("http", "ws", 1) + "/gateway")
+    log.warning(f"🧪 API de Discord redirigida a {base}")
 
 async def safe_start(bot, token):
     try:
         await bot.start(token)
     except discord.errors.PrivilegedIntentsRequired:
-        print(f"\n🛑 CRÍTICO: El bot [{getattr(bot, 'bot_name', 'Unknown')}] falló al iniciar.")
-        print(f"   ↳ CAUSA: Faltan 'Privileged Intents' (Intents Privilegiados).")
-        print(f"   ↳ SOLUCIÓN: Ve al Discord Developer Portal -> Bot -> Privileged Gateway Intents")
-        print(f"   ↳ ACTIVA: 'Server Members Intent' (y 'Message Content Intent' si es necesario).\n")
+        log.critical(
+            f"🛑 CRÍTICO: El bot [{getattr(bot, 'bot_name', 'Unknown')}] falló al iniciar.\n"
+            f"   ↳ CAUSA: Faltan 'Privileged Intents' (Intents Privilegiados).\n"
+            f"   ↳ SOLUCIÓN: Ve al Discord Developer Portal -> Bot -> Privileged Gateway Intents\n"
+            f"   ↳ ACTIVA: 'Server Members Intent' (y 'Message Content Intent' si es necesario).",
+            extra={"bot": getattr(bot, 'bot_name', None)}
+        )
     except discord.errors.LoginFailure:
-        print(f"\n🛑 ERROR DE LOGIN: El token del bot [{getattr(bot, 'bot_name', 'Unknown')}] es inválido.\n")
+        log.critical(f"🛑 ERROR DE LOGIN: El token del bot [{getattr(bot, 'bot_name', 'Unknown')}] es inválido.", extra={"bot": getattr(bot, 'bot_name', None)})
     except Exception as e:
-        print(f"\n❌ Error desconocido en [{getattr(bot, 'bot_name', 'Unknown')}]: {e}\n")
+        log.exception(f"❌ Error desconocido en [{getattr(bot, 'bot_name', 'Unknown')}]: {e}", extra={"bot": getattr(bot, 'bot_name', None)})
 
 # Controller to manage multiple bots
+import glob
 import json
 
 STATUS_FILE = "status_config.json"
+STATUS_TIMEOUT = 10 # Seconds each bot gets to update presence + status message
 
 class BotController:
-    def __init__(self):
+    def __init__(self, status_file: str = STATUS_FILE):
         self.bots = []
+        # In multi-process mode every worker writes its own file; all of them are read back on start
+        self.status_file = status_file
         self.status_data = self.load_status()
+        self.status_messages = {} # guild_key -> discord.PartialMessage (edit without fetching first)
 
     def register(self, bot):
         self.bots.append(bot)
         bot.controller = self # Inject controller into bot
 
     def load_status(self):
-        try:
-            with open(STATUS_FILE, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
+        data = {}
+        for path in [STATUS_FILE] + sorted(glob.glob("status_config.w*.json")):
+            try:
+                with open(path, 'r') as f:
+                    data.update(json.load(f))
+            except (FileNotFoundError, json.JSONDecodeError):
+                pass
+        return data
 
-    def save_status(self):
-        with open(STATUS_FILE, 'w') as f:
-            json.dump(self.status_data, f)
+    @staticmethod
+    def _write_status(path: str, data: dict):
+        # Write-and-rename so a crash mid-write never leaves a truncated file
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    async def save_status(self):
+        await asyncio.to_thread(self._write_status, self.status_file, dict(self.status_data))
+
+    @staticmethod
+    def status_channel_id(bot):
+        conf = get_guild_config(bot.target_guild_id) or bot.config
+        return conf.get('status_channel_id')
 
     async def broadcast_status(self, status_type: str, activity_text: str, message_text: str = None):
         """
         status_type: 'maintenance', 'active', 'shutdown'
+        Updates every bot concurrently and returns a list of (bot_name, ok, detail).
         """
         # Define Status and Activity
         if status_type == 'maintenance':
@@ -133,122 +202,232 @@ class BotController:
             embed_color = discord.Color.blue()
             title = "📢 ACTUALIZACIÓN"
 
-        # Apply to all bots
-        for bot in self.bots:
+        async def run(bot):
+            started = time.perf_counter()
+            ctx = {"bot": bot.bot_name, "guild": bot.target_guild_id, "command": "broadcast_status"}
             try:
-                # 1. Update Presence
-                if bot.is_ready():
-                    await bot.change_presence(status=status, activity=activity)
-                    print(f"🔄 [{bot.bot_name}] Estado actualizado a {status_type}")
-
-                # 2. Send/Edit Announcement (if message provided OR if we are updating status)
-                # We always want to update the persistent message if possible, even if message_text is None (status change)
-                
-                # Determine Channel ID based on Guild
-                channel_id = None
-                guild_key = str(bot.target_guild_id)
-                if bot.target_guild_id == 1237573087013109811: # Zero
-                    channel_id = int(os.getenv('ZEROP_STATUS_CHANNEL_ID', '1473927006520344626'))
-                elif bot.target_guild_id == 1091109766237007992: # Iglesia
-                    channel_id = int(os.getenv('IGLESIA_STATUS_CHANNEL_ID', '1471653028594581655'))
-                
-                if channel_id and bot.is_ready():
-                    channel = bot.get_channel(channel_id)
-                    if channel:
-                        embed = discord.Embed(title=title, description=message_text if message_text else f"Estado: {activity.name}", color=embed_color)
-                        embed.set_footer(text=f"Actualización Global • {bot.user.name}")
-                        embed.timestamp = discord.utils.utcnow()
-
-                        # Try to edit existing message
-                        sent_message = None
-                        last_msg_id = self.status_data.get(guild_key)
-                        
-                        if last_msg_id:
-                            try:
-                                msg = await channel.fetch_message(last_msg_id)
-                                await msg.edit(embed=embed)
-                                sent_message = msg
-                                print(f"✏️ [{bot.bot_name}] Mensaje editado ({last_msg_id})")
-                            except discord.NotFound:
-                                print(f"⚠️ [{bot.bot_name}] Mensaje anterior no encontrado. Enviando nuevo.")
-                            except Exception as e:
-                                print(f"⚠️ [{bot.bot_name}] Error editando: {e}")
-
-                        # If didn't edit, send new
-                        if not sent_message and status_type != 'shutdown': # Don't send new message on shutdown if edit fails
-                            sent_message = await channel.send(embed=embed)
-                            print(f"Dg [{bot.bot_name}] Nuevo mensaje enviado ({sent_message.id})")
-                        
-                        if sent_message:
-                            self.status_data[guild_key] = sent_message.id
-                            self.save_status()
-
-                    else:
-                        print(f"⚠️ [{bot.bot_name}] No se encontró el canal de estado {channel_id}")
+                detail = await asyncio.wait_for(
+                    self._update_bot(bot, status_type, status, activity, title, embed_color, message_text),
+                    timeout=STATUS_TIMEOUT
+                )
+                log.info("📢 Estado %s aplicado: %s", status_type, detail, extra={**ctx, "latency_ms": round((time.perf_counter() - started) * 1000, 1)})
+                return bot.bot_name, True, detail
+            except asyncio.TimeoutError:
+                log.warning(f"⏱️ [{bot.bot_name}] Tiempo de espera agotado actualizando estado", extra=ctx)
+                return bot.bot_name, False, f"timeout ({STATUS_TIMEOUT}s)"
             except Exception as e:
-                print(f"❌ Error actualizando {bot.bot_name}: {e}")
+                log.error(f"❌ Error actualizando {bot.bot_name}: {e}", extra=ctx)
+                return bot.bot_name, False, str(e)
+
+        # Apply to all bots at once
+        results = await asyncio.gather(*(run(bot) for bot in self.bots))
+
+        # Persist once per broadcast
+        try:
+            await self.save_status()
+        except Exception as e:
+            log.warning(f"⚠️ Error guardando {self.status_file}: {e}")
+
+        return results
+
+    async def _update_bot(self, bot, status_type, status, activity, title, embed_color, message_text):
+        if not bot.is_ready():
+            return "no conectado"
+
+        # 1. Update Presence
+        await bot.change_presence(status=status, activity=activity)
+        log.debug("🔄 [%s] Presencia actualizada a %s", bot.bot_name, status_type)
+
+        # 2. Send/Edit Announcement
+        # We always want to update the persistent message if possible, even if message_text is None (status change)
+        channel_id = self.status_channel_id(bot)
+        if not channel_id:
+            return "presencia actualizada (sin canal de estado)"
+
+        guild_key = str(bot.target_guild_id)
+        channel = bot.get_partial_messageable(channel_id)
 
-async def main_runner():
+        embed = discord.Embed(title=title, description=message_text if message_text else f"Estado: {activity.name}", color=embed_color)
+        embed.set_footer(text=f"Actualización Global • {bot.user.name}")
+        embed.timestamp = discord.utils.utcnow()
+
+        # Try to edit existing message (PartialMessage: no fetch-before-edit)
+        last_msg_id = self.status_data.get(guild_key)
+        if last_msg_id:
+            partial = self.status_messages.get(guild_key)
+            if partial is None or partial.id != last_msg_id:
+                partial = channel.get_partial_message(last_msg_id)
+                self.status_messages[guild_key] = partial
+            try:
+                await outbound.submit(bot, outbound.STAFF, lambda: partial.edit(embed=embed), guild_id=bot.target_guild_id, route=f"channel:{channel_id}")
+                log.debug("✏️ [%s] Mensaje editado (%s)", bot.bot_name, last_msg_id)
+                return "mensaje editado"
+            except discord.NotFound:
+                log.warning(f"⚠️ [{bot.bot_name}] Mensaje anterior no encontrado. Enviando nuevo.")
+                self.status_messages.pop(guild_key, None)
+
+        # If didn't edit, send new
+        if status_type == 'shutdown': # Don't send new message on shutdown if edit fails
+            return "presencia actualizada"
+
+        sent_message = await outbound.submit(bot, outbound.STAFF, lambda: channel.send(embed=embed), guild_id=bot.target_guild_id, route=f"channel:{channel_id}")
+        self.status_data[guild_key] = sent_message.id
+        self.status_messages[guild_key] = channel.get_partial_message(sent_message.id)
+        log.debug("📨 [%s] Nuevo mensaje enviado (%s)", bot.bot_name, sent_message.id)
+        return "mensaje nuevo enviado"
+
+def install_bot_collector(bots):
+    """Gateway latency and readiness per bot, read at scrape time."""
+    def collect():
+        for bot in bots:
+            labels = {'bot': bot.bot_name}
+            REGISTRY.gauge("discord_bot_ready", labels, "1 when the bot's gateway session is ready").set(int(bot.is_ready()))
+            latency = bot.latency
+            if latency == latency and latency != float('inf'): # NaN/inf until the first heartbeat ACK
+                REGISTRY.gauge("discord_gateway_latency_seconds", labels, "Gateway heartbeat round trip").set(latency)
+    REGISTRY.add_collector(collect)
+
+async def start_metrics(bots, worker_index=None):
+    """
+    METRICS_PORT=9100 serves /metrics and /healthz (METRICS_HOST, default 127.0.0.1).
+    Cluster workers listen on METRICS_PORT + 1 + worker index.
+    """
+    port = int(os.getenv('METRICS_PORT', '0') or 0)
+    if not port:
+        return None
+    if worker_index is not None:
+        port += 1 + worker_index
+    host = os.getenv('METRICS_HOST', '127.0.0.1')
+
+    def health():
+        states = {bot.bot_name: bot.is_ready() for bot in bots}
+        return all(states.values()), {'bots': states}
+
+    install_bot_collector(bots)
+    try:
+        runner = await start_http_server(host, port, health)
+    except OSError as e:
+        log.error(f"❌ No se pudo abrir el endpoint de métricas en {host}:{port}: {e}")
+        return None
+    log.info("📈 Métricas en http://%s:%s/metrics (salud: /healthz)", host, port)
+    return runner
+
+async def main_runner(guild_ids=None, ipc=None, worker_index=None):
+    """
+    Starts the bots for every registered guild, or only `guild_ids` when running as a
+    cluster worker (`ipc` is then the pipe to the supervisor).
+    """
+    setup_logging()
+    if os.getenv('DISCORD_API_BASE'):
+        use_api_base(os.getenv('DISCORD_API_BASE'), os.getenv('DISCORD_GATEWAY_URL'))
     server_config = load_server_config()
+    if guild_ids is not None:
+        server_config = {gid: conf for gid, conf in server_config.items() if gid in guild_ids}
     
     # Initialize Controller
-    controller = BotController()
+    if ipc is not None:
+        controller = BotController(status_file=f"status_config.w{worker_index}.json")
+    else:
+        controller = BotController()
 
     tasks = []
+    all_bots = [] # Main + Log bots, for metrics/health
     
-    print("🚀 Inicializando sistema Multi-Bot...")
+    log.info("🚀 Inicializando sistema Multi-Bot...")
+
+    # One connection pool for every bot of this process (SHARED_HTTP, see utils_http.py)
+    http_options = client_http_options(bots=sum(bool(c.get('token')) + bool(c.get('log_token')) for c in server_config.values()))
 
     # Iterate over configs
     for guild_id, conf in server_config.items():
-        # Determine Name and Emoji
-        if guild_id == 1237573087013109811:
-            name = "Comunidad Zero"
-            emoji = "🟢"
-        elif guild_id == 1091109766237007992:
-            name = "Comunidad SA Iglesia"
-            emoji = "🟣"
-        else:
-            name = f"Guild {guild_id}"
-            emoji = "⚪"
+        # Name and Emoji come from the guild registry
+        name = conf['name']
+        emoji = conf['emoji']
 
-        print(f"🔹 Preparando bots para: {name} {emoji}")
+        log.info("🔹 Preparando bots para: %s %s", name, emoji)
 
         # 1. Main Bot
         token = conf.get('token')
         if token:
-            bot = ValentineBot(target_guild_id=guild_id, bot_name=f"{emoji} [{name} - Main]", config=conf)
+            bot = ValentineBot(target_guild_id=guild_id, bot_name=f"{emoji} [{name} - Main]", config=conf, **http_options)
             controller.register(bot) # Register to controller
+            all_bots.append(bot)
             tasks.append(safe_start(bot, token))
         else:
-            print(f"⚠️ Falta TOKEN principal para {name}")
+            log.warning(f"⚠️ Falta TOKEN principal para {name}")
 
         # 2. Log Bot
         log_token = conf.get('log_token')
         if log_token:
             # Check if it's the same as main token to avoid conflict (user might re-use)
             if log_token == token:
-                print(f"⚠️ LOG_TOKEN es igual al TOKEN principal en {name}. Saltando Log Bot secundario.")
+                log.warning(f"⚠️ LOG_TOKEN es igual al TOKEN principal en {name}. Saltando Log Bot secundario.")
             else:
-                lbot = LogBot(bot_name=f"{emoji} [{name} - Logs]")
+                lbot = LogBot(target_guild_id=guild_id, bot_name=f"{emoji} [{name} - Logs]", **http_options)
+                all_bots.append(lbot)
                 tasks.append(safe_start(lbot, log_token))
         else:
-            print(f"ℹ️ No hay LOG_TOKEN para {name}. Se omitirá el bot de logs.")
+            log.info("ℹ️ No hay LOG_TOKEN para %s. Se omitirá el bot de logs.", name)
 
     if not tasks:
-        print("❌ No hay bots para iniciar. Revisa el .env")
+        log.error("❌ No hay bots para iniciar. Revisa guilds.toml o el .env")
+        await close_shared_http()
         return
 
-    print(f"⚡ Iniciando {len(tasks)} procesos de bot...")
+    # Cross-process controller ops go through the supervisor
+    link = None
+    if ipc is not None:
+        from cluster import WorkerLink
+        link = WorkerLink(ipc, controller, asyncio.current_task())
+        for bot in controller.bots:
+            bot.controller = link
+        link.start()
+
+    metrics_runner = await start_metrics(all_bots, worker_index)
+    loop_monitor = start_loop_monitor(server_config.keys())
+    start_recorder(worker_index)
+
+    # runner.py sets BOT_CONTROL_PORT to hot-reload cogs (single-process mode only)
+    control_server = None
+    control_port = int(os.getenv('BOT_CONTROL_PORT', '0') or 0)
+    if control_port and ipc is None:
+        try:
+            control_server = await start_control_server(controller.bots, control_port)
+        except OSError as e:
+            log.error(f"❌ No se pudo abrir el socket de control en el puerto {control_port}: {e}")
+
+    log.info("⚡ Iniciando %s procesos de bot...", len(tasks))
     try:
         await asyncio.gather(*tasks)
     except asyncio.CancelledError:
         pass
     finally:
-        print("\n🛑 Apagando el sistema... Actualizando estados...")
+        log.info("🛑 Apagando el sistema... Actualizando estados...")
         await controller.broadcast_status('shutdown', 'Apagado', "El sistema se ha apagado o reiniciado.")
+        if link:
+            link.stop()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        if loop_monitor:
+            loop_monitor.stop()
+        if control_server:
+            control_server.close()
+        stop_recorder()
+        await outbound.close_all()
+        await close_shared_http()
 
 if __name__ == "__main__":
-    try:
-        asyncio.run(main_runner())
-    except KeyboardInterrupt:
-        pass
+    # BOT_WORKERS=N (or --workers N) spreads the guilds over N processes under a supervisor
+    workers = int(os.getenv('BOT_WORKERS', '1'))
+    if "--workers" in sys.argv:
+        workers = int(sys.argv[sys.argv.index("--workers") + 1])
+
+    if workers > 1:
+        setup_logging()
+        from cluster import run_supervisor
+        run_supervisor(list(load_server_config().keys()), workers)
+    else:
+        try:
+            asyncio.run(main_runner())
+        except KeyboardInterrupt:
+            pass
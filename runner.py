@@ -3,105 +3,318 @@ import time
 import subprocess
 import os
 import atexit
+import fnmatch
+import json
+import socket
+import threading
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
+from utils_control import CONTROL_HOST, is_tooling, module_for_path, needs_restart
+
+# Development/production supervisor for main.py:
+#  - watches the tree through an include/ignore filter and coalesces bursts of events
+#    (one editor save, a git checkout...) into a single reload or restart;
+#  - restarts crashes with exponential backoff and stops after a crash loop until a file changes;
+#  - pings the bot over its control socket and restarts it if it stops answering (hung loop);
+#  - holds a PID lock so two runners never drive the same bot.
+#
+#   RUNNER_WATCH_INCLUDE="*.py"            comma-separated globs (relative paths)
+#   RUNNER_WATCH_IGNORE=".git/*,logs/*"    comma-separated globs, checked first
 
 LOCK_FILE = "bot.lock"
+CONTROL_PORT = int(os.getenv('BOT_CONTROL_PORT', '8765'))
+RELOAD_TIMEOUT = 60
 
-def acquire_lock():
-    if os.path.exists(LOCK_FILE):
-        # Check if the process ID in the lock file is still running
-        try:
-            with open(LOCK_FILE, 'r') as f:
-                old_pid = int(f.read().strip())
-            
-            # Check if process exists (Windows specific way roughly, or generic)
-            # Utilizing psutil would be better but standard lib:
-            # On Windows, we can't easily check PID existance without os.kill(pid, 0) which might not work or ctypes.
-            # But let's just assume if the file exists and is recent, it's running.
-            # actually better: just try to delete it? No, that breaks the running one.
-            pass 
-        except Exception:
-            pass
-            
-        print(f"⚠️ {LOCK_FILE} detectado. ¿Ya se está ejecutando el bot?")
+DEFAULT_INCLUDE = "*.py"
+DEFAULT_IGNORE = ".git/*,*/__pycache__/*,__pycache__/*,logs/*,backups/*,bench/*,recordings/*,tests/*,*.db,*.db-*,*.db.gz,*.lock,*.tmp"
+COALESCE_SECONDS = 0.5    # Quiet period before a batch of changes is applied
+
+BACKOFF_BASE = 2          # First crash restart delay (seconds), doubled per consecutive crash
+BACKOFF_MAX = 300
+STABLE_SECONDS = 60       # Uptime after which the crash counter resets
+CRASH_LOOP_COUNT = 5      # This many crashes...
+CRASH_LOOP_WINDOW = 300   # ...within this many seconds stops auto-restarts until a file changes
+
+HEARTBEAT_INTERVAL = 10   # Seconds between control-socket pings
+HEARTBEAT_TIMEOUT = 60    # No answer for this long (after a first answer) -> the bot is considered hung
+
+# --- Lock ---
+
+def pid_alive(pid: int) -> bool:
+    if pid <= 0:
+        return False
+    if os.name == "nt":
+        import ctypes
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        STILL_ACTIVE = 259
+        handle = ctypes.windll.kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return False
         try:
-             os.remove(LOCK_FILE)
-             print("⚠️ Lock file eliminado (asumiendo cierre inesperado anterior).")
-        except PermissionError:
-             print("❌ ERROR CRÍTICO: El bot YA ESTÁ CORRIENDO en otra ventana.")
-             print("❌ Cierra esta ventana y usa la existente.")
-             sys.exit(1)
-
-    # Create lock
+            code = ctypes.c_ulong()
+            ctypes.windll.kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+            return code.value == STILL_ACTIVE
+        finally:
+            ctypes.windll.kernel32.CloseHandle(handle)
     try:
-        # On Windows, opening with 'x' (exclusive creation) isn't atomic locking against other processes opening it?
-        # A better way is to keep the file OPEN.
-        global lock_handle
-        lock_handle = open(LOCK_FILE, 'w')
-        lock_handle.write(str(os.getpid()))
-        lock_handle.flush()
-    except IOError:
-        print("❌ ERROR: No se pudo crear el archivo lock.")
-        sys.exit(1)
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True # Exists, owned by someone else
+    return True
 
-def release_lock():
-    global lock_handle
-    if lock_handle:
-        lock_handle.close()
-    if os.path.exists(LOCK_FILE):
+def acquire_lock():
+    """Creates the lock atomically. A lock left by a dead runner is replaced; a live one aborts."""
+    for _ in range(2):
         try:
-            os.remove(LOCK_FILE)
-        except:
-            pass
+            fd = os.open(LOCK_FILE, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                with open(LOCK_FILE, 'r') as f:
+                    old_pid = int(f.read().strip() or 0)
+            except (OSError, ValueError):
+                old_pid = 0
+            if pid_alive(old_pid):
+                print(f"❌ ERROR CRÍTICO: El bot YA ESTÁ CORRIENDO (runner PID {old_pid}).")
+                print("❌ Cierra esta ventana y usa la existente.")
+                sys.exit(1)
+            print(f"⚠️ {LOCK_FILE} de un proceso terminado (PID {old_pid}). Reemplazándolo.")
+            try:
+                os.remove(LOCK_FILE)
+            except FileNotFoundError:
+                pass
+            continue
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(os.getpid()))
+        return
+    print("❌ ERROR: No se pudo crear el archivo lock.")
+    sys.exit(1)
 
-class RestartHandler(FileSystemEventHandler):
-    def __init__(self, process):
-        self.process = process
-        self.last_restart = 0
+def release_lock():
+    try:
+        with open(LOCK_FILE, 'r') as f:
+            if int(f.read().strip() or 0) != os.getpid():
+                return
+        os.remove(LOCK_FILE)
+    except (OSError, ValueError):
+        pass
+
+# --- Control socket ---
+
+def control_request(payload, timeout):
+    with socket.create_connection((CONTROL_HOST, CONTROL_PORT), timeout=timeout) as conn:
+        conn.settimeout(timeout)
+        conn.sendall(json.dumps(payload).encode("utf-8") + b"\n")
+        return json.loads(conn.makefile("rb").readline() or b"{}")
+
+def request_reload(module):
+    """
+    Asks the running bot to reload `module` in place.
+    True: reloaded everywhere • False: reload failed (old code keeps running) • None: restart needed.
+    """
+    try:
+        reply = control_request({"op": "reload", "module": module}, RELOAD_TIMEOUT)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Socket de control no disponible ({e}).")
+        return None
+    if reply.get("restart"):
+        return None
+    for bot_name, ok, detail in reply.get("results", []):
+        print(f"   {'✅' if ok else '❌'} {bot_name}: {detail}")
+    return bool(reply.get("ok"))
+
+# --- Watching ---
+
+def _globs(value):
+    return [g.strip() for g in value.split(',') if g.strip()]
+
+class WatchFilter:
+    def __init__(self, root="."):
+        self.root = os.path.abspath(root)
+        self.include = _globs(os.getenv('RUNNER_WATCH_INCLUDE', DEFAULT_INCLUDE))
+        self.ignore = _globs(os.getenv('RUNNER_WATCH_IGNORE', DEFAULT_IGNORE))
+
+    def accepts(self, path) -> bool:
+        rel = os.path.relpath(os.path.abspath(path), self.root).replace(os.sep, "/")
+        if rel.startswith(".."):
+            return False
+        if any(fnmatch.fnmatch(rel, g) for g in self.ignore):
+            return False
+        return any(fnmatch.fnmatch(rel, g) or fnmatch.fnmatch(os.path.basename(rel), g) for g in self.include)
+
+class ChangeCollector(FileSystemEventHandler):
+    """Collects accepted paths; the supervisor drains them once the tree has been quiet for a moment."""
+    def __init__(self, watch_filter: WatchFilter):
+        self.filter = watch_filter
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.last_event = 0.0
+
+    def _add(self, path):
+        if path and self.filter.accepts(path):
+            with self.lock:
+                self.pending.add(os.path.abspath(path))
+                self.last_event = time.monotonic()
 
     def on_modified(self, event):
-        if event.src_path.endswith(".py"):
-            # Debounce restarts (wait at least 2 seconds between restarts)
-            if time.time() - self.last_restart < 2:
-                return
-            
-            self.last_restart = time.time()
-            print(f"\n🔄 Detectado cambio en {event.src_path}. Reiniciando bot...")
+        if not event.is_directory:
+            self._add(event.src_path)
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self._add(event.src_path)
+
+    def on_moved(self, event):
+        # Editors often save by writing a temp file and renaming it over the original
+        if not event.is_directory:
+            self._add(getattr(event, 'dest_path', None))
+
+    def drain(self):
+        with self.lock:
+            if not self.pending or time.monotonic() - self.last_event < COALESCE_SECONDS:
+                return []
+            paths, self.pending = sorted(self.pending), set()
+            return paths
+
+# --- Supervisor ---
+
+class BotSupervisor:
+    def __init__(self):
+        self.process = None
+        self.started_at = 0.0
+        self.crashes = []          # Monotonic times of recent crashes
+        self.consecutive = 0
+        self.next_start = None     # Pending (backoff) restart time
+        self.halted = False        # Crash loop: wait for a file change
+        self.last_pong = 0.0
+        self.heartbeat_armed = False
+        self.next_ping = 0.0
+
+    def spawn(self):
+        # The bot opens its control socket on this port (hot reload + heartbeat)
+        self.process = subprocess.Popen([sys.executable, "main.py"], env={**os.environ, 'BOT_CONTROL_PORT': str(CONTROL_PORT)})
+        self.started_at = time.monotonic()
+        self.last_pong = self.started_at
+        self.heartbeat_armed = False
+        self.next_ping = self.started_at + HEARTBEAT_INTERVAL
+        self.next_start = None
+        print(f"🚀 Bot iniciado (PID {self.process.pid})")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
             try:
-                self.process.terminate()
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
                 self.process.wait()
-            except:
-                pass
-            self.process = subprocess.Popen([sys.executable, "main.py"])
+
+    def restart(self, reason):
+        print(f"\n🔄 {reason}. Reiniciando bot...")
+        self.stop()
+        self.spawn()
+
+    def on_exit(self, code):
+        now = time.monotonic()
+        uptime = now - self.started_at
+        if uptime >= STABLE_SECONDS:
+            self.consecutive = 0
+        self.consecutive += 1
+        self.crashes = [t for t in self.crashes if now - t < CRASH_LOOP_WINDOW] + [now]
+        self.process = None
+
+        if len(self.crashes) >= CRASH_LOOP_COUNT:
+            self.halted = True
+            print(f"🛑 Crash loop: {len(self.crashes)} caídas en {CRASH_LOOP_WINDOW}s (último código {code}). "
+                  "Reinicios automáticos en pausa hasta que cambie un archivo.")
+            return
+
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self.consecutive - 1))
+        self.next_start = now + delay
+        print(f"⚠️ El bot se detuvo (código {code}, {uptime:.0f}s en línea). Reiniciando en {delay} segundos...")
+
+    def check_heartbeat(self):
+        now = time.monotonic()
+        if now < self.next_ping:
+            return
+        self.next_ping = now + HEARTBEAT_INTERVAL
+        try:
+            reply = control_request({"op": "ping"}, timeout=5)
+            if reply.get("ok"):
+                self.last_pong = now
+                self.heartbeat_armed = True
+        except (OSError, ValueError):
+            pass
+
+        # Only enforced once the bot has answered at least once (cluster mode has no control socket)
+        silent = now - self.last_pong
+        if self.heartbeat_armed and silent > HEARTBEAT_TIMEOUT:
+            self.restart(f"El bot no responde desde hace {silent:.0f}s (bloqueado)")
+
+    def apply_changes(self, paths):
+        paths = [p for p in paths if not is_tooling(module_for_path(p))] # Only matters with a custom RUNNER_WATCH_IGNORE
+        if not paths:
+            return
+        modules = [module_for_path(p) for p in paths]
+        names = ", ".join(os.path.relpath(p) for p in paths)
+
+        if self.halted or self.process is None:
+            self.halted = False
+            self.crashes.clear()
+            self.consecutive = 0
+            print(f"\n🔧 Cambios detectados ({names}). Iniciando bot...")
+            self.spawn()
+            return
+
+        if any(m is None or needs_restart(m) for m in modules):
+            self.restart(f"Detectado cambio en {names}")
+            return
+
+        for module in modules:
+            print(f"\n♻️ Detectado cambio en {module}. Recargando en caliente...")
+            reloaded = request_reload(module)
+            if reloaded is None:
+                self.restart("Recarga en caliente no disponible")
+                return
+            if not reloaded:
+                print("⚠️ La recarga en caliente falló. Se mantiene la versión anterior en ejecución.")
+
+    def run(self, collector: ChangeCollector):
+        self.spawn()
+        while True:
+            time.sleep(0.25)
+            changes = collector.drain()
+            if changes:
+                self.apply_changes(changes)
+
+            if self.process is not None:
+                code = self.process.poll()
+                if code is not None:
+                    self.on_exit(code)
+                else:
+                    self.check_heartbeat()
+            elif self.next_start is not None and not self.halted and time.monotonic() >= self.next_start:
+                self.spawn()
 
 def start_bot():
     acquire_lock()
     atexit.register(release_lock)
-    
+
     print("🚀 Iniciando bot con auto-reload... (Singleton Mode)")
-    process = subprocess.Popen([sys.executable, "main.py"])
-    event_handler = RestartHandler(process)
+    collector = ChangeCollector(WatchFilter("."))
     observer = Observer()
-    observer.schedule(event_handler, path=".", recursive=True)
+    observer.schedule(collector, path=".", recursive=True)
     observer.start()
 
+    supervisor = BotSupervisor()
     try:
-        while True:
-            time.sleep(1)
-            if process.poll() is not None:
-                # Bot crashed or stopped
-                print("⚠️ El bot se detuvo. Reiniciando en 5 segundos...")
-                time.sleep(5)
-                process = subprocess.Popen([sys.executable, "main.py"])
-                event_handler.process = process
+        supervisor.run(collector)
     except KeyboardInterrupt:
-        observer.stop()
-        try:
-            process.terminate()
-        except:
-            pass
+        pass
     finally:
+        observer.stop()
+        supervisor.stop()
         observer.join()
         release_lock()
 
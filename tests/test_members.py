@@ -0,0 +1,29 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils_db import GUILD_DEFAULTS, LEGACY_ENV_DEFAULTS
+from utils_members import intents_for
+
+def test_defaults_request_no_privileged_intent():
+    intents = intents_for(GUILD_DEFAULTS)
+    assert not intents.members
+    assert not intents.message_content
+
+def test_tickets_only_guild_requests_no_privileged_intent():
+    conf = dict(GUILD_DEFAULTS, enable_letters=False, enable_birthdays=False)
+    intents = intents_for(conf)
+    assert intents.guilds and intents.guild_messages
+    assert not intents.members
+    assert not intents.message_content
+
+def test_opt_in_flags_request_their_intents():
+    intents = intents_for(dict(GUILD_DEFAULTS, enable_link_bridge=True, retention_member_events=True))
+    assert intents.members
+    assert intents.message_content
+
+def test_legacy_env_guilds_keep_both_intents():
+    for legacy in LEGACY_ENV_DEFAULTS.values():
+        intents = intents_for(dict(GUILD_DEFAULTS, **legacy))
+        assert intents.members and intents.message_content
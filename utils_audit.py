@@ -0,0 +1,158 @@
+import asyncio
+import io
+import discord
+from utils_metrics import REGISTRY
+import utils_outbound as outbound
+from utils_log import get_logger
+
+log = get_logger("audit")
+
+# Audit-log sink. Cogs publish audit events (letter logs, ticket transcripts...) to a per-guild
+# queue instead of sending them inline; a worker delivers them in batches through the guild's
+# LogBot, so audit traffic uses the log token's rate-limit budget instead of the main bot's.
+# Guilds without a LogBot fall back to delivering through the main bot, still off the hot path
+# (and in the AUDIT class of its outbound scheduler, behind user- and staff-facing sends).
+
+QUEUE_SIZE = 1000        # Events waiting per guild before publishers start waiting
+PUBLISH_TIMEOUT = 2      # Seconds a publisher waits for room before the event is dropped
+BATCH_WINDOW = 1.0       # Seconds to gather events after the first one arrives
+BATCH_MAX = 50           # Events per batch
+EMBEDS_PER_MESSAGE = 10  # Discord limit
+
+class AuditEvent:
+    __slots__ = ("kind", "destinations", "embed", "content", "file_bytes", "filename")
+
+    def __init__(self, kind, destinations, embed=None, content=None, file_bytes=None, filename=None):
+        self.kind = kind
+        self.destinations = destinations
+        self.embed = embed
+        self.content = content
+        self.file_bytes = file_bytes
+        self.filename = filename
+
+class AuditSink:
+    """Bounded queue + delivery worker for one guild."""
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.log_client = None      # LogBot (preferred)
+        self.fallback_client = None # Main bot
+        self.targets = {}           # destination ID -> Messageable
+        self._task = None
+        labels = {'guild': str(guild_id)}
+        self.published = REGISTRY.counter("audit_events_published_total", labels, "Audit events queued")
+        self.delivered = REGISTRY.counter("audit_messages_sent_total", labels, "Audit messages delivered")
+        self.dropped = REGISTRY.counter("audit_events_dropped_total", labels, "Audit events dropped (queue full or undeliverable)")
+        self.depth = REGISTRY.gauge("audit_queue_depth", labels, "Audit events waiting")
+
+    @property
+    def client(self):
+        if self.log_client and self.log_client.is_ready():
+            return self.log_client
+        return self.fallback_client
+
+    def attach(self, client, is_log_bot: bool):
+        if is_log_bot:
+            self.log_client = client
+        else:
+            self.fallback_client = client
+        self.targets.clear() # Targets are bound to the client that resolved them
+        if self._task is None:
+            self._task = asyncio.create_task(self._worker())
+
+    async def publish(self, event: AuditEvent) -> bool:
+        try:
+            await asyncio.wait_for(self.queue.put(event), timeout=PUBLISH_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.dropped.inc()
+            log.warning(f"⚠️ [Audit] Cola llena en {self.guild_id}, evento '{event.kind}' descartado")
+            return False
+        self.published.inc()
+        self.depth.set(self.queue.qsize())
+        return True
+
+    async def _resolve(self, client, target_id):
+        target = self.targets.get(target_id)
+        REGISTRY.counter("cache_requests_total", {'cache': 'audit_targets', 'result': 'miss' if target is None else 'hit'}, "Cache lookups by cache and result").inc()
+        if target is None:
+            target = client.get_channel(target_id) or client.get_user(target_id)
+            if target is None:
+                target = await client.fetch_user(target_id)
+            self.targets[target_id] = target
+        return target
+
+    async def _worker(self):
+        while True:
+            batch = [await self.queue.get()]
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + BATCH_WINDOW
+            while len(batch) < BATCH_MAX:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            self.depth.set(self.queue.qsize())
+            try:
+                await self._deliver(batch)
+            except Exception as e:
+                log.error(f"❌ [Audit] Error entregando lote en {self.guild_id}: {e}")
+
+    async def _deliver(self, batch):
+        client = self.client
+        if client is None:
+            self.dropped.inc(len(batch))
+            return
+
+        # Coalesce plain embeds per destination (up to 10 per message); files go one per message
+        coalesced = {}
+        singles = []
+        for event in batch:
+            for dest in event.destinations:
+                if event.file_bytes is None and event.content is None and event.embed is not None:
+                    coalesced.setdefault(dest, []).append(event.embed)
+                else:
+                    singles.append((dest, event))
+
+        for dest, embeds in coalesced.items():
+            for i in range(0, len(embeds), EMBEDS_PER_MESSAGE):
+                await self._send(client, dest, embeds=embeds[i:i + EMBEDS_PER_MESSAGE])
+
+        for dest, event in singles:
+            kwargs = {'content': event.content}
+            if event.embed is not None:
+                kwargs['embed'] = event.embed
+            if event.file_bytes is not None:
+                kwargs['file'] = discord.File(io.BytesIO(event.file_bytes), filename=event.filename)
+            await self._send(client, dest, **kwargs)
+
+    async def _send(self, client, dest, **kwargs):
+        try:
+            target = await self._resolve(client, dest)
+            await outbound.submit(client, outbound.AUDIT, lambda: target.send(**kwargs), guild_id=self.guild_id, route=outbound.route_for(target))
+            self.delivered.inc()
+        except Exception as e:
+            self.dropped.inc()
+            log.error(f"Error sending log to {dest}: {e}")
+
+_sinks = {}
+
+def get_sink(guild_id) -> AuditSink:
+    sink = _sinks.get(guild_id)
+    if sink is None:
+        sink = _sinks[guild_id] = AuditSink(guild_id)
+    return sink
+
+def register_client(guild_id, client, is_log_bot: bool = False):
+    """Main bots register as fallback deliverers; a LogBot takes over once it is ready."""
+    get_sink(guild_id).attach(client, is_log_bot)
+
+async def publish(guild_id, kind, destinations, embed=None, content=None, file_bytes=None, filename=None) -> bool:
+    """Queues an audit event for `destinations` (channel or user IDs). Never sends inline."""
+    destinations = [d for d in destinations if d]
+    if not destinations:
+        return False
+    event = AuditEvent(kind, destinations, embed, content, file_bytes, filename)
+    return await get_sink(guild_id).publish(event)
@@ -0,0 +1,156 @@
+import asyncio
+import datetime
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from utils_db import DB_DIR, get_db_path
+
+# Online backups of the per-guild SQLite files.
+# The copy uses SQLite's backup API in small page steps from a worker thread, so the
+# source DB stays readable/writable and the event loop is never blocked. Each step only holds the
+# source's read lock while it copies its pages; writers waiting on it get in between steps through
+# their busy timeout (a write from another connection makes the copy start over at the next step).
+
+BACKUP_DIR = os.getenv('BACKUP_DIR') or os.path.join(DB_DIR, "backups")
+BACKUP_PAGES_PER_STEP = 64       # ~256 KB per step with the default 4 KB page size
+BACKUP_STEP_SLEEP = 0.005        # Retry delay when a step finds the source busy/locked (no pause after a normal step)
+BACKUP_SLACK = 600               # Seconds of timer drift tolerated before a scheduled snapshot counts as due
+
+def backup_settings():
+    """Interval (hours, 0 = disabled), max snapshots and max age (days) from the environment."""
+    def as_int(name, default):
+        try: return max(0, int(os.getenv(name, default)))
+        except ValueError: return default
+    return as_int('BACKUP_INTERVAL_HOURS', 24), as_int('BACKUP_KEEP', 14), as_int('BACKUP_MAX_AGE_DAYS', 30)
+
+def _snapshot_prefix(guild_id):
+    return f"letters_{guild_id}_"
+
+def list_backups(guild_id):
+    """Returns the guild's snapshot paths, newest first."""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    prefix = _snapshot_prefix(guild_id)
+    names = [n for n in os.listdir(BACKUP_DIR) if n.startswith(prefix) and n.endswith(".db.gz")]
+    return [os.path.join(BACKUP_DIR, n) for n in sorted(names, reverse=True)]
+
+def _backup_sync(guild_id):
+    src_path = get_db_path(guild_id)
+    if not os.path.exists(src_path):
+        return None
+
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    final_path = os.path.join(BACKUP_DIR, f"{_snapshot_prefix(guild_id)}{stamp}.db.gz")
+    tmp_path = final_path[:-3] + ".tmp"
+
+    src = sqlite3.connect(src_path)
+    dst = sqlite3.connect(tmp_path)
+    try:
+        src.backup(dst, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP)
+    finally:
+        dst.close()
+        src.close()
+
+    try:
+        with open(tmp_path, "rb") as f_in, gzip.open(final_path + ".part", "wb", compresslevel=6) as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.replace(final_path + ".part", final_path)
+    finally:
+        os.remove(tmp_path)
+    return final_path
+
+def newest_backup_age(guild_id):
+    """Seconds since the guild's latest snapshot (None if there is none)."""
+    snapshots = list_backups(guild_id)
+    return time.time() - os.path.getmtime(snapshots[0]) if snapshots else None
+
+def _snapshot_day(path):
+    # letters_<guild>_<YYYYmmdd>-<HHMMSS>.db.gz
+    return os.path.basename(path).rsplit("_", 1)[-1][:8]
+
+def _rotate_sync(guild_id, keep, max_age_days):
+    # The newest snapshot always survives, whatever the limits say
+    newest, *rest = list_backups(guild_id) or [None]
+    cutoff = time.time() - max_age_days * 86400 if max_age_days else None
+    doomed = [path for path in rest if cutoff is not None and os.path.getmtime(path) < cutoff]
+    kept = [path for path in rest if path not in doomed]
+
+    # Over the count limit: extra snapshots of a day that already has a newer one go first
+    # (restarts, /backup_now), so a burst of snapshots can't push out the daily history
+    while keep and len(kept) + 1 > keep:
+        days, victim = {_snapshot_day(newest)}, None
+        for path in kept:
+            if _snapshot_day(path) in days:
+                victim = path
+                break
+            days.add(_snapshot_day(path))
+        victim = victim or kept[-1]
+        kept.remove(victim)
+        doomed.append(victim)
+
+    for path in doomed:
+        os.remove(path)
+    return len(doomed)
+
+_locks = {}
+
+async def backup_guild(guild_id):
+    """Takes one compressed snapshot of the guild DB and rotates old ones. Returns (path, seconds, removed)."""
+    lock = _locks.setdefault(guild_id, asyncio.Lock())
+    async with lock:
+        _, keep, max_age_days = backup_settings()
+        started = time.perf_counter()
+        path = await asyncio.to_thread(_backup_sync, guild_id)
+        removed = await asyncio.to_thread(_rotate_sync, guild_id, keep, max_age_days) if path else 0
+        return path, time.perf_counter() - started, removed
+
+def restore_backup(guild_id, snapshot_path):
+    """
+    Restores a snapshot over the live guild DB (run with the bot stopped).
+    The current DB is kept next to it as `.before-restore`.
+    """
+    db_path = get_db_path(guild_id)
+    tmp_path = db_path + ".restore"
+    with gzip.open(snapshot_path, "rb") as f_in, open(tmp_path, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+
+    try:
+        if os.path.exists(db_path):
+            shutil.copy2(db_path, db_path + ".before-restore")
+        src = sqlite3.connect(tmp_path)
+        dst = sqlite3.connect(db_path)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+    finally:
+        os.remove(tmp_path)
+
+if __name__ == "__main__":
+    # python utils_backup.py list <guild_id>
+    # python utils_backup.py backup <guild_id>
+    # python utils_backup.py restore <guild_id> [snapshot]   (latest if omitted)
+    if len(sys.argv) < 3 or sys.argv[1] not in ("list", "backup", "restore"):
+        print("Uso: python utils_backup.py list|backup|restore <guild_id> [snapshot]")
+        sys.exit(1)
+
+    action, gid = sys.argv[1], int(sys.argv[2])
+    if action == "list":
+        for path in list_backups(gid):
+            print(f"{os.path.basename(path)}  ({os.path.getsize(path) // 1024} KB)")
+    elif action == "backup":
+        path, elapsed, removed = asyncio.run(backup_guild(gid))
+        print(f"💾 Backup creado: {path} ({elapsed:.1f}s, {removed} antiguos eliminados)" if path else "❌ No existe la base de datos.")
+    else:
+        snapshots = list_backups(gid)
+        target = sys.argv[3] if len(sys.argv) > 3 else (snapshots[0] if snapshots else None)
+        if not target:
+            print("❌ No hay backups para este servidor.")
+            sys.exit(1)
+        restore_backup(gid, target)
+        print(f"♻️ Restaurado {target} -> {get_db_path(gid)}")
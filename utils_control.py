@@ -0,0 +1,110 @@
+import asyncio
+import importlib
+import json
+import os
+import sys
+from utils_log import get_logger
+
+log = get_logger("control")
+
+# Local control socket (127.0.0.1 only) used by runner.py to hot-reload code without dropping
+# gateway sessions. One JSON object per line in each direction:
+#   {"op": "ping"}                          -> {"ok": true, "bots": {name: ready}}
+#   {"op": "reload", "module": "cogs.x"}    -> {"ok": bool, "results": [[bot, ok, detail], ...]}
+# Cogs are reloaded with reload_extension() on every bot that has them loaded (their setup()
+# re-registers persistent views). Stateless helper modules are re-imported and then every
+# extension is reloaded so the new definitions are picked up. Modules holding process-wide state
+# (RESTART_MODULES) can't be swapped in place; the runner restarts the process for those.
+
+CONTROL_HOST = "127.0.0.1"
+RESTART_MODULES = {
+    "main", "cluster", "runner", "utils_db", "utils_log", "utils_metrics",
+    "utils_audit", "utils_loopmon", "utils_control",
+    "utils_outbound",   # Per-bot schedulers: a second registry would double the send budgets
+    "utils_record",     # Open recording file
+    "utils_http",       # Shared connector and its metrics collector
+    "utils_retention",  # Queued member leave/join events
+    "utils_ratelimit",  # Cooldown buckets (views hold the old limiter)
+    "utils_profile",    # Capture lock of the running profiler
+    "utils_backup",     # Per-guild backup locks
+}
+# Tooling the bot never imports: a change there needs neither a reload nor a restart
+TOOLING_PACKAGES = ("bench.", "tests.")
+
+def module_for_path(path: str):
+    """'cogs/letters.py' -> 'cogs.letters' (None for non-Python files)."""
+    rel = os.path.relpath(os.path.abspath(path), os.path.dirname(os.path.abspath(__file__)))
+    if not rel.endswith(".py") or rel.startswith(".."):
+        return None
+    return rel[:-3].replace(os.sep, ".").replace("/", ".")
+
+def is_tooling(module) -> bool:
+    return module is not None and module.startswith(TOOLING_PACKAGES)
+
+def needs_restart(module: str) -> bool:
+    if is_tooling(module):
+        return False
+    return module in RESTART_MODULES or not (module.startswith("cogs.") or module.startswith("utils_"))
+
+async def _reload_extension(bot, name):
+    await bot.reload_extension(name)
+    if hasattr(bot, 'sync_commands'):
+        await bot.sync_commands()
+
+async def reload_module(bots, module: str):
+    """Returns a list of (bot_name, ok, detail)."""
+    results = []
+    if module.startswith("cogs."):
+        for bot in bots:
+            if module not in bot.extensions:
+                continue
+            try:
+                await _reload_extension(bot, module)
+                results.append((bot.bot_name, True, f"{module} recargado"))
+            except Exception as e:
+                log.exception(f"❌ [{bot.bot_name}] Error recargando {module}: {e}")
+                results.append((bot.bot_name, False, str(e)))
+        return results
+
+    if module in sys.modules:
+        importlib.reload(sys.modules[module])
+    for bot in bots:
+        for name in list(bot.extensions):
+            try:
+                await _reload_extension(bot, name)
+            except Exception as e:
+                log.exception(f"❌ [{bot.bot_name}] Error recargando {name} tras cambiar {module}: {e}")
+                results.append((bot.bot_name, False, f"{name}: {e}"))
+                break
+        else:
+            results.append((bot.bot_name, True, f"{module} + {len(bot.extensions)} extensiones recargadas"))
+    return results
+
+async def start_control_server(bots, port: int):
+    async def handle(reader, writer):
+        try:
+            request = json.loads(await reader.readline() or b"{}")
+            op = request.get("op")
+            if op == "ping":
+                reply = {"ok": True, "bots": {b.bot_name: b.is_ready() for b in bots}}
+            elif op == "reload" and request.get("module"):
+                module = request["module"]
+                if needs_restart(module):
+                    reply = {"ok": False, "restart": True, "results": []}
+                else:
+                    log.info("♻️ Recarga en caliente de %s", module)
+                    results = await reload_module(bots, module)
+                    reply = {"ok": all(ok for _, ok, _ in results), "results": results}
+            else:
+                reply = {"ok": False, "error": f"operación desconocida: {op}"}
+        except Exception as e:
+            reply = {"ok": False, "error": str(e)}
+        writer.write(json.dumps(reply, ensure_ascii=False).encode("utf-8") + b"\n")
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, CONTROL_HOST, port)
+    log.info("🎛️ Socket de control en %s:%s", CONTROL_HOST, port)
+    return server
@@ -1,20 +1,101 @@
 import aiosqlite
 import os
+import sqlite3
+import time
+from utils_log import get_logger
+from utils_metrics import REGISTRY, DB_BOUNDS
 
-# Base directory for databases
-DB_DIR = os.path.dirname(os.path.abspath(__file__))
+log = get_logger("db")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Base directory for databases (DB_DIR overrides it, e.g. for benchmarks on synthetic data)
+DB_DIR = os.getenv('DB_DIR') or BASE_DIR
 
 def get_db_path(guild_id):
     """Returns the absolute path to the database for a specific guild."""
     return os.path.join(DB_DIR, f"letters_{guild_id}.db")
 
+def _observe_query(sql, started):
+    op = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else "?"
+    REGISTRY.histogram("db_query_seconds", DB_BOUNDS, {'op': op}, "SQLite statement latency by verb").observe(time.perf_counter() - started)
+
+class _TimedCursor(sqlite3.Cursor):
+    # Row stepping happens in fetch*, so large reads are timed as FETCH
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            _observe_query("FETCH", started)
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(size if size is not None else self.arraysize)
+        finally:
+            _observe_query("FETCH", started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            _observe_query("FETCH", started)
+
+class _TimedConnection(sqlite3.Connection):
+    # Runs on aiosqlite's worker thread, so the timings are pure SQLite time (no loop scheduling)
+    def _observe(self, sql, started):
+        _observe_query(sql, started)
+
+    def cursor(self, factory=_TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return self.cursor().execute(sql, parameters)
+        finally:
+            self._observe(sql, started)
+
+    def executemany(self, sql, parameters):
+        started = time.perf_counter()
+        try:
+            return self.cursor().executemany(sql, parameters)
+        finally:
+            self._observe(sql, started)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            self._observe("COMMIT", started)
+
+def connect(db_path):
+    """aiosqlite.connect() with per-statement metrics. Use it for every guild DB connection."""
+    return aiosqlite.connect(db_path, factory=_TimedConnection)
+
+async def add_missing_columns(db, table, columns):
+    """Adds any (name, declaration) column that an older version of `table` is missing."""
+    async with db.execute(f"PRAGMA table_info({table})") as cursor:
+        existing = {row[1] for row in await cursor.fetchall()}
+    for name, decl in columns:
+        if name not in existing:
+            await db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
 async def init_db(guild_ids):
     """Initializes the database tables for the specified list of guild IDs."""
     for guild_id in guild_ids:
         db_path = get_db_path(guild_id)
-        print(f"🛠️ Initializing database for Guild {guild_id} at {db_path}...")
+        log.info("🛠️ Initializing database for Guild %s at %s...", guild_id, db_path)
         
-        async with aiosqlite.connect(db_path) as db:
+        async with connect(db_path) as db:
+            # Pages freed by pruning are given back with incremental vacuum (utils_retention.py).
+            # The mode is free to set on a new file, before its first table
+            async with db.execute("SELECT COUNT(*) FROM sqlite_master") as cursor:
+                (objects,) = await cursor.fetchone()
+            if not objects:
+                await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS letters (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -23,7 +104,9 @@ async def init_db(guild_ids):
                     recipient TEXT,
                     message TEXT,
                     is_anonymous BOOLEAN,
-                    timestamp DATETIME
+                    timestamp DATETIME,
+                    moderation INTEGER DEFAULT 0,
+                    flags TEXT
                 )
             """)
             await db.execute("""
@@ -31,67 +114,254 @@ async def init_db(guild_ids):
                     user_id INTEGER PRIMARY KEY,
                     day INTEGER,
                     month INTEGER,
-                    year INTEGER
+                    year INTEGER,
+                    departed_at REAL
                 )
             """)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS tickets (
+                    channel_id INTEGER PRIMARY KEY,
+                    user_id INTEGER,
+                    ticket_type TEXT,
+                    opened_at DATETIME,
+                    deadline REAL,
+                    warned INTEGER DEFAULT 0,
+                    first_reply_at REAL,
+                    claimed_at REAL,
+                    claimed_by INTEGER
+                )
+            """)
+            # Columns added after the table first shipped
+            await add_missing_columns(db, "birthdays", [("departed_at", "REAL")])
+            # Content filter state (utils_filter.py); only held letters are indexed
+            await add_missing_columns(db, "letters", [("moderation", "INTEGER DEFAULT 0"), ("flags", "TEXT")])
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_letters_held ON letters (id) WHERE moderation = 1")
+            # Letter statistics maintained by triggers (utils_letterstats.py)
+            from utils_letterstats import install as install_letter_stats
+            await install_letter_stats(db)
+            # Archived rows of members who left (utils_retention.py); live rows are not indexed
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_birthdays_departed ON birthdays (departed_at) WHERE departed_at IS NOT NULL")
+            await add_missing_columns(db, "tickets", [
+                ("deadline", "REAL"), ("warned", "INTEGER DEFAULT 0"),
+                ("first_reply_at", "REAL"), ("claimed_at", "REAL"), ("claimed_by", "INTEGER")
+            ])
+            # Ticket SLA histograms: one row per (day, metric, type, staff, bucket), updated incrementally
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS ticket_sla (
+                    day INTEGER,
+                    metric TEXT,
+                    ticket_type TEXT,
+                    staff_id INTEGER,
+                    bucket INTEGER,
+                    count INTEGER,
+                    PRIMARY KEY (day, metric, ticket_type, staff_id, bucket)
+                ) WITHOUT ROWID
+            """)
             await db.commit()
 
+            # Older files need one full VACUUM to switch modes, which rewrites the whole file: it
+            # is left to the next compaction (utils_retention.py) instead of holding up startup
+            async with db.execute("PRAGMA auto_vacuum") as cursor:
+                (auto_vacuum,) = await cursor.fetchone()
+            if auto_vacuum != 2:
+                log.info("🧹 auto_vacuum incremental pendiente en %s: se activará en la próxima compactación (/compact_now)", db_path)
+
+# --- Guild registry ---
+# Every community served by this deployment is described by one entry, either in a registry
+# file (guilds.toml / guilds.json, see guilds.example.toml) or, for older deployments,
+# in .env variables grouped by prefix (GUILD_PREFIXES=ZEROP,IGLESIA -> ZEROP_TOKEN, ...).
+
+REGISTRY_CHECK_INTERVAL = 5 # Seconds between mtime checks of the registry file
+
+# Defaults for any key a guild entry doesn't set
+GUILD_DEFAULTS = {
+    'name': None,
+    'emoji': "⚪",
+    'token': None,
+    'log_token': None,
+    'status_channel_id': None,
+    'birthday_channel_id': None,
+    'ticket_support_role_id': [],
+    'ticket_log_channel_id': None,
+    'ops_log_channel_id': None,
+    'admin_ids': [],
+    'log_recipients': [],
+    # Feature Flags
+    'enable_letters': True,
+    'enable_tickets': True,
+    'enable_birthdays': True,
+    'enable_staff_applications': False,
+    'enable_link_bridge': False,    # Admin listener for web_tools link messages (needs message content)
+    # Gateway member cache: "all" (chunk at startup), "lazy" (members looked up) or "none" (see utils_members.py)
+    'member_cache': "lazy",
+    # Letters content filter list (default filters/letters_<guild_id>.txt, see utils_filter.py)
+    'letter_filter_file': None,
+    # Tickets
+    'ticket_pool_size': 0,
+    'ticket_max_per_type': 1,
+    'ticket_autoclose_hours': 0,
+    'ticket_autoclose_grace_minutes': 60,
+    # Retention in days, 0 = keep forever (see utils_retention.py)
+    'retention_departed_days': 30,  # Birthdays of members who left (archived until then)
+    'retention_member_events': False,  # Archive on leave/join events too (needs the members intent)
+    'retention_letters_days': 0,    # Letters, by the date they were written
+    'retention_sla_days': 0,        # Ticket SLA histogram days
+}
+STRING_KEYS = {'name', 'emoji', 'token', 'log_token', 'member_cache', 'letter_filter_file'}
+# Env names that don't follow the <PREFIX>_<KEY> pattern
+LEGACY_ENV_NAMES = {'admin_ids': 'ADMIN_USER_ID'}
+ENV_ALIASES = {'enable_staff_applications': 'STAFF_APPLICATIONS'}
+# Values the two original communities had hardcoded before the registry, so .env deployments keep
+# them; any <PREFIX>_<KEY> variable overrides them
+LEGACY_ENV_DEFAULTS = {
+    'ZEROP': {'name': "Comunidad Zero", 'emoji': "🟢", 'status_channel_id': 1473927006520344626, 'enable_staff_applications': True,
+              'enable_link_bridge': True, 'retention_member_events': True},
+    'IGLESIA': {'name': "Comunidad SA Iglesia", 'emoji': "🟣", 'status_channel_id': 1471653028594581655,
+                'enable_link_bridge': True, 'retention_member_events': True},
+}
+
+# helper to clean IDs
+def clean_id(val):
+    if val is None or val == "": return None
+    try: return int(str(val).strip())
+    except: return None
+
+# helper to clean ID lists (accepts "1,2,3" or [1, "2"])
+def clean_id_list(val):
+    if not val: return []
+    if isinstance(val, (int, str)):
+        val = str(val).split(',')
+    return [int(str(x).strip()) for x in val if str(x).strip().isdigit()]
+
+# helper for booleans
+def clean_bool(val, default=True):
+    if val is None: return default
+    if isinstance(val, bool): return val
+    return str(val).lower() in ('true', '1', 'yes', 'on')
+
+# helper for non-negative integers (with default)
+def clean_int(val, default=0):
+    if val is None or val == "": return default
+    try: return max(0, int(str(val).strip()))
+    except: return default
+
+def normalize_guild_entry(guild_id, raw: dict) -> dict:
+    """Applies defaults and type coercion to one raw registry entry."""
+    conf = {}
+    for key, default in GUILD_DEFAULTS.items():
+        val = raw.get(key)
+        if key in STRING_KEYS:
+            conf[key] = val if val else default
+        elif isinstance(default, bool):
+            conf[key] = clean_bool(val, default)
+        elif isinstance(default, list):
+            conf[key] = clean_id_list(val)
+        elif isinstance(default, int):
+            conf[key] = clean_int(val, default)
+        else:
+            conf[key] = clean_id(val)
+
+    # Secrets can stay in the environment: token_env = "ZEROP_TOKEN"
+    for key in ('token', 'log_token'):
+        if not conf[key] and raw.get(f"{key}_env"):
+            conf[key] = os.getenv(raw[f"{key}_env"])
+
+    conf['name'] = conf['name'] or f"Guild {guild_id}"
+    return conf
+
+def _read_registry_file(path):
+    if path.endswith(".toml"):
+        import tomllib
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+        entries = data.get('guild', [])
+    else:
+        import json
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        entries = data.get('guilds', []) if isinstance(data, dict) else data
+
+    guilds = {}
+    for raw in entries:
+        guild_id = clean_id(raw.get('id'))
+        if guild_id:
+            guilds[guild_id] = normalize_guild_entry(guild_id, raw)
+    return guilds
+
+def _read_registry_env():
+    guilds = {}
+    prefixes = os.getenv('GUILD_PREFIXES', 'ZEROP,IGLESIA')
+    for prefix in [p.strip().upper() for p in prefixes.split(',') if p.strip()]:
+        guild_id = clean_id(os.getenv(f"{prefix}_GUILD_ID"))
+        if not guild_id:
+            if prefix in LEGACY_ENV_DEFAULTS:
+                log.warning(f"⚠️ {prefix}_GUILD_ID no está definido: se omite {LEGACY_ENV_DEFAULTS[prefix]['name']}")
+            continue
+        raw = dict(LEGACY_ENV_DEFAULTS.get(prefix, {}))
+        for key in GUILD_DEFAULTS:
+            val = os.getenv(f"{prefix}_{LEGACY_ENV_NAMES.get(key, key.upper())}")
+            if not val and key in ENV_ALIASES:
+                val = os.getenv(f"{prefix}_{ENV_ALIASES[key]}")
+            if val:
+                raw[key] = val
+        guilds[guild_id] = normalize_guild_entry(guild_id, raw)
+    return guilds
+
+class GuildRegistry:
+    """All configured guilds indexed by ID. Reloads itself when the registry file changes."""
+    def __init__(self):
+        self.guilds = {}
+        self.source = None
+        self._mtime = None
+        self._checked = 0.0
+
+    def registry_path(self):
+        path = os.getenv('GUILD_REGISTRY_FILE')
+        if path:
+            return path if os.path.isabs(path) else os.path.join(BASE_DIR, path)
+        for name in ("guilds.toml", "guilds.json"):
+            candidate = os.path.join(BASE_DIR, name)
+            if os.path.exists(candidate):
+                return candidate
+        return None
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and self.source is not None and now - self._checked < REGISTRY_CHECK_INTERVAL:
+            return
+        self._checked = now
+
+        path = self.registry_path()
+        if path and os.path.exists(path):
+            mtime = os.path.getmtime(path)
+            if force or self.source != path or mtime != self._mtime:
+                try:
+                    self.guilds = _read_registry_file(path)
+                    self.source, self._mtime = path, mtime
+                    log.info("📒 Registro de servidores cargado: %s servidores (%s)", len(self.guilds), os.path.basename(path))
+                except Exception as e:
+                    # Keep serving the last good registry
+                    log.error(f"❌ Error leyendo {path}: {e}")
+        elif self.source is None or force:
+            from dotenv import load_dotenv
+            load_dotenv()
+            self.guilds = _read_registry_env()
+            self.source = "env"
+
+    def get(self, guild_id):
+        self.refresh()
+        return self.guilds.get(guild_id)
+
+    def all(self):
+        self.refresh()
+        return self.guilds
+
+registry = GuildRegistry()
+
 def load_server_config():
-    """Loads per-server configuration from environment variables."""
-    from dotenv import load_dotenv
-    load_dotenv()
-    
-    config = {}
-    
-    # helper to clean IDs
-    def clean_id(val):
-        if not val: return None
-        try: return int(val.strip())
-        except: return None
-
-    # helper to clean ID lists
-    def clean_id_list(val):
-        if not val: return []
-        val = str(val)
-        return [int(x.strip()) for x in val.split(',') if x.strip().isdigit()]
-
-    # helper for booleans (default True)
-    def clean_bool(val):
-        if val is None: return True
-        return val.lower() in ('true', '1', 'yes', 'on')
-
-    # ZEROP
-    zerop_id = clean_id(os.getenv('ZEROP_GUILD_ID'))
-    if zerop_id:
-        config[zerop_id] = {
-            'token': os.getenv('ZEROP_TOKEN'),
-            'log_token': os.getenv('ZEROP_LOG_TOKEN'),
-            'birthday_channel_id': clean_id(os.getenv('ZEROP_BIRTHDAY_CHANNEL_ID')),
-            'ticket_support_role_id': clean_id_list(os.getenv('ZEROP_TICKET_SUPPORT_ROLE_ID')),
-            'ticket_log_channel_id': clean_id(os.getenv('ZEROP_TICKET_LOG_CHANNEL_ID')),
-            'admin_ids': clean_id_list(os.getenv('ZEROP_ADMIN_USER_ID')),
-            'log_recipients': clean_id_list(os.getenv('ZEROP_LOG_RECIPIENTS')),
-            # Feature Flags
-            'enable_letters': clean_bool(os.getenv('ZEROP_ENABLE_LETTERS')),
-            'enable_tickets': clean_bool(os.getenv('ZEROP_ENABLE_TICKETS')),
-            'enable_birthdays': clean_bool(os.getenv('ZEROP_ENABLE_BIRTHDAYS'))
-        }
-
-    # IGLESIA
-    iglesia_id = clean_id(os.getenv('IGLESIA_GUILD_ID'))
-    if iglesia_id:
-        config[iglesia_id] = {
-            'token': os.getenv('IGLESIA_TOKEN'),
-            'log_token': os.getenv('IGLESIA_LOG_TOKEN'),
-            'birthday_channel_id': clean_id(os.getenv('IGLESIA_BIRTHDAY_CHANNEL_ID')),
-            'ticket_support_role_id': clean_id_list(os.getenv('IGLESIA_TICKET_SUPPORT_ROLE_ID')),
-            'ticket_log_channel_id': clean_id(os.getenv('IGLESIA_TICKET_LOG_CHANNEL_ID')),
-            'admin_ids': clean_id_list(os.getenv('IGLESIA_ADMIN_USER_ID')),
-            'log_recipients': clean_id_list(os.getenv('IGLESIA_LOG_RECIPIENTS')),
-            # Feature Flags
-            'enable_letters': clean_bool(os.getenv('IGLESIA_ENABLE_LETTERS')),
-            'enable_tickets': clean_bool(os.getenv('IGLESIA_ENABLE_TICKETS')),
-            'enable_birthdays': clean_bool(os.getenv('IGLESIA_ENABLE_BIRTHDAYS'))
-        }
-        
-    return config
+    """Returns the per-server configuration ({guild_id: conf}) from the guild registry."""
+    return registry.all()
+
+def get_guild_config(guild_id):
+    """Returns one guild's configuration, or None if it isn't registered."""
+    return registry.get(guild_id)
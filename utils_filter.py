@@ -0,0 +1,199 @@
+import json
+import os
+import re
+import time
+import unicodedata
+from utils_db import BASE_DIR, get_guild_config
+from utils_log import get_logger
+
+log = get_logger("filter")
+
+# Per-guild content filter for letters. The list is a text file, one entry per line:
+#   palabra            whole word or phrase; case, accents and common look-alikes (0/o, 4/@/a,
+#                      1/i, 3/e, 5/$/s, 7/t) are ignored, spaces match any run of whitespace
+#   re:<regex>         Python regex, run on the same normalized text (lowercase, no accents)
+#   # comment
+# The file is the guild's `letter_filter_file` (relative to the bot directory) or, by default,
+# filters/letters_<guild_id>.txt (FILTER_DIR overrides the directory); no file = no filter.
+# Words are folded into a trie compiled into ONE pattern, so they cost a single pass over the letter
+# however long the list is; each regex is its own pass (the engine can then use its literal prefix),
+# so keep those few. The file is re-read when its mtime changes (checked
+# at most every FILTER_CHECK_INTERVAL seconds); a list that cannot be read keeps the last good one.
+# Letters have a moderation state: CLEAN (nothing matched when screened), HELD (kept out of the
+# release until a moderator approves or deletes it) or APPROVED (never screened again).
+
+FILTER_DIR = os.getenv('FILTER_DIR') or os.path.join(BASE_DIR, "filters")
+FILTER_CHECK_INTERVAL = 5
+MAX_SPANS = 20          # Matches stored per letter
+
+CLEAN, HELD, APPROVED = 0, 1, 2
+
+_LOOKALIKES = {'a': "4@", 'e': "3", 'i': "1!", 'o': "0", 's': "5$", 't': "7"}
+
+def _fold_table():
+    # 1:1 character replacements only, so match spans are valid on the original text. Folding
+    # case here instead of compiling with IGNORECASE halves the scan time.
+    table = {code: code + 32 for code in range(ord("A"), ord("Z") + 1)}
+    for code in range(0xC0, 0x250):
+        base = unicodedata.normalize("NFD", chr(code))[0].lower()
+        if base != chr(code) and len(base) == 1 and base.isascii():
+            table[code] = base
+    return table
+
+_FOLD = _fold_table()
+_ACCENTS = {chr(code): base for code, base in _FOLD.items() if code > 0x7F and chr(code).lower() == chr(code)}
+_NON_ASCII = re.compile(r"[^\x00-\x7f]")
+
+def _fold_char(match):
+    return _ACCENTS.get(match.group(), match.group())
+
+def fold(text: str) -> str:
+    """Lowercase text without accents (same length, so spans map back to the original)."""
+    lowered = text.lower()
+    if len(lowered) != len(text): # A few characters lowercase to two
+        return text.translate(_FOLD)
+    # str.translate looks up every character; only the non-ASCII ones need it (3x faster)
+    return _NON_ASCII.sub(_fold_char, lowered)
+
+def _char_pattern(ch):
+    if ch.isspace():
+        return r"\s+"
+    variants = _LOOKALIKES.get(ch)
+    if variants:
+        return "[" + re.escape(ch + variants) + "]"
+    return re.escape(ch)
+
+def _trie_pattern(words):
+    """One regex for a set of words, with shared prefixes factored (no backtracking across words)."""
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = None
+
+    def emit(node):
+        branches = [_char_pattern(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return emit(trie)
+
+def _normalize_word(word):
+    return " ".join(fold(word).split())
+
+class LetterFilter:
+    """A compiled word/regex list. scan() returns [(start, end, rule)] on the original text."""
+    def __init__(self, lines, source=""):
+        words, self.rules = set(), []  # rules: [(line, compiled)]
+        for number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("re:"):
+                try:
+                    self.rules.append((line, re.compile(line[3:])))
+                except re.error as e:
+                    log.warning(f"⚠️ Filtro {source}:{number}: regex inválida ({e}), ignorada")
+            else:
+                words.add(_normalize_word(line))
+        words.discard("")
+        self.words = re.compile(rf"(?<!\w){_trie_pattern(words)}(?!\w)") if words else None
+        self.size = len(words) + len(self.rules)
+
+    def scan(self, text: str) -> list:
+        if not text or not self.size:
+            return []
+        folded = fold(text)
+        spans = []
+        if self.words is not None:
+            spans.extend((m.start(), m.end(), m.group()) for _, m in zip(range(MAX_SPANS), self.words.finditer(folded)))
+        for line, pattern in self.rules:
+            # An empty-matching regex would flag everything
+            spans.extend((m.start(), m.end(), line) for _, m in zip(range(MAX_SPANS), pattern.finditer(folded)) if m.end() > m.start())
+        spans.sort()
+        return spans[:MAX_SPANS]
+
+    def screen(self, letters) -> list:
+        """[(letter_id, spans)] for the (letter_id, text) pairs that match (the release pass)."""
+        flagged = []
+        for letter_id, text in letters:
+            spans = self.scan(text)
+            if spans:
+                flagged.append((letter_id, spans))
+        return flagged
+
+def encode_spans(spans) -> str:
+    return json.dumps(spans, ensure_ascii=False, separators=(",", ":"))
+
+def decode_spans(value) -> list:
+    try:
+        return [tuple(s) for s in json.loads(value)] if value else []
+    except ValueError:
+        return []
+
+def highlight(text: str, spans, context=None) -> str:
+    """Text with the matched spans in bold+underline; with `context`, only that many characters around the first one."""
+    spans = sorted(spans)
+    begin, end = 0, len(text)
+    if context is not None and spans:
+        begin, end = max(0, spans[0][0] - context), min(len(text), spans[0][1] + context)
+    out, last = [], begin
+    for start, stop, _ in spans:
+        if start < last or stop > end:
+            continue
+        out.append(text[last:start] + "__**" + text[start:stop] + "**__")
+        last = stop
+    out.append(text[last:end])
+    return ("…" if begin else "") + "".join(out) + ("…" if end < len(text) else "")
+
+# --- Per-guild lists, hot reloaded ---
+
+class _FilterFile:
+    def __init__(self):
+        self.path = None
+        self.mtime = None
+        self.checked = 0.0
+        self.filter = None
+
+_files = {}  # guild_id -> _FilterFile
+
+def filter_path(guild_id) -> str:
+    conf = get_guild_config(guild_id) or {}
+    path = conf.get('letter_filter_file')
+    if path:
+        return path if os.path.isabs(path) else os.path.join(BASE_DIR, path)
+    return os.path.join(FILTER_DIR, f"letters_{guild_id}.txt")
+
+def get_filter(guild_id):
+    """The guild's LetterFilter, or None when it has no list."""
+    entry = _files.setdefault(guild_id, _FilterFile())
+    now = time.monotonic()
+    if now - entry.checked < FILTER_CHECK_INTERVAL and entry.path is not None:
+        return entry.filter
+    entry.checked = now
+
+    path = filter_path(guild_id)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        if entry.filter is not None:
+            log.info("🧹 Filtro de cartas desactivado para %s (%s no existe)", guild_id, path, extra={"guild": guild_id})
+        entry.path, entry.mtime, entry.filter = path, None, None
+        return None
+
+    if path != entry.path or mtime != entry.mtime:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+            started = time.perf_counter()
+            entry.filter = LetterFilter(lines, os.path.basename(path))
+            log.info("🚩 Filtro de cartas cargado para %s: %s entradas en %.1f ms (%s)", guild_id, entry.filter.size,
+                     (time.perf_counter() - started) * 1000, os.path.basename(path), extra={"guild": guild_id})
+        except (OSError, UnicodeDecodeError, re.error, RecursionError) as e:
+            # Keep screening with the last good list
+            log.error(f"❌ Error cargando el filtro {path}: {e}", extra={"guild": guild_id})
+        entry.path, entry.mtime = path, mtime
+    return entry.filter
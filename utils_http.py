@@ -0,0 +1,81 @@
+import os
+import aiohttp
+from utils_metrics import REGISTRY
+from utils_log import get_logger
+
+log = get_logger("http")
+
+# Shared HTTP layer for the bots of one process (SHARED_HTTP=1, the default; 0 = one pool per bot
+# as discord.py does by default).
+#   Connection pool: every bot's session uses the same TCPConnector, so REST calls of all tokens
+#   reuse the same keep-alive connections to discord.com and one DNS cache. Only the sockets are
+#   shared: sessions, the Authorization header and discord.py's per-token rate-limit buckets
+#   stay per bot. Gateway websockets hold a pool connection each, so the limit gets one extra
+#   slot per bot.
+#     HTTP_POOL_LIMIT=100     REST connections in the pool (0 = unlimited)
+#     HTTP_KEEPALIVE=30       seconds an idle connection is kept
+#     HTTP_DNS_TTL=300        seconds a DNS answer is cached
+
+def shared_http_enabled() -> bool:
+    return os.getenv('SHARED_HTTP', '1').lower() not in ("0", "false", "no", "off")
+
+def pool_settings():
+    """(limit, keepalive seconds, DNS TTL seconds) from the environment."""
+    def as_int(name, default):
+        try: return max(0, int(os.getenv(name, default)))
+        except ValueError: return default
+    return as_int('HTTP_POOL_LIMIT', 100), as_int('HTTP_KEEPALIVE', 30), as_int('HTTP_DNS_TTL', 300)
+
+async def _noop():
+    pass
+
+class SharedConnector(aiohttp.TCPConnector):
+    """
+    TCPConnector that outlives the sessions using it: discord.py closes its session (and with it
+    the connector) when a bot stops, which must not cut the other bots off. shutdown() closes it.
+    """
+    def close(self, *, abort_ssl: bool = False):
+        return _noop()
+
+    def shutdown(self):
+        return super().close()
+
+    def stats(self) -> dict:
+        idle = sum(len(conns) for conns in self._conns.values())
+        return {'idle': idle, 'in_use': len(self._acquired)}
+
+_connector = None
+
+def shared_connector(bots: int = 0):
+    """The process-wide connector (created on first use, inside the running loop)."""
+    global _connector
+    if _connector is None or _connector.closed:
+        limit, keepalive, dns_ttl = pool_settings()
+        _connector = SharedConnector(
+            limit=limit + bots if limit else 0,
+            keepalive_timeout=keepalive,
+            ttl_dns_cache=dns_ttl,
+            use_dns_cache=dns_ttl > 0,
+        )
+        log.info("🔌 Pool HTTP compartido: límite %s (+%s gateways), keep-alive %ss, DNS %ss", limit or '∞', bots, keepalive, dns_ttl)
+    return _connector
+
+def client_http_options(bots: int = 0) -> dict:
+    """Client kwargs for a bot of this process: the shared connector when enabled."""
+    if not shared_http_enabled():
+        return {}
+    return {'connector': shared_connector(bots)}
+
+def _collect():
+    if _connector is not None and not _connector.closed:
+        for state, value in _connector.stats().items():
+            REGISTRY.gauge("http_pool_connections", {'state': state}, "Connections in the shared HTTP pool").set(value)
+
+REGISTRY.add_collector(_collect)
+
+async def close_shared():
+    global _connector
+    if _connector is not None:
+        await _connector.shutdown()
+        _connector = None
+
@@ -0,0 +1,123 @@
+import time
+from utils_db import get_db_path, connect as db_connect
+
+# Letter statistics kept up to date by SQLite triggers in the guild DB, so /letters_stats reads a
+# handful of aggregate rows instead of the mailbox. One row per (kind, key):
+#   total      ''                        every letter
+#   type       'anonymous' / 'signed'
+#   sender     sender_id (as text)
+#   recipient  recipient mention
+#   hour       '00'..'23', hour of day the letter was written
+#   held       ''                        letters held by the content filter (utils_filter.py)
+# Inserts add one to each of their rows and deletes subtract one (sender/recipient rows that reach
+# zero are removed); a change of moderation state moves the held count. Rows written without the
+# triggers (imports, restores of older files) are counted by rebuild().
+
+STATS_TABLE = """
+    CREATE TABLE IF NOT EXISTS letter_stats (
+        kind TEXT,
+        key TEXT,
+        count INTEGER,
+        PRIMARY KEY (kind, key)
+    ) WITHOUT ROWID
+"""
+# Top senders/recipients walk this index backwards: no sort, whatever the number of users
+STATS_INDEX = "CREATE INDEX IF NOT EXISTS idx_letter_stats_rank ON letter_stats (kind, count)"
+
+# Key expressions over a letters row (`row` becomes NEW/OLD in the triggers)
+_KEYS = {
+    'total': "''",
+    'type': "CASE WHEN {row}is_anonymous THEN 'anonymous' ELSE 'signed' END",
+    'sender': "COALESCE(CAST({row}sender_id AS TEXT), '')",
+    'recipient': "COALESCE({row}recipient, '')",
+    'hour': "COALESCE(strftime('%H', {row}timestamp), '??')",
+}
+
+def _keys(row):
+    return {kind: expr.format(row=row) for kind, expr in _KEYS.items()}
+
+def _trigger_sql():
+    new, old = _keys("NEW."), _keys("OLD.")
+    added = ", ".join(f"('{kind}', {key}, 1)" for kind, key in new.items())
+    # One primary key lookup per row (a row-value IN (VALUES ...) would scan the whole table)
+    removed = "\n".join(f"UPDATE letter_stats SET count = count - 1 WHERE kind = '{kind}' AND key = {key};" for kind, key in old.items())
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS letter_stats_insert AFTER INSERT ON letters BEGIN
+            INSERT INTO letter_stats (kind, key, count) VALUES {added}, ('held', '', NEW.moderation IS 1)
+            ON CONFLICT (kind, key) DO UPDATE SET count = count + excluded.count;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS letter_stats_delete AFTER DELETE ON letters BEGIN
+            {removed}
+            UPDATE letter_stats SET count = count - 1 WHERE kind = 'held' AND key = '' AND OLD.moderation IS 1;
+            DELETE FROM letter_stats WHERE kind = 'sender' AND key = {old['sender']} AND count <= 0;
+            DELETE FROM letter_stats WHERE kind = 'recipient' AND key = {old['recipient']} AND count <= 0;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS letter_stats_moderation AFTER UPDATE OF moderation ON letters
+        WHEN (OLD.moderation IS 1) != (NEW.moderation IS 1) BEGIN
+            INSERT INTO letter_stats (kind, key, count) VALUES ('held', '', (NEW.moderation IS 1) - (OLD.moderation IS 1))
+            ON CONFLICT (kind, key) DO UPDATE SET count = count + excluded.count;
+        END
+        """,
+    ]
+
+def _rebuild_sql():
+    keys = _keys("")
+    selects = [f"SELECT '{kind}', {key}, COUNT(*) FROM letters GROUP BY 2" for kind, key in keys.items() if kind != 'total']
+    selects.insert(0, "SELECT 'total', '', COUNT(*) FROM letters")
+    selects.append("SELECT 'held', '', COUNT(*) FROM letters WHERE moderation = 1")
+    return "INSERT INTO letter_stats (kind, key, count) " + " UNION ALL ".join(selects)
+
+async def install(db):
+    """Creates the table and triggers (init_db). A new table is filled from the existing letters."""
+    async with db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'letter_stats'") as cursor:
+        exists = await cursor.fetchone() is not None
+    await db.execute(STATS_TABLE)
+    await db.execute(STATS_INDEX)
+    for statement in _trigger_sql():
+        await db.execute(statement)
+    if not exists:
+        await db.execute(_rebuild_sql())
+
+async def rebuild(guild_id: int) -> tuple:
+    """Recomputes every aggregate from the letters in one transaction. Returns (rows, seconds)."""
+    started = time.perf_counter()
+    async with db_connect(get_db_path(guild_id)) as db:
+        await db.execute("DELETE FROM letter_stats")
+        cursor = await db.execute(_rebuild_sql())
+        await db.commit()
+    return cursor.rowcount, time.perf_counter() - started
+
+async def summarize(guild_id: int, top: int = 10) -> dict:
+    """Totals, per-type and per-hour counts plus the `top` senders and recipients, from the aggregates only."""
+    async with db_connect(get_db_path(guild_id)) as db:
+        async with db.execute("SELECT kind, key, count FROM letter_stats WHERE kind IN ('total', 'type', 'hour', 'held')") as cursor:
+            rows = await cursor.fetchall()
+        ranked = {}
+        for kind in ('sender', 'recipient'):
+            async with db.execute("SELECT key, count FROM letter_stats WHERE kind = ? AND count > 0 ORDER BY count DESC LIMIT ?", (kind, top)) as cursor:
+                ranked[kind] = await cursor.fetchall()
+
+    summary = {'total': 0, 'held': 0, 'anonymous': 0, 'signed': 0, 'hours': {}, 'senders': ranked['sender'], 'recipients': ranked['recipient']}
+    for kind, key, count in rows:
+        if kind == 'type':
+            summary[key] = count
+        elif kind == 'hour':
+            summary['hours'][key] = count
+        else:
+            summary[kind] = count
+    return summary
+
+def hour_chart(hours: dict, width: int = 16) -> str:
+    """Text bar chart of the per-hour counts (one line per hour, for a code block)."""
+    peak = max(hours.values(), default=0)
+    lines = []
+    for hour in range(24):
+        count = hours.get(f"{hour:02d}", 0)
+        bar = "█" * round(count / peak * width) if peak else ""
+        lines.append(f"{hour:02d}h {bar:<{width}} {count}")
+    return "\n".join(lines)
@@ -0,0 +1,99 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+# Logging for every subsystem: loggers only enqueue records on the event loop thread;
+# formatting and I/O (console + rotating JSON file) happen in a QueueListener thread.
+#
+#   LOG_LEVEL=INFO                          default level
+#   LOG_LEVELS=tickets=DEBUG,audit=WARNING  per-subsystem overrides
+#   LOG_DIR=logs, LOG_FILE_MAX_MB=10, LOG_FILE_BACKUPS=5
+#
+# Context fields go in `extra`: log.info("...", extra={"guild": gid, "bot": name, "command": cmd, "latency_ms": ms})
+
+ROOT_LOGGER = "zeroxsa"
+CONTEXT_FIELDS = ("guild", "bot", "command", "latency_ms")
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    # The stock prepare() formats the message on the caller's thread; defer it to the listener
+    def prepare(self, record):
+        return record
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+class ConsoleFormatter(logging.Formatter):
+    def format(self, record):
+        line = f"{time.strftime('%H:%M:%S', time.localtime(record.created))} {record.levelname[0]} {record.getMessage()}"
+        extras = [f"{f}={getattr(record, f)}" for f in CONTEXT_FIELDS if getattr(record, f, None) is not None]
+        if extras:
+            line += "  [" + " ".join(extras) + "]"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+_listener = None
+
+def _parse_levels(spec):
+    levels = {}
+    for item in (spec or "").split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+def setup_logging():
+    """Installs the queue-based pipeline once per process (safe to call again)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    root.propagate = False
+    for name, level in _parse_levels(os.getenv('LOG_LEVELS')).items():
+        logging.getLogger(f"{ROOT_LOGGER}.{name}").setLevel(level)
+
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(ConsoleFormatter())
+    handlers = [console]
+
+    log_dir = os.getenv('LOG_DIR', 'logs')
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            os.path.join(log_dir, f"bot-w{os.getenv('BOT_WORKER')}.jsonl" if os.getenv('BOT_WORKER') else "bot.jsonl"),
+            maxBytes=int(os.getenv('LOG_FILE_MAX_MB', '10')) * 1024 * 1024,
+            backupCount=int(os.getenv('LOG_FILE_BACKUPS', '5')),
+            encoding="utf-8"
+        )
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    log_queue = queue.SimpleQueue()
+    root.addHandler(_DeferredQueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+def get_logger(subsystem: str) -> logging.Logger:
+    """Logger for a subsystem (main, tickets, letters, birthdays, admin, audit, cluster...)."""
+    return logging.getLogger(f"{ROOT_LOGGER}.{subsystem}")
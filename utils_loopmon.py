@@ -0,0 +1,174 @@
+import asyncio
+import collections
+import datetime
+import os
+import sys
+import threading
+import time
+import traceback
+import discord
+import utils_audit as audit
+from utils_db import get_guild_config
+from utils_metrics import REGISTRY
+from utils_log import get_logger
+
+log = get_logger("loop")
+
+# Event-loop lag monitor. Every bot in a process shares one loop, so a single blocking handler
+# stalls all of them. Two parts:
+#  - a ticker task that sleeps LOOP_LAG_INTERVAL and measures how late it wakes up (the lag);
+#  - a watchdog thread that notices when the ticker has not run for SLOW_CALLBACK_MS and grabs the
+#    loop thread's stack plus the running task's name, i.e. the handler that is blocking.
+# When the p99 lag of the last minute goes over LOOP_LAG_SLO_MS, an alert is published to each
+# guild's ops_log_channel_id (or ticket_log_channel_id) through the audit sink.
+
+HISTORY_SECONDS = 600     # Rolling lag history kept in memory
+SLOW_EVENTS_KEPT = 50
+SLO_WINDOW = 60           # Seconds of history the SLO is evaluated over
+LAG_BOUNDS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+def monitor_settings():
+    """(interval s, slow callback threshold s, SLO s, alert cooldown s) from the environment."""
+    def as_float(name, default):
+        try: return max(0.0, float(os.getenv(name, default)))
+        except ValueError: return default
+    return (as_float('LOOP_LAG_INTERVAL', 0.5), as_float('SLOW_CALLBACK_MS', 100) / 1000,
+            as_float('LOOP_LAG_SLO_MS', 250) / 1000, as_float('LOOP_LAG_ALERT_COOLDOWN', 600))
+
+class SlowCallback:
+    __slots__ = ("started", "due", "duration", "task", "stack")
+
+    def __init__(self, due, task, stack):
+        self.started = time.time()
+        self.due = due       # Monotonic time the ticker should have run
+        self.duration = None # Filled in once the loop runs again
+        self.task = task
+        self.stack = stack
+
+class LoopMonitor:
+    def __init__(self, guild_ids):
+        self.guild_ids = list(guild_ids)
+        self.interval, self.slow_threshold, self.slo, self.alert_cooldown = monitor_settings()
+        self.history = collections.deque(maxlen=max(1, int(HISTORY_SECONDS / max(self.interval, 0.05))))
+        self.slow_events = collections.deque(maxlen=SLOW_EVENTS_KEPT)
+        self.last_tick = time.monotonic()
+        self.last_alert = 0.0
+        self.loop = None
+        self.loop_thread_id = None
+        self._task = None
+        self._stop = threading.Event()
+        self._pending = None # SlowCallback currently blocking the loop (watchdog side)
+        self.lag_hist = REGISTRY.histogram("event_loop_lag_seconds", LAG_BOUNDS, None, "How late the loop ticker wakes up")
+        self.lag_gauge = REGISTRY.gauge("event_loop_lag_last_seconds", None, "Most recent loop lag sample")
+        self.slow_counter = REGISTRY.counter("event_loop_slow_callbacks_total", None, "Loop stalls longer than SLOW_CALLBACK_MS")
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.last_tick = time.monotonic()
+        self._task = asyncio.create_task(self._ticker())
+        threading.Thread(target=self._watchdog, name="loop-watchdog", daemon=True).start()
+        log.info("⏱️ Monitor del event loop activo (umbral %.0f ms, SLO %.0f ms)", self.slow_threshold * 1000, self.slo * 1000)
+
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _ticker(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.last_tick = now
+            lag = max(0.0, now - expected)
+            self.history.append((time.time(), lag))
+            self.lag_hist.observe(lag)
+            self.lag_gauge.set(lag)
+            if self.slo and lag > self.slo and now - self.last_alert >= self.alert_cooldown:
+                p99 = self.percentile(0.99, SLO_WINDOW)
+                if p99 > self.slo:
+                    self.last_alert = now
+                    asyncio.create_task(self._alert(p99))
+
+    def _watchdog(self):
+        # Runs in its own thread, so it keeps going while the loop is blocked
+        check_every = max(self.slow_threshold / 4, 0.01)
+        while not self._stop.wait(check_every):
+            stalled = time.monotonic() - self.last_tick - self.interval
+            if self._pending is None:
+                if self.slow_threshold and stalled > self.slow_threshold:
+                    self._pending = self._capture()
+            elif stalled <= self.slow_threshold:
+                self._finish(self._pending)
+                self._pending = None
+
+    def _capture(self):
+        frame = sys._current_frames().get(self.loop_thread_id)
+        stack = "".join(traceback.format_stack(frame, limit=25)) if frame is not None else ""
+        task = None
+        try:
+            current = asyncio.current_task(self.loop)
+            task = current.get_name() if current else None
+        except RuntimeError:
+            pass
+        return SlowCallback(self.last_tick + self.interval, task or "<callback fuera de task>", stack)
+
+    def _finish(self, event: SlowCallback):
+        event.duration = max(0.0, self.last_tick - event.due)
+        self.slow_events.append(event)
+        self.slow_counter.inc()
+        log.warning(
+            "🐢 Event loop bloqueado ~%.0f ms por %s\n%s", event.duration * 1000, event.task, event.stack,
+            extra={"command": event.task, "latency_ms": round(event.duration * 1000, 1)}
+        )
+
+    def percentile(self, q: float, window: float = None) -> float:
+        cutoff = time.time() - window if window else 0
+        lags = sorted(lag for ts, lag in self.history if ts >= cutoff)
+        if not lags:
+            return 0.0
+        return lags[min(len(lags) - 1, int(q * len(lags)))]
+
+    async def _alert(self, p99):
+        await asyncio.sleep(max(self.slow_threshold / 2, 0.05)) # Let the watchdog file the stall that triggered this
+        recent = [e for e in self.slow_events if e.started >= time.time() - SLO_WINDOW]
+        embed = discord.Embed(
+            title="🐢 Event loop lento",
+            description=f"p99 de lag en el último minuto: **{p99 * 1000:.0f} ms** (SLO {self.slo * 1000:.0f} ms)",
+            color=discord.Color.orange()
+        )
+        for event in recent[-3:]:
+            last_frames = event.stack.strip().splitlines()[-4:]
+            embed.add_field(
+                name=f"{event.task} • {(event.duration or 0) * 1000:.0f} ms",
+                value="```\n" + "\n".join(last_frames)[-900:] + "\n```",
+                inline=False
+            )
+        embed.timestamp = datetime.datetime.now(datetime.timezone.utc)
+        log.warning(f"🚨 Lag del event loop sobre el SLO: p99 {p99 * 1000:.0f} ms")
+
+        for guild_id in self.guild_ids:
+            conf = get_guild_config(guild_id) or {}
+            channel_id = conf.get('ops_log_channel_id') or conf.get('ticket_log_channel_id')
+            if channel_id:
+                await audit.publish(guild_id, "loop_lag", [channel_id], embed=embed)
+
+    def summary(self) -> dict:
+        return {
+            'p50': self.percentile(0.5, SLO_WINDOW),
+            'p99': self.percentile(0.99, SLO_WINDOW),
+            'p99_10m': self.percentile(0.99),
+            'max_10m': max((lag for _, lag in self.history), default=0.0),
+            'slow': list(self.slow_events),
+        }
+
+monitor = None
+
+def start_monitor(guild_ids):
+    """Starts the process-wide monitor once (no-op if already running or LOOP_LAG_INTERVAL=0)."""
+    global monitor
+    if monitor is None and monitor_settings()[0] > 0:
+        monitor = LoopMonitor(guild_ids)
+        monitor.start()
+    return monitor
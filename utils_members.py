@@ -0,0 +1,168 @@
+import asyncio
+import os
+import sys
+import time
+import discord
+from utils_db import get_guild_config
+from utils_metrics import REGISTRY
+from utils_log import get_logger
+
+log = get_logger("members")
+
+# Gateway intents and member caching, derived from each guild's registry entry.
+#   Intents: only what the enabled features listen to. Interactions, roles and channels need just
+#   `guilds`; tickets watch messages in ticket channels (autoclose, first staff reply) but never
+#   read their content; the admin link bridge (enable_link_bridge) is the only reader of content.
+#   Member leave/join events (birthday retention, utils_retention.py) need the privileged members
+#   intent: requested only with retention_member_events (the reconciliation pass works without).
+#   Both are opt-in, so a guild on the defaults requests no privileged intent; the legacy .env
+#   communities keep both on (LEGACY_ENV_DEFAULTS in utils_db.py), as the bot always had them.
+#   member_cache:
+#     "all"   request the members intent, chunk every member at startup and keep them (old behavior)
+#     "lazy"  no startup chunking; members looked up through resolve_members() are kept, plus
+#             members who join while the members intent is on (default)
+#     "none"  nothing kept; lookups go to the gateway every time
+# discord.py never caches the member attached to an interaction, whatever the policy.
+# Lookups by ID (resolve_members) use the cache first and then the gateway's member request with
+# user_ids, which works without the privileged members intent.
+
+MEMBER_CACHE_POLICIES = ("all", "lazy", "none")
+QUERY_BATCH = 100         # user_ids per gateway member request (Discord limit)
+SIZE_SAMPLE = 200         # Objects measured per cache in the startup report
+
+def member_cache_policy(conf) -> str:
+    policy = (conf.get('member_cache') or "lazy").lower()
+    if policy not in MEMBER_CACHE_POLICIES:
+        log.warning(f"⚠️ member_cache '{policy}' desconocido, usando 'lazy'")
+        policy = "lazy"
+    return policy
+
+def intents_for(conf) -> discord.Intents:
+    intents = discord.Intents.none()
+    intents.guilds = True
+    if conf.get('enable_tickets', True):
+        intents.guild_messages = True
+    if conf.get('enable_link_bridge', False):
+        intents.guild_messages = True
+        intents.message_content = True
+    if member_cache_policy(conf) == "all" or (conf.get('enable_birthdays', True) and conf.get('retention_member_events', False)):
+        intents.members = True
+    return intents
+
+def client_options(conf) -> dict:
+    """Client kwargs for the main bot: intents plus member cache/chunking."""
+    intents = intents_for(conf)
+    policy = member_cache_policy(conf)
+    return {
+        'intents': intents,
+        'chunk_guilds_at_startup': policy == "all",
+        'member_cache_flags': discord.MemberCacheFlags.none() if policy == "none" else discord.MemberCacheFlags.from_intents(intents),
+    }
+
+def describe_intents(intents: discord.Intents) -> str:
+    return ",".join(name for name, enabled in intents if enabled)
+
+async def resolve_members(guild: discord.Guild, user_ids, strict: bool = False) -> dict:
+    """
+    {user_id: Member} for the IDs that are members of `guild` (those that left are missing).
+    A gateway lookup that times out leaves its IDs missing too, unless `strict` (then it raises).
+    """
+    found, missing = {}, []
+    for user_id in dict.fromkeys(user_ids):
+        member = guild.get_member(user_id)
+        if member is not None:
+            found[user_id] = member
+        else:
+            missing.append(user_id)
+    REGISTRY.counter("cache_requests_total", {'cache': 'members', 'result': 'hit'}, "Cache lookups by cache and result").inc(len(found))
+    if not missing or guild.chunked: # Fully chunked: not cached means not a member
+        return found
+
+    REGISTRY.counter("cache_requests_total", {'cache': 'members', 'result': 'miss'}, "Cache lookups by cache and result").inc(len(missing))
+    cache = member_cache_policy(get_guild_config(guild.id) or {}) != "none"
+    for i in range(0, len(missing), QUERY_BATCH):
+        batch = missing[i:i + QUERY_BATCH]
+        try:
+            members = await guild.query_members(user_ids=batch, limit=len(batch), cache=cache)
+        except asyncio.TimeoutError:
+            if strict:
+                raise
+            log.warning(f"⚠️ Tiempo agotado buscando {len(batch)} miembros en {guild.id}", extra={"guild": guild.id})
+            continue
+        found.update((m.id, m) for m in members)
+    return found
+
+# --- Startup memory report ---
+
+_OWNED_TYPES = (str, bytes, int, float, bool, type(None), tuple, list, dict, set, frozenset)
+
+def _deep_size(obj, seen, depth=0):
+    """Size of obj plus what it owns: containers and slot values, not other models it points to."""
+    if id(obj) in seen or depth > 6:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(k, seen, depth + 1) + _deep_size(v, seen, depth + 1) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_size(v, seen, depth + 1) for v in obj)
+    elif depth == 0:
+        for cls in type(obj).__mro__:
+            for slot in getattr(cls, '__slots__', ()):
+                value = getattr(obj, slot, None)
+                if isinstance(value, _OWNED_TYPES) or type(value).__module__.startswith(("discord.asset", "discord.colour", "discord.flags", "discord.permissions", "discord.utils", "array", "datetime")):
+                    size += _deep_size(value, seen, depth + 1)
+    return size
+
+def _estimate(objects, count):
+    sample = objects[:SIZE_SAMPLE]
+    if not sample:
+        return 0
+    seen = set()
+    return sum(_deep_size(o, seen) for o in sample) * count // len(sample)
+
+def cache_footprint(bot) -> dict:
+    """Objects cached by one bot and an estimate of their size (sampled)."""
+    guilds = bot.guilds
+    members = [m for g in guilds for m in g.members]
+    channels = [c for g in guilds for c in g.channels]
+    roles = [r for g in guilds for r in g.roles]
+    users = list(bot.users)
+    messages = list(bot.cached_messages)
+    counts = {'guilds': len(guilds), 'members': len(members), 'users': len(users), 'channels': len(channels),
+              'roles': len(roles), 'messages': len(messages)}
+    sizes = {'members': _estimate(members, len(members)), 'users': _estimate(users, len(users)),
+             'channels': _estimate(channels, len(channels)), 'roles': _estimate(roles, len(roles)),
+             'messages': _estimate(messages, len(messages))}
+    return {'counts': counts, 'bytes': sum(sizes.values()), 'sizes': sizes}
+
+def process_rss() -> int:
+    """Resident memory of this process in bytes (0 if unknown)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024 # Peak, not current
+    except ImportError:
+        return 0
+
+def report_startup(bot, policy: str):
+    """Logs and exports the cache footprint of a bot that just became ready."""
+    footprint = cache_footprint(bot)
+    counts = footprint['counts']
+    for kind, value in counts.items():
+        REGISTRY.gauge("discord_cache_objects", {'bot': bot.bot_name, 'kind': kind}, "Objects in the discord.py cache").set(value)
+    REGISTRY.gauge("discord_cache_bytes_estimate", {'bot': bot.bot_name}, "Estimated size of the discord.py cache").set(footprint['bytes'])
+    elapsed = time.perf_counter() - bot.created_at
+    log.info(
+        f"🧠 [{bot.bot_name}] Listo en {elapsed:.1f}s • caché ≈ {footprint['bytes'] / 1024:.0f} KB "
+        f"({counts['members']} miembros, {counts['users']} usuarios, {counts['channels']} canales, {counts['roles']} roles, "
+        f"{counts['messages']} mensajes) • miembros: {policy} • intents: {describe_intents(bot.intents)} • "
+        f"RSS del proceso {process_rss() / 1024 / 1024:.0f} MB",
+        extra={"bot": bot.bot_name}
+    )
+    return footprint
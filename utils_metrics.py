@@ -0,0 +1,238 @@
+import bisect
+import functools
+import re
+import threading
+import time
+import discord
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+class Gauge:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+class Histogram:
+    """Fixed-bucket histogram (cumulative on export, per-bucket internally)."""
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1) # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Registry:
+    """
+    Process-wide metric store. Metrics are identified by name + label set and created on first use,
+    so call sites never need to pre-register anything.
+    """
+    def __init__(self):
+        self.metrics = {}   # name -> {labels_tuple: metric}
+        self.kinds = {}     # name -> (kind, help)
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def _get(self, kind, name, labels, factory, help_text):
+        key = tuple(sorted(labels.items())) if labels else ()
+        series = self.metrics.get(name)
+        if series is not None:
+            metric = series.get(key)
+            if metric is not None:
+                return metric
+        with self._lock:
+            self.kinds.setdefault(name, (kind, help_text))
+            series = self.metrics.setdefault(name, {})
+            return series.setdefault(key, factory())
+
+    def counter(self, name, labels=None, help_text=""):
+        return self._get("counter", name, labels, Counter, help_text)
+
+    def gauge(self, name, labels=None, help_text=""):
+        return self._get("gauge", name, labels, Gauge, help_text)
+
+    def histogram(self, name, bounds, labels=None, help_text=""):
+        return self._get("histogram", name, labels, lambda: Histogram(bounds), help_text)
+
+    def add_collector(self, fn):
+        """`fn()` runs right before every export, to refresh gauges that are cheaper to read on demand."""
+        self.collectors.append(fn)
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        for fn in self.collectors:
+            try:
+                fn()
+            except Exception:
+                pass
+
+        def fmt_labels(key, extra=()):
+            pairs = list(key) + list(extra)
+            if not pairs:
+                return ""
+            escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs]
+            return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+        lines = []
+        for name in sorted(self.metrics):
+            kind, help_text = self.kinds[name]
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, metric in list(self.metrics[name].items()):
+                if kind == "histogram":
+                    cumulative = 0
+                    for bound, count in zip(metric.bounds, metric.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{fmt_labels(key, [('le', repr(float(bound)))])} {cumulative}")
+                    lines.append(f"{name}_bucket{fmt_labels(key, [('le', '+Inf')])} {metric.count}")
+                    lines.append(f"{name}_sum{fmt_labels(key)} {metric.sum}")
+                    lines.append(f"{name}_count{fmt_labels(key)} {metric.count}")
+                else:
+                    lines.append(f"{name}{fmt_labels(key)} {metric.value}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# --- Central instrumentation hooks ---
+
+LATENCY_BOUNDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_BOUNDS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+def observe_interaction(kind: str, name: str, seconds: float, ok: bool):
+    labels = {'kind': kind, 'name': name}
+    REGISTRY.histogram("interaction_latency_seconds", LATENCY_BOUNDS, labels, "Handler latency per command/component/modal").observe(seconds)
+    if not ok:
+        REGISTRY.counter("interaction_errors_total", labels, "Handlers that raised").inc()
+
+def timed_callback(kind: str, name: str, fn):
+    """Wraps a component/modal callback so its latency is recorded under (kind, name)."""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = await fn(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            observe_interaction(kind, name, time.perf_counter() - started, ok)
+    wrapper.__metrics_wrapped__ = True
+    return wrapper
+
+class InstrumentedView(discord.ui.View):
+    """Base view: every item's callback is timed as `component/<custom_id or class name>`."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for item in self.children:
+            self._instrument(item)
+
+    def _instrument(self, item):
+        callback = getattr(item, 'callback', None)
+        if callback is None or getattr(callback, '__metrics_wrapped__', False):
+            return
+        name = getattr(item, 'custom_id', None)
+        if not name or len(name) == 32: # Auto-generated IDs are random hex; group them by class
+            name = type(item).__name__
+        item.callback = timed_callback("component", name, callback)
+
+    def add_item(self, item):
+        result = super().add_item(item)
+        self._instrument(item)
+        return result
+
+class InstrumentedModal(discord.ui.Modal):
+    """Base modal: on_submit is timed as `modal/<class name>`."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_submit = timed_callback("modal", type(self).__name__, self.on_submit)
+
+class InstrumentedTree(discord.app_commands.CommandTree):
+    """Command tree that times every app command from dispatch to completion."""
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        interaction.extras['metrics_started'] = time.perf_counter()
+        return True
+
+    @staticmethod
+    def _finish(interaction: discord.Interaction, ok: bool):
+        started = interaction.extras.pop('metrics_started', None)
+        command = interaction.command
+        if started is not None and command is not None:
+            observe_interaction("command", command.qualified_name, time.perf_counter() - started, ok)
+
+    async def on_error(self, interaction: discord.Interaction, error):
+        self._finish(interaction, ok=False)
+        await super().on_error(interaction, error)
+
+def record_command_completion(interaction: discord.Interaction):
+    """Called from `on_app_command_completion`."""
+    InstrumentedTree._finish(interaction, ok=True)
+
+# Discord REST calls: counted per method + route template through an aiohttp TraceConfig
+_SNOWFLAKE = re.compile(r"/\d{15,21}")
+_TOKEN_SEGMENT = re.compile(r"(/(?:webhooks|interactions)/\{id\})/[^/]+")
+
+def _route_of(url) -> str:
+    path = _SNOWFLAKE.sub("/{id}", url.path)
+    path = _TOKEN_SEGMENT.sub(r"\1/{token}", path)
+    return path.split("/api/v", 1)[-1].split("/", 1)[-1] if "/api/v" in path else path
+
+def http_trace_config(bot_name: str):
+    import aiohttp
+
+    async def on_start(session, ctx, params):
+        ctx.started = time.perf_counter()
+
+    async def on_end(session, ctx, params):
+        labels = {'bot': bot_name, 'method': params.method, 'route': _route_of(params.url)}
+        REGISTRY.counter("discord_rest_requests_total", labels, "Discord REST calls").inc()
+        REGISTRY.histogram("discord_rest_latency_seconds", LATENCY_BOUNDS, labels, "Discord REST latency").observe(time.perf_counter() - ctx.started)
+        if params.response.status == 429:
+            scope = params.response.headers.get("X-RateLimit-Scope", "user")
+            REGISTRY.counter("discord_rest_429_total", {**labels, 'scope': scope}, "Discord REST 429 responses").inc()
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(on_start)
+    trace.on_request_end.append(on_end)
+    return trace
+
+# --- HTTP endpoint ---
+
+async def start_http_server(host: str, port: int, health_fn):
+    """
+    Serves /metrics (Prometheus text) and /healthz on the running loop.
+    `health_fn()` returns (ready: bool, details: dict).
+    """
+    from aiohttp import web
+
+    async def metrics(request):
+        return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8")
+
+    async def healthz(request):
+        ready, details = health_fn()
+        return web.json_response({'ready': ready, **details}, status=200 if ready else 503)
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    app.router.add_get("/healthz", healthz)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    return runner
@@ -0,0 +1,238 @@
+import asyncio
+import collections
+import os
+import time
+import discord
+from utils_metrics import REGISTRY, LATENCY_BOUNDS
+from utils_ratelimit import TokenBucket
+from utils_log import get_logger
+
+log = get_logger("outbound")
+
+# Outbound scheduler: one per bot token (rate limits are per token). Sends that are not the
+# interaction response itself are submitted here instead of being awaited inline, so a letter
+# release or a birthday run cannot starve what a user or the staff is waiting for:
+#   INTERACTIVE  part of answering a user right now (the control message of a new ticket)
+#   STAFF        what staff is looking at (status message edits, claim notices, idle warnings)
+#   AUDIT        audit sink deliveries (letter logs, transcripts)
+#   BULK         fan-out work (release DMs, birthday announcements)
+# The lowest non-empty class goes first; within a class guilds take turns (round robin), and
+# each guild's jobs run in submission order. A job only starts when its route bucket has room
+# ('dm:<user id>', 'channel:<id>'... with Discord's published limits), so a job stuck behind a full bucket
+# never blocks other routes. AUDIT and BULK cannot take the last OUTBOUND_RESERVED slots.
+# discord.py still handles the real buckets and 429s; this only decides what goes first.
+#   OUTBOUND_RATE=40          requests per second per bot (Discord's global limit is 50)
+#   OUTBOUND_CONCURRENCY=4    requests in flight per bot
+#   OUTBOUND_RESERVED=1       slots kept for INTERACTIVE/STAFF
+
+INTERACTIVE, STAFF, AUDIT, BULK = range(4)
+PRIORITY_NAMES = ("interactive", "staff", "audit", "bulk")
+
+# Route kind -> (requests, per seconds)
+ROUTE_LIMITS = {
+    'dm': (5, 1),          # DMs per recipient, 'dm:<user id>' (undocumented, observed)
+    'channel': (5, 5),     # Messages per channel
+    'guild': (5, 5),       # Channel/role management per guild
+    'member': (10, 10),    # Role changes per member
+}
+DEFAULT_ROUTE_LIMIT = (5, 1)
+ROUTE_PRUNE_THRESHOLD = 10000  # Idle (full) route buckets are dropped past this many
+CLOSE_TIMEOUT = 5              # Seconds in-flight sends get to finish on shutdown
+
+def scheduler_settings():
+    """(rate/s, concurrency, reserved slots) from the environment."""
+    def as_int(name, default, minimum):
+        try: return max(minimum, int(os.getenv(name, default)))
+        except ValueError: return default
+    concurrency = as_int('OUTBOUND_CONCURRENCY', 4, 1)
+    return as_int('OUTBOUND_RATE', 40, 1), concurrency, min(as_int('OUTBOUND_RESERVED', 1, 0), concurrency - 1)
+
+def route_for(target) -> str:
+    """Route key of a send to `target` (user/member -> 'dm:<id>', channel -> 'channel:<id>')."""
+    if isinstance(target, (discord.User, discord.Member)):
+        return f"dm:{target.id}"
+    return f"channel:{target.id}"
+
+class Job:
+    __slots__ = ("priority", "guild_id", "route", "factory", "tag", "future", "queued_at")
+
+    def __init__(self, priority, guild_id, route, factory, tag):
+        self.priority = priority
+        self.guild_id = guild_id
+        self.route = route
+        self.factory = factory
+        self.tag = tag
+        self.future = asyncio.get_running_loop().create_future()
+        self.queued_at = time.perf_counter()
+
+class OutboundScheduler:
+    def __init__(self, name: str):
+        self.name = name
+        self.rate, self.concurrency, self.reserved = scheduler_settings()
+        self.queues = [collections.OrderedDict() for _ in PRIORITY_NAMES] # class -> guild -> deque of jobs
+        self.limiter = TokenBucket(self.rate, 1)
+        self.routes = {}  # route -> TokenBucket
+        self.inflight = 0
+        self._inflight = set()  # Running _execute tasks (the loop only keeps weak references)
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.depth = [REGISTRY.gauge("outbound_queue_depth", {'bot': name, 'priority': p}, "Outbound jobs waiting") for p in PRIORITY_NAMES]
+
+    def submit(self, priority, factory, guild_id=None, route=None, tag=None) -> asyncio.Future:
+        """
+        Queues `factory()` (a coroutine function) and returns a future with its result. Cancelling the
+        future drops the job if it has not started yet.
+        """
+        job = Job(priority, guild_id, route, factory, tag)
+        self.queues[priority].setdefault(guild_id, collections.deque()).append(job)
+        self._update_depth(priority)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+        return job.future
+
+    def cancel(self, tag=None, guild_id=None) -> int:
+        """Drops queued (not yet started) jobs matching tag and/or guild. Returns how many."""
+        cancelled = 0
+        for priority, queues in enumerate(self.queues):
+            for gid, queue in list(queues.items()):
+                if guild_id is not None and gid != guild_id:
+                    continue
+                kept = collections.deque()
+                for job in queue:
+                    if (tag is None or job.tag == tag) and not job.future.done():
+                        job.future.cancel()
+                        self._count(job, "cancelled")
+                        cancelled += 1
+                    else:
+                        kept.append(job)
+                if kept:
+                    queues[gid] = kept
+                else:
+                    del queues[gid]
+            self._update_depth(priority)
+        return cancelled
+
+    def _update_depth(self, priority):
+        self.depth[priority].set(sum(len(q) for q in self.queues[priority].values()))
+
+    def pending(self) -> int:
+        return sum(len(q) for queues in self.queues for q in queues.values())
+
+    def _bucket(self, route):
+        bucket = self.routes.get(route)
+        if bucket is None:
+            if len(self.routes) >= ROUTE_PRUNE_THRESHOLD:
+                now = time.monotonic()
+                self.routes = {r: b for r, b in self.routes.items() if not b.is_full(now)}
+            bucket = self.routes[route] = TokenBucket(*ROUTE_LIMITS.get(route.split(":", 1)[0], DEFAULT_ROUTE_LIMIT))
+        return bucket
+
+    def _next(self):
+        """(job, None) to start now, or (None, seconds to wait; None = until something changes)."""
+        if self.inflight >= self.concurrency:
+            return None, None
+        wait = self.limiter.wait_time()
+        if wait > 0:
+            return None, wait
+        for priority, queues in enumerate(self.queues):
+            if priority >= AUDIT and self.inflight >= self.concurrency - self.reserved:
+                break
+            for guild_id, queue in list(queues.items()):
+                while queue and queue[0].future.done(): # Cancelled by the submitter
+                    self._count(queue.popleft(), "cancelled")
+                if not queue:
+                    del queues[guild_id]
+                    self._update_depth(priority)
+                    continue
+                route_wait = self._bucket(queue[0].route).wait_time() if queue[0].route else 0
+                if route_wait > 0:
+                    wait = route_wait if wait == 0 else min(wait, route_wait)
+                    continue
+                job = queue.popleft()
+                if queue:
+                    queues.move_to_end(guild_id) # This guild goes last next time
+                else:
+                    del queues[guild_id]
+                self._update_depth(priority)
+                return job, None
+        return None, wait or None
+
+    async def _run(self):
+        while True:
+            job, wait = self._next()
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self.limiter.consume()
+            if job.route:
+                self._bucket(job.route).consume()
+            self.inflight += 1
+            task = asyncio.create_task(self._execute(job))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _execute(self, job):
+        priority = PRIORITY_NAMES[job.priority]
+        REGISTRY.histogram("outbound_queue_wait_seconds", LATENCY_BOUNDS, {'bot': self.name, 'priority': priority},
+                           "Time outbound jobs waited in the scheduler").observe(time.perf_counter() - job.queued_at)
+        try:
+            result = await job.factory()
+            if not job.future.done():
+                job.future.set_result(result)
+            self._count(job, "ok")
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+            self._count(job, "error")
+        finally:
+            self.inflight -= 1
+            self._wakeup.set()
+
+    def _count(self, job, result):
+        labels = {'bot': self.name, 'priority': PRIORITY_NAMES[job.priority], 'result': result}
+        REGISTRY.counter("outbound_jobs_total", labels, "Outbound jobs by priority and result").inc()
+
+    def stop(self):
+        self.cancel()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def close(self, timeout: float = CLOSE_TIMEOUT):
+        """stop(), then gives the in-flight sends `timeout` seconds and cancels what is left."""
+        self.stop()
+        if self._inflight:
+            _, pending = await asyncio.wait(set(self._inflight), timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+_schedulers = {}
+
+def get_scheduler(client) -> OutboundScheduler:
+    scheduler = _schedulers.get(id(client))
+    if scheduler is None:
+        name = getattr(client, 'bot_name', None) or str(getattr(client, 'user', None) or "bot")
+        scheduler = _schedulers[id(client)] = OutboundScheduler(name)
+    return scheduler
+
+def submit(client, priority, factory, guild_id=None, route=None, tag=None) -> asyncio.Future:
+    """Queues `factory()` on the client's scheduler; await the returned future for its result."""
+    return get_scheduler(client).submit(priority, factory, guild_id, route, tag)
+
+def cancel(client, tag=None, guild_id=None) -> int:
+    scheduler = _schedulers.get(id(client))
+    return scheduler.cancel(tag, guild_id) if scheduler else 0
+
+async def close_all():
+    schedulers = list(_schedulers.values())
+    _schedulers.clear()
+    await asyncio.gather(*(scheduler.close() for scheduler in schedulers))
@@ -0,0 +1,136 @@
+import asyncio
+import collections
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+
+# On-demand profiling of the running process (admin /profile).
+# CPU mode samples the event loop's stack with a SIGPROF interval timer (CPU time only, no tracing
+# hooks, so the overhead is one frame walk per sample). Where setitimer is unavailable (Windows) or
+# the loop is not on the main thread, a helper thread samples it instead; those samples include idle
+# time and are biased towards points where the loop releases the GIL.
+# Memory mode diffs two tracemalloc snapshots. Only one capture runs per process at a time.
+
+MAX_SECONDS = 60
+SAMPLE_INTERVAL = 0.005   # 200 Hz
+MAX_STACK_DEPTH = 64
+TRACEMALLOC_FRAMES = 10
+
+_capture_lock = asyncio.Lock()
+
+def is_busy() -> bool:
+    return _capture_lock.locked()
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+def _collapse(frame):
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+def _signal_sampling_available() -> bool:
+    return hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+async def _sample_signal(seconds):
+    stacks = collections.Counter()
+
+    def on_sample(signum, frame):
+        stacks[_collapse(frame)] += 1
+
+    previous = signal.signal(signal.SIGPROF, on_sample)
+    signal.setitimer(signal.ITIMER_PROF, SAMPLE_INTERVAL, SAMPLE_INTERVAL)
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, previous)
+    return stacks, sum(stacks.values())
+
+def _sample_thread(thread_id, seconds, stop_event):
+    """Runs in a helper thread. Returns (Counter of collapsed stacks, sample count)."""
+    stacks = collections.Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline and not stop_event.is_set():
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            stacks[_collapse(frame)] += 1
+            samples += 1
+        time.sleep(SAMPLE_INTERVAL)
+    return stacks, samples
+
+def _cpu_report(stacks, samples, seconds, top, source):
+    own = collections.Counter()
+    inclusive = collections.Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        for name in set(frames):
+            inclusive[name] += count
+
+    lines = [f"CPU: {samples} muestras en {seconds}s ({source})", "", "Propio (self):"]
+    for name, count in own.most_common(top):
+        lines.append(f"{count / samples:6.1%}  {name}")
+    lines += ["", "Acumulado (incl.):"]
+    for name, count in inclusive.most_common(top):
+        lines.append(f"{count / samples:6.1%}  {name}")
+    return "\n".join(lines)
+
+async def profile_cpu(seconds: int, top: int = 15):
+    """Samples the loop thread for `seconds`. Returns (report, collapsed-stack bytes)."""
+    seconds = max(1, min(seconds, MAX_SECONDS))
+    async with _capture_lock:
+        if _signal_sampling_available():
+            source = "SIGPROF, solo tiempo de CPU"
+            stacks, samples = await _sample_signal(seconds)
+        else:
+            source = "hilo muestreador, incluye espera"
+            stop_event = threading.Event()
+            try:
+                stacks, samples = await asyncio.to_thread(_sample_thread, threading.get_ident(), seconds, stop_event)
+            finally:
+                stop_event.set()
+
+    if not samples:
+        return "CPU: sin muestras.", b""
+    # Folded format: one "frame;frame;frame count" line per stack (flamegraph.pl / speedscope)
+    folded = "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+    return _cpu_report(stacks, samples, seconds, top, source), folded.encode("utf-8")
+
+async def profile_memory(seconds: int, top: int = 15):
+    """Diffs tracemalloc snapshots taken `seconds` apart. Returns (report, full diff bytes)."""
+    seconds = max(1, min(seconds, MAX_SECONDS))
+    async with _capture_lock:
+        started_here = not tracemalloc.is_tracing()
+        if started_here:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        try:
+            before = tracemalloc.take_snapshot()
+            await asyncio.sleep(seconds)
+            after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            if started_here:
+                tracemalloc.stop()
+
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>")]
+    diff = after.filter_traces(filters).compare_to(before.filter_traces(filters), 'lineno')
+    growth = sum(stat.size_diff for stat in diff)
+
+    lines = [f"Memoria: {seconds}s • Δ {growth / 1024:+.1f} KB • trazado {current / 1024 / 1024:.1f} MB (pico {peak / 1024 / 1024:.1f} MB)", ""]
+    for stat in diff[:top]:
+        frame = stat.traceback[0]
+        lines.append(f"{stat.size_diff / 1024:+9.1f} KB {stat.count_diff:+6d}  {os.path.basename(frame.filename)}:{frame.lineno}")
+
+    full = []
+    for stat in diff:
+        full.append(str(stat))
+        full.extend(f"    {line}" for line in stat.traceback.format())
+    return "\n".join(lines), "\n".join(full).encode("utf-8")
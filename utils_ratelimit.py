@@ -0,0 +1,81 @@
+import math
+import time
+import discord
+from utils_metrics import REGISTRY, InstrumentedView
+
+class TokenBucket:
+    """Classic token bucket: `capacity` tokens, refilled at `capacity / per` tokens per second."""
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: int, per: float):
+        self.capacity = capacity
+        self.rate = capacity / per
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def consume(self) -> float:
+        """Takes one token. Returns 0 if allowed, otherwise the seconds until one is available."""
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def wait_time(self) -> float:
+        """Like consume() but without taking the token: 0 if one is available now."""
+        now = time.monotonic()
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def is_full(self, now: float) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+class RateLimiter:
+    """Keeps one TokenBucket per (action, user). Idle (full) buckets are pruned so memory stays bounded."""
+    PRUNE_THRESHOLD = 10000
+
+    def __init__(self):
+        self.buckets = {}
+
+    def hit(self, action: str, user_id: int, capacity: int, per: float) -> float:
+        key = (action, user_id)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.PRUNE_THRESHOLD:
+                self.prune()
+            bucket = self.buckets[key] = TokenBucket(capacity, per)
+        return bucket.consume()
+
+    def prune(self):
+        now = time.monotonic()
+        self.buckets = {k: b for k, b in self.buckets.items() if not b.is_full(now)}
+
+# Shared across every bot/cog in the process
+limiter = RateLimiter()
+
+class CooldownView(InstrumentedView):
+    """
+    Base view that rate-limits expensive components per user (and, via InstrumentedView, times every callback).
+    Subclasses declare `cooldowns = {custom_id: (capacity, per_seconds)}`; when a user is over the
+    limit the interaction gets a single ephemeral reply and the callback never runs.
+    """
+    cooldowns = {}
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        custom_id = (interaction.data or {}).get("custom_id")
+        rule = self.cooldowns.get(custom_id)
+        if not rule:
+            return True
+
+        retry_after = limiter.hit(custom_id, interaction.user.id, *rule)
+        if retry_after <= 0:
+            return True
+
+        REGISTRY.counter("interaction_ratelimited_total", {'name': custom_id}, "Component clicks rejected by cooldown").inc()
+        await interaction.response.send_message(f"⏳ Vas muy rápido. Inténtalo de nuevo en **{math.ceil(retry_after)}s**.", ephemeral=True)
+        return False
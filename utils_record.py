@@ -0,0 +1,180 @@
+import datetime
+import json
+import os
+import re
+import time
+from utils_db import get_guild_config, clean_id_list
+from utils_log import get_logger
+
+log = get_logger("record")
+
+# Opt-in recorder of incoming interactions, replayed offline by bench/loadgen.py --profile replay.
+#   INTERACTION_RECORD_FILE=recordings/feb14.jsonl    (cluster workers append .w<N>)
+# One compact JSON object per line:
+#   {"t": 12.345, "g": 1, "c": 3, "u": 17, "k": 3, "a": 0, "d": {...}}
+# t = seconds since recording started, g/c/u = guild/channel/user numbered in order of appearance,
+# k = interaction type, a = 1 for admins, d = interaction data with personal data removed:
+# Discord IDs become those per-file numbers, typed text (modal fields, string options) keeps its
+# length but every letter/digit becomes "x" (values picked from a command's choices are kept), `resolved` is dropped, and auto-generated custom_ids
+# (random 32-char hex of non-persistent views/modals) become "~" so the replayer can bind them to
+# whatever the bot answered in the replay.
+
+DYNAMIC_CUSTOM_ID = "~"
+FLUSH_SECONDS = 5
+_AUTO_CUSTOM_ID = re.compile(r"^[0-9a-f]{32}$")
+_WORD_CHARS = re.compile(r"\w")
+
+# Application command option types
+_SUB_COMMAND, _SUB_COMMAND_GROUP, _STRING, _USER, _CHANNEL, _ROLE, _MENTIONABLE = 1, 2, 3, 6, 7, 8, 9
+# Select menus whose values are user IDs
+_USER_SELECTS = (5,)
+
+def blank(text: str) -> str:
+    return _WORD_CHARS.sub("x", text or "")
+
+class InteractionRecorder:
+    def __init__(self, path: str):
+        self.path = path
+        self.started = time.monotonic()
+        self.ids = {'g': {}, 'c': {}, 'u': {}, 'o': {}} # Real ID -> per-file number, by kind
+        self.count = 0
+        self._last_flush = self.started
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.file = open(path, "a", encoding="utf-8")
+        self._write({'v': 1, 'started': datetime.datetime.now().isoformat(timespec="seconds")})
+
+    def _number(self, kind, real_id):
+        if real_id is None:
+            return None
+        table = self.ids[kind]
+        return table.setdefault(int(real_id), len(table) + 1)
+
+    @staticmethod
+    def _choices(interaction):
+        """{option name: allowed values} of the invoked command; those values are not user input."""
+        try:
+            command = interaction.command
+            return {p.display_name: {c.value for c in p.choices} for p in command.parameters if p.choices}
+        except Exception:
+            return {}
+
+    def _option(self, option, choices):
+        out = {'name': option.get('name'), 'type': option.get('type')}
+        kind = option.get('type')
+        if kind in (_SUB_COMMAND, _SUB_COMMAND_GROUP):
+            out['options'] = [self._option(o, choices) for o in option.get('options', [])]
+        elif 'value' in option:
+            value = option['value']
+            if kind == _STRING and value not in choices.get(option.get('name'), ()):
+                value = blank(value)
+            elif kind == _USER:
+                value = self._number('u', value)
+            elif kind in (_CHANNEL, _ROLE, _MENTIONABLE):
+                value = self._number('o', value)
+            out['value'] = value
+        return out
+
+    def _components(self, components):
+        out = []
+        for component in components or []:
+            entry = {'type': component.get('type')}
+            if 'custom_id' in component:
+                entry['custom_id'] = self._custom_id(component['custom_id'])
+            if 'value' in component:
+                entry['value'] = blank(component['value'])
+            if 'values' in component:
+                entry['values'] = [blank(v) for v in component['values']]
+            if component.get('component'):
+                entry['component'] = self._components([component['component']])[0]
+            if component.get('components'):
+                entry['components'] = self._components(component['components'])
+            out.append(entry)
+        return out
+
+    @staticmethod
+    def _custom_id(custom_id):
+        return DYNAMIC_CUSTOM_ID if _AUTO_CUSTOM_ID.match(custom_id or "") else custom_id
+
+    def sanitize(self, data: dict, choices=None) -> dict:
+        out = {}
+        if 'name' in data:
+            out['name'] = data['name']
+            out['type'] = data.get('type', 1)
+            out['options'] = [self._option(o, choices or {}) for o in data.get('options', [])]
+        if 'custom_id' in data:
+            out['custom_id'] = self._custom_id(data['custom_id'])
+        if 'component_type' in data:
+            out['component_type'] = data['component_type']
+            values = data.get('values', [])
+            if data['component_type'] in _USER_SELECTS:
+                out['values'] = [self._number('u', v) for v in values]
+            elif data['component_type'] == 3:
+                out['values'] = values # Option values are ours (ticket types...), not user input
+            else:
+                out['values'] = [self._number('o', v) for v in values]
+        if 'components' in data:
+            out['components'] = self._components(data['components'])
+        return out
+
+    def record(self, interaction, is_admin: bool):
+        try:
+            self._write({
+                't': round(time.monotonic() - self.started, 3),
+                'g': self._number('g', interaction.guild_id),
+                'c': self._number('c', interaction.channel_id),
+                'u': self._number('u', interaction.user.id),
+                'k': interaction.type.value,
+                'a': int(is_admin),
+                'd': self.sanitize(interaction.data or {}, self._choices(interaction)),
+            })
+            self.count += 1
+        except Exception as e:
+            log.warning(f"⚠️ No se pudo grabar la interacción: {e}")
+
+    def _write(self, entry):
+        # Buffered: a line per interaction costs microseconds; the file is flushed every few seconds
+        self.file.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        now = time.monotonic()
+        if now - self._last_flush >= FLUSH_SECONDS:
+            self.file.flush()
+            self._last_flush = now
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+            log.info("🎙️ Grabación cerrada: %s interacciones en %s", self.count, self.path)
+
+recorder = None
+
+def start_recorder(worker_index=None):
+    """Starts the process-wide recorder when INTERACTION_RECORD_FILE is set."""
+    global recorder
+    path = os.getenv('INTERACTION_RECORD_FILE')
+    if recorder is None and path:
+        if worker_index is not None:
+            path = f"{path}.w{worker_index}"
+        try:
+            recorder = InteractionRecorder(path)
+            log.info("🎙️ Grabando interacciones en %s", path)
+        except OSError as e:
+            log.error(f"❌ No se pudo abrir {path} para grabar: {e}")
+    return recorder
+
+def is_admin(interaction) -> bool:
+    # Same rule as Admin.is_admin: the guild's admin_ids, or the global ADMIN_USER_ID list
+    guild_conf = get_guild_config(interaction.guild_id)
+    admin_ids = guild_conf.get('admin_ids') if guild_conf else []
+    if not admin_ids:
+        admin_ids = clean_id_list(os.getenv('ADMIN_USER_ID', ''))
+    return interaction.user.id in admin_ids
+
+def record_interaction(interaction):
+    if recorder is not None:
+        recorder.record(interaction, is_admin(interaction))
+
+def stop_recorder():
+    global recorder
+    if recorder is not None:
+        recorder.close()
+        recorder = None
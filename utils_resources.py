@@ -0,0 +1,144 @@
+import discord
+from utils_metrics import REGISTRY
+from utils_log import get_logger
+
+log = get_logger("resources")
+
+# Per-guild index of the roles and channels the features look up by name ("Tickets" category,
+# "Staff"/"Soporte" and birthday alert roles), so a lookup is a dict access instead of a scan of
+# guild.roles / guild.categories. Only IDs are stored: objects are resolved through the guild, so
+# they are always the ones discord.py keeps up to date. The index follows the gateway's role and
+# channel create/update/delete events (guilds intent); objects the bot creates itself are added
+# right away with note_role()/note_channel(), before their create event arrives.
+# With several roles/channels of the same name the lowest position wins, as discord.utils.get over
+# guild.roles / guild.categories did.
+
+def _position(obj):
+    return (getattr(obj, 'position', 0), obj.id)
+
+def _count(result):
+    REGISTRY.counter("cache_requests_total", {'cache': 'resources', 'result': result}, "Cache lookups by cache and result").inc()
+
+class GuildResources:
+    """Name -> IDs index of one guild's roles and channels (categories included)."""
+    def __init__(self, guild: discord.Guild):
+        self.rebuild(guild)
+
+    def rebuild(self, guild: discord.Guild):
+        self.guild = guild
+        self.roles = {}     # name -> set of role IDs
+        self.channels = {}  # name -> set of channel IDs
+        self.role_names = {}     # role ID -> indexed name (renames and deletes)
+        self.channel_names = {}  # channel ID -> indexed name
+        for role in guild.roles:
+            self.note_role(role)
+        for channel in guild.channels:
+            self.note_channel(channel)
+
+    # --- Maintenance ---
+
+    def note_role(self, role):
+        self.forget_role(role.id)
+        self.roles.setdefault(role.name, set()).add(role.id)
+        self.role_names[role.id] = role.name
+
+    def forget_role(self, role_id):
+        name = self.role_names.pop(role_id, None)
+        if name is not None:
+            ids = self.roles.get(name)
+            ids.discard(role_id)
+            if not ids:
+                del self.roles[name]
+
+    def note_channel(self, channel):
+        self.forget_channel(channel.id)
+        self.channels.setdefault(channel.name, set()).add(channel.id)
+        self.channel_names[channel.id] = channel.name
+
+    def forget_channel(self, channel_id):
+        name = self.channel_names.pop(channel_id, None)
+        if name is not None:
+            ids = self.channels.get(name)
+            ids.discard(channel_id)
+            if not ids:
+                del self.channels[name]
+
+    # --- Lookups ---
+
+    def role(self, role_id):
+        return self.guild.get_role(role_id)
+
+    def channel(self, channel_id):
+        return self.guild.get_channel(channel_id)
+
+    def role_named(self, name: str):
+        roles = [r for r in map(self.guild.get_role, self.roles.get(name, ())) if r is not None]
+        _count("hit" if roles else "miss")
+        return min(roles, key=_position) if roles else None
+
+    def category_named(self, name: str):
+        channels = [c for c in map(self.guild.get_channel, self.channels.get(name, ())) if c is not None and c.type == discord.ChannelType.category]
+        _count("hit" if channels else "miss")
+        return min(channels, key=_position) if channels else None
+
+    def stats(self) -> dict:
+        return {'roles': len(self.role_names), 'channels': len(self.channel_names)}
+
+class ResourceIndex:
+    """The GuildResources of every guild a bot is in, kept current by the bot's gateway events."""
+    def __init__(self):
+        self.guilds = {}  # guild_id -> GuildResources
+
+    def for_guild(self, guild: discord.Guild) -> GuildResources:
+        entry = self.guilds.get(guild.id)
+        if entry is None:
+            entry = self.guilds[guild.id] = GuildResources(guild)
+        elif entry.guild is not guild:
+            entry.rebuild(guild) # New Guild object after a full reconnect: state was rebuilt from scratch
+        return entry
+
+    def attach(self, bot):
+        """Registers the event listeners on `bot` (outside any cog, so reloading a cog keeps the index)."""
+        for name in ("on_guild_available", "on_guild_join", "on_guild_remove",
+                     "on_guild_role_create", "on_guild_role_update", "on_guild_role_delete",
+                     "on_guild_channel_create", "on_guild_channel_update", "on_guild_channel_delete"):
+            bot.add_listener(getattr(self, name), name)
+
+    async def on_guild_available(self, guild):
+        entry = self.guilds.get(guild.id)
+        if entry is None:
+            entry = self.guilds[guild.id] = GuildResources(guild)
+        else:
+            entry.rebuild(guild)
+        stats = entry.stats()
+        log.debug("🗂️ Índice de recursos de %s: %s roles, %s canales", guild.id, stats['roles'], stats['channels'], extra={"guild": guild.id})
+
+    async def on_guild_join(self, guild):
+        await self.on_guild_available(guild)
+
+    async def on_guild_remove(self, guild):
+        self.guilds.pop(guild.id, None)
+
+    async def on_guild_role_create(self, role):
+        self.for_guild(role.guild).note_role(role)
+
+    async def on_guild_role_update(self, before, after):
+        if before.name != after.name:
+            self.for_guild(after.guild).note_role(after)
+
+    async def on_guild_role_delete(self, role):
+        self.for_guild(role.guild).forget_role(role.id)
+
+    async def on_guild_channel_create(self, channel):
+        self.for_guild(channel.guild).note_channel(channel)
+
+    async def on_guild_channel_update(self, before, after):
+        if before.name != after.name:
+            self.for_guild(after.guild).note_channel(after)
+
+    async def on_guild_channel_delete(self, channel):
+        self.for_guild(channel.guild).forget_channel(channel.id)
+
+def resources_for(client, guild: discord.Guild) -> GuildResources:
+    """The guild's index from the bot that received the interaction/event."""
+    return client.resources.for_guild(guild)
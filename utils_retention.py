@@ -0,0 +1,205 @@
+import asyncio
+import datetime
+import os
+import time
+from utils_db import get_db_path, get_guild_config, connect as db_connect
+from utils_members import resolve_members, QUERY_BATCH
+from utils_metrics import REGISTRY
+from utils_log import get_logger
+
+log = get_logger("retention")
+
+# Retention and compaction of the per-guild DBs, so tables and indexes only hold live data.
+#   Departures: the birthdays of a member who leaves are archived (departed_at set) instead of
+#   deleted, so someone who comes back keeps them; archived rows are skipped by every read and
+#   deleted after retention_departed_days. With retention_member_events, leaves and joins arrive
+#   as member events (needs the Server Members intent, see utils_members.py), queued and written
+#   in one transaction every few seconds; a reconciliation pass also checks every stored user
+#   against the guild (gateway lookups by ID), catching leaves while the bot was offline (or
+#   without the events) and members who came back.
+#   Age windows from the registry (days, 0 = keep forever): retention_letters_days (by the date
+#   the letter was written) and retention_sla_days (ticket SLA histogram days).
+#   Deletes run in batches of RETENTION_BATCH rows, one short transaction each, so writers never
+#   wait long; the freed pages are then given back to the filesystem with incremental vacuum.
+#   Files created before incremental auto_vacuum are switched by their first compaction (one full
+#   VACUUM, off the startup path).
+#     RETENTION_INTERVAL_HOURS=24   0 = only on demand (/compact_now)
+#     RETENTION_BATCH=500
+
+EVENT_FLUSH_DELAY = 5        # Seconds member events are collected before being written
+BATCH_PAUSE = 0.01           # Between delete batches / vacuum steps, so other statements get in
+RECONCILE_PAUSE = 1.0        # Between gateway lookups (they share the gateway's send rate limit)
+VACUUM_PAGES_PER_STEP = 256  # ~1 MB per step with the default 4 KB page size
+SLA_KEY = "day, metric, ticket_type, staff_id, bucket" # ticket_sla has no rowid
+
+def retention_settings():
+    """Interval (hours, 0 = disabled) and delete batch size from the environment."""
+    def as_int(name, default, minimum):
+        try: return max(minimum, int(os.getenv(name, default)))
+        except ValueError: return default
+    return as_int('RETENTION_INTERVAL_HOURS', 24, 0), as_int('RETENTION_BATCH', 500, 1)
+
+def _count(table, action, amount):
+    if amount:
+        REGISTRY.counter("retention_rows_total", {'table': table, 'action': action}, "Rows archived, restored or deleted by retention").inc(amount)
+
+# --- Member events ---
+
+_pending = {}      # guild_id -> {user_id: departed_at, or None when the member came back}
+_flush_tasks = {}  # guild_id -> task writing _pending after EVENT_FLUSH_DELAY
+
+def note_departure(guild_id, user_id):
+    _queue(guild_id, user_id, time.time())
+
+def note_return(guild_id, user_id):
+    _queue(guild_id, user_id, None)
+
+def _queue(guild_id, user_id, departed_at):
+    _pending.setdefault(guild_id, {})[user_id] = departed_at
+    if guild_id not in _flush_tasks:
+        _flush_tasks[guild_id] = asyncio.create_task(_flush_later(guild_id))
+
+async def _flush_later(guild_id):
+    try:
+        await asyncio.sleep(EVENT_FLUSH_DELAY)
+    finally:
+        _flush_tasks.pop(guild_id, None)
+    try:
+        await flush_member_events(guild_id)
+    except Exception as e:
+        log.error(f"❌ Error guardando salidas de miembros en {guild_id}: {e}", extra={"guild": guild_id})
+
+async def flush_member_events(guild_id):
+    """Writes the queued leaves/joins of a guild in one transaction. Returns (archived, restored)."""
+    events = _pending.pop(guild_id, None)
+    db_path = get_db_path(guild_id)
+    if not events or not os.path.exists(db_path):
+        return 0, 0
+    left = [(when, uid) for uid, when in events.items() if when is not None]
+    back = [(uid,) for uid, when in events.items() if when is None]
+    async with db_connect(db_path) as db:
+        before = db.total_changes
+        await db.executemany("UPDATE birthdays SET departed_at = ? WHERE user_id = ? AND departed_at IS NULL", left)
+        archived = db.total_changes - before
+        await db.executemany("UPDATE birthdays SET departed_at = NULL WHERE user_id = ? AND departed_at IS NOT NULL", back)
+        restored = db.total_changes - before - archived
+        await db.commit()
+    _count("birthdays", "archived", archived)
+    _count("birthdays", "restored", restored)
+    return archived, restored
+
+# --- Compaction ---
+
+async def reconcile(guild) -> tuple:
+    """Archives stored users who are no longer members and restores those who came back."""
+    async with db_connect(get_db_path(guild.id)) as db:
+        async with db.execute("SELECT user_id, departed_at IS NOT NULL FROM birthdays") as cursor:
+            rows = await cursor.fetchall()
+
+    archived, restored = [], []
+    for i in range(0, len(rows), QUERY_BATCH):
+        batch = rows[i:i + QUERY_BATCH]
+        try:
+            members = await resolve_members(guild, [uid for uid, _ in batch], strict=True)
+        except asyncio.TimeoutError:
+            continue # Unknown is not "left": this batch waits for the next pass
+        for uid, is_archived in batch:
+            if uid in members and is_archived:
+                restored.append((uid,))
+            elif uid not in members and not is_archived:
+                archived.append((time.time(), uid))
+        if not guild.chunked and i + QUERY_BATCH < len(rows):
+            await asyncio.sleep(RECONCILE_PAUSE)
+
+    if archived or restored:
+        async with db_connect(get_db_path(guild.id)) as db:
+            await db.executemany("UPDATE birthdays SET departed_at = ? WHERE user_id = ? AND departed_at IS NULL", archived)
+            await db.executemany("UPDATE birthdays SET departed_at = NULL WHERE user_id = ?", restored)
+            await db.commit()
+    _count("birthdays", "archived", len(archived))
+    _count("birthdays", "restored", len(restored))
+    return len(archived), len(restored)
+
+async def _delete_batched(db, table, where, params, batch, key="rowid") -> int:
+    """DELETE ... WHERE `where` in transactions of at most `batch` rows. Returns the rows deleted."""
+    total = 0
+    while True:
+        cursor = await db.execute(f"DELETE FROM {table} WHERE ({key}) IN (SELECT {key} FROM {table} WHERE {where} LIMIT ?)", (*params, batch))
+        await db.commit()
+        total += cursor.rowcount
+        if cursor.rowcount < batch:
+            break
+        await asyncio.sleep(BATCH_PAUSE)
+    _count(table, "deleted", total)
+    return total
+
+async def _convert_to_incremental(db) -> bool:
+    """Switches a file created without incremental auto_vacuum (one full VACUUM). True if it did."""
+    async with db.execute("PRAGMA auto_vacuum") as cursor:
+        if (await cursor.fetchone())[0] == 2:
+            return False
+    await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    await db.execute("VACUUM")
+    return True
+
+async def _incremental_vacuum(db) -> int:
+    """Gives free pages back in small steps. Returns how many (0 if auto_vacuum is not incremental)."""
+    async with db.execute("PRAGMA auto_vacuum") as cursor:
+        if (await cursor.fetchone())[0] != 2:
+            return 0
+    async with db.execute("PRAGMA freelist_count") as cursor:
+        (initial,) = await cursor.fetchone()
+    free = initial
+    while free:
+        # executescript steps the pragma to the end (execute() would free a single page)
+        await db.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES_PER_STEP});")
+        async with db.execute("PRAGMA freelist_count") as cursor:
+            (left,) = await cursor.fetchone()
+        if left >= free:
+            break
+        free = left
+        await asyncio.sleep(BATCH_PAUSE)
+    return initial - free
+
+_locks = {}
+
+async def compact_guild(guild) -> dict:
+    """One retention pass over the guild DB. Returns what it did (see the keys below)."""
+    lock = _locks.setdefault(guild.id, asyncio.Lock())
+    async with lock:
+        db_path = get_db_path(guild.id)
+        if not os.path.exists(db_path):
+            return None
+        conf = get_guild_config(guild.id) or {}
+        _, batch = retention_settings()
+        started = time.perf_counter()
+        summary = {'archived': 0, 'restored': 0, 'birthdays': 0, 'letters': 0, 'ticket_sla': 0, 'pages': 0, 'converted': False}
+
+        archived, restored = await flush_member_events(guild.id)
+        reconciled = await reconcile(guild)
+        summary['archived'], summary['restored'] = archived + reconciled[0], restored + reconciled[1]
+
+        now = time.time()
+        async with db_connect(db_path) as db:
+            if conf.get('retention_departed_days'):
+                cutoff = now - conf['retention_departed_days'] * 86400
+                summary['birthdays'] = await _delete_batched(db, "birthdays", "departed_at < ?", (cutoff,), batch)
+            if conf.get('retention_letters_days'):
+                cutoff = datetime.datetime.now() - datetime.timedelta(days=conf['retention_letters_days'])
+                summary['letters'] = await _delete_batched(db, "letters", "timestamp < ?", (cutoff.isoformat(" "),), batch)
+            if conf.get('retention_sla_days'):
+                cutoff = int(now // 86400) - conf['retention_sla_days']
+                summary['ticket_sla'] = await _delete_batched(db, "ticket_sla", "day < ?", (cutoff,), batch, key=SLA_KEY)
+            if await _convert_to_incremental(db):
+                summary['converted'] = True # The VACUUM already gave every free page back
+            else:
+                summary['pages'] = await _incremental_vacuum(db)
+
+        summary['seconds'] = time.perf_counter() - started
+        return summary
+
+def describe(summary: dict) -> str:
+    freed = "auto_vacuum incremental activado (VACUUM completo)" if summary.get('converted') else f"{summary['pages']} páginas liberadas"
+    return (f"{summary['archived']} archivados, {summary['restored']} restaurados • eliminados: "
+            f"{summary['birthdays']} cumpleaños, {summary['letters']} cartas, {summary['ticket_sla']} filas SLA • "
+            f"{freed} en {summary['seconds']:.1f}s")
@@ -0,0 +1,108 @@
+import math
+import time
+from utils_db import get_db_path, connect as db_connect
+from utils_metrics import REGISTRY
+
+# Lifecycle metrics recorded per ticket (seconds since the ticket was opened)
+SLA_METRICS = ('first_reply', 'claim', 'close')
+SLA_LABELS = {'first_reply': "Primera respuesta", 'claim': "Reclamo", 'close': "Cierre"}
+
+# Log-scale buckets: 30s * 1.5^i, up to ~3 weeks. Percentiles are interpolated inside a bucket (±25%).
+BUCKET_BASE = 30
+BUCKET_FACTOR = 1.5
+BUCKET_COUNT = 28
+BUCKET_BOUNDS = [BUCKET_BASE * BUCKET_FACTOR ** i for i in range(BUCKET_COUNT)]
+
+ALL_STAFF = 0 # staff_id used for the guild-wide aggregate
+
+def bucket_index(seconds: float) -> int:
+    if seconds <= BUCKET_BASE:
+        return 0
+    return min(BUCKET_COUNT, int(math.ceil(math.log(seconds / BUCKET_BASE, BUCKET_FACTOR))))
+
+def bucket_range(index: int):
+    lower = 0 if index == 0 else BUCKET_BOUNDS[index - 1]
+    upper = BUCKET_BOUNDS[index] if index < BUCKET_COUNT else lower * BUCKET_FACTOR
+    return lower, upper
+
+def percentile(histogram: dict, q: float):
+    """`histogram` maps bucket index -> count. Returns the interpolated q-quantile in seconds."""
+    total = sum(histogram.values())
+    if not total:
+        return None
+    target = q * total
+    seen = 0
+    for index in sorted(histogram):
+        count = histogram[index]
+        if seen + count >= target:
+            lower, upper = bucket_range(index)
+            return lower + (upper - lower) * ((target - seen) / count)
+        seen += count
+    return bucket_range(max(histogram))[1]
+
+async def record(guild_id: int, metric: str, ticket_type: str, staff_id: int, seconds: float, when: float = None):
+    """Adds one observation to the guild aggregate and to the per-staff aggregate."""
+    seconds = max(0.0, seconds)
+    day = int((when or time.time()) // 86400)
+    bucket = bucket_index(seconds)
+    rows = [(day, metric, ticket_type, ALL_STAFF, bucket)]
+    if staff_id:
+        rows.append((day, metric, ticket_type, staff_id, bucket))
+
+    async with db_connect(get_db_path(guild_id)) as db:
+        await db.executemany("""
+            INSERT INTO ticket_sla (day, metric, ticket_type, staff_id, bucket, count)
+            VALUES (?, ?, ?, ?, ?, 1)
+            ON CONFLICT(day, metric, ticket_type, staff_id, bucket) DO UPDATE SET count = count + 1
+        """, rows)
+        await db.commit()
+
+    REGISTRY.histogram(
+        "ticket_sla_seconds", BUCKET_BOUNDS,
+        {'guild': str(guild_id), 'type': ticket_type, 'metric': metric},
+        help_text="Ticket lifecycle latency since open"
+    ).observe(seconds)
+
+async def summarize(guild_id: int, days: int, ticket_type: str = None, staff_id: int = ALL_STAFF):
+    """Returns {metric: {'count', 'p50', 'p90', 'p99'}} for the last `days` days, read from the aggregates only."""
+    since = int(time.time() // 86400) - days + 1
+    query = "SELECT metric, bucket, SUM(count) FROM ticket_sla WHERE day >= ? AND staff_id = ?"
+    params = [since, staff_id]
+    if ticket_type:
+        query += " AND ticket_type = ?"
+        params.append(ticket_type)
+    query += " GROUP BY metric, bucket"
+
+    async with db_connect(get_db_path(guild_id)) as db:
+        async with db.execute(query, tuple(params)) as cursor:
+            rows = await cursor.fetchall()
+
+    histograms = {}
+    for metric, bucket, count in rows:
+        histograms.setdefault(metric, {})[bucket] = count
+
+    summary = {}
+    for metric in SLA_METRICS:
+        hist = histograms.get(metric, {})
+        summary[metric] = {
+            'count': sum(hist.values()),
+            'p50': percentile(hist, 0.50),
+            'p90': percentile(hist, 0.90),
+            'p99': percentile(hist, 0.99),
+        }
+    return summary
+
+def format_duration(seconds) -> str:
+    if seconds is None:
+        return "N/A"
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    minutes, _ = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    if days:
+        return f"{days}d {hours}h"
+    if hours:
+        return f"{hours}h {minutes}m"
+    return f"{minutes}m"